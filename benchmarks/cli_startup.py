@@ -0,0 +1,61 @@
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import List
+
+"""
+    Summary
+    -------
+    Measures the startup time of the command-line interface.
+    Every command is started as a new process several times and the wall-clock times are reported, together with the
+    startup time of the bare interpreter. The first run of every command is discarded, since it compiles the byte code
+    and warms the file system cache. Exits with status 1 if the median time of "--help" exceeds the target.
+"""
+
+test_bed_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# the arguments of cmd.py
+commands = [
+    ['--help'],
+    ['analyze', '--help'],
+    ['export', '--help'],
+    ['export', '--tools', 'unknown-tool'],
+]
+
+
+def measure(args: List[str], runs: int) -> List[float]:
+    """Returns the wall-clock times of running the interpreter with the arguments in secs."""
+    times = []
+    for _ in range(runs + 1):
+        start = time.perf_counter()
+        subprocess.run([sys.executable] + args, cwd=test_bed_path, stdout=subprocess.DEVNULL,
+                       stderr=subprocess.DEVNULL)
+        times.append(time.perf_counter() - start)
+    return times[1:]
+
+
+def main():
+    parser = argparse.ArgumentParser('cli_startup.py')
+    parser.add_argument('-n', '--runs', type=int, default=20, help='The number of runs per command. Default: 20')
+    parser.add_argument('--target_ms', type=float, default=100,
+                        help='The target for the median time of "--help" in ms. Default: 100')
+    args = parser.parse_args()
+
+    print(f'{"command":<40} {"median":>10} {"min":>10} {"max":>10}')
+    medians = {}
+    for label, interpreter_args in [('python -c pass', ['-c', 'pass'])] + \
+                                   [(' '.join(['cmd.py'] + command), ['cmd.py'] + command) for command in commands]:
+        times = measure(interpreter_args, args.runs)
+        medians[label] = statistics.median(times)
+        print(f'{label:<40} {medians[label] * 1000:>8.1f}ms {min(times) * 1000:>8.1f}ms {max(times) * 1000:>8.1f}ms')
+    help_median = medians['cmd.py --help'] * 1000
+    if help_median > args.target_ms:
+        print(f'"--help" takes {help_median:.1f}ms, which exceeds the target of {args.target_ms:.0f}ms.')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,23 +1,14 @@
 import argparse
-import csv
-import json
 import os.path
-import shutil
-import time
+import re
 from datetime import datetime
-from typing import Dict
-
-from tabulate import tabulate
-
-import toolbox
-from logic.orm import *
-from logic.test_runner import TestRun
 
 """
     Summary
     -------
     This module allows users to use the testbed with the command-line.
-
+    The modules of the testbed are imported by the sub-commands which need them, so that the database is neither
+    opened nor migrated before the arguments have been parsed, e.g. for "--help".
 """
 
 if __name__ == '__main__':
@@ -33,6 +24,8 @@ if __name__ == '__main__':
 
 
     def contract_file_type(path):
+        from logic.orm import Contract
+
         return file_type_checker(path, Contract.file_extensions)
 
 
@@ -48,6 +41,17 @@ if __name__ == '__main__':
         return file_type_checker(path, ['csv'])
 
 
+    def pool_type(value):
+        match = re.fullmatch(r'(\w+)=(\d+)(?::(\d+))?', value)
+        if not match:
+            raise argparse.ArgumentTypeError(f'{value} must have the format TOOL=SIZE or TOOL=SIZE:MAX_JOBS')
+        tool_name, size, max_jobs = match.groups()
+        settings = {'size': int(size)}
+        if max_jobs:
+            settings['max_jobs'] = int(max_jobs)
+        return tool_name, settings
+
+
     def validate_dir(dir_path):
         if not os.path.isdir(dir_path):
             raise argparse.ArgumentTypeError(f'{dir_path} is not a directory')
@@ -56,48 +60,22 @@ if __name__ == '__main__':
         return os.path.abspath(dir_path)
 
 
-    def import_security_issues_or_errors(file, tool_name, add_security_issues, sess):
-        """
+    def check_tool_names(names):
+        """Exits with a usage error if a tool is not installed. Returns the names of all installed tools.
 
-        Parameters
-        ----------
-        file The CSV file containing the security issues and the regex patterns with which they can be identified from the tool's output.
-        tool_name The name of the tool.
-        add_security_issues True - if security issues are added. False - if errors are added.
-        sess The database session.
+        The names are checked after parsing instead of by "choices", which would read the database on every call.
+        """
+        from logic import catalog
 
-        Returns
-        -------
+        installed = catalog.get().get_tool_names()
+        unknown = [name for name in names if name not in installed]
+        if unknown:
+            parser.error(f'unknown tools: {", ".join(unknown)} (choose from {", ".join(installed)})')
+        return installed
 
-        """
-        with open(file, encoding='utf-8') as f:
-            reader = csv.reader(f)
-            for row in reader:
-                title = row[0]
-                identifier = row[1]
-                if not identifier:
-                    identifier = ''
-                if add_security_issues and not sess.query(ToolSecurityIssue) \
-                        .filter(ToolSecurityIssue.tool_name == tool_name,
-                                ToolSecurityIssue.security_issue_title == title,
-                                ToolSecurityIssue.identifier == identifier).first():
-                    if not sess.query(SecurityIssue).filter(SecurityIssue.title == title).first():
-                        raise argparse.ArgumentTypeError(
-                            f'The security issue "{title}" must be added to the "security_issues" table first.')
-                    obj = ToolSecurityIssue(tool_name=tool_name, security_issue_title=title, identifier=identifier)
-                    sess.add(obj)
-                elif not sess.query(ToolError) \
-                        .filter(ToolError.tool_name == tool_name, ToolError.error_title == title,
-                                ToolError.identifier == identifier).first():
-                    if not sess.query(Error).filter(Error.title == title).first():
-                        raise argparse.ArgumentTypeError(
-                            f'The error "{title}" must be added to the "errors" table first.')
-                    obj = ToolError(tool_name=tool_name, error_title=title, identifier=identifier)
-                    sess.add(obj)
 
     # add the parameters for the command line tool
     parser = argparse.ArgumentParser('testbed.sh')
-    tool_names = [tool.name for tool in get_tools()]
     subparsers = parser.add_subparsers(dest='sub_command')
 
     parser_analyze = subparsers.add_parser('analyze', help='Analyze a smart contract.')
@@ -105,24 +83,93 @@ if __name__ == '__main__':
                                 help='Path to the file containing the smart contract.')
     parser_analyze.add_argument('-n', '--contract_name',
                                 help='The name of the contract to be analyzed. Defaults to the first contract in the file.')
-    parser_analyze.add_argument('-t', '--tools', action='extend', nargs='+', choices=tool_names,
+    parser_analyze.add_argument('-t', '--tools', action='extend', nargs='+', metavar='TOOL',
                                 help='The smart contract analyzing tools the testbed should use. Default are all tools. To choose several tools, use " " as a separator.')
     parser_analyze.add_argument('-o', '--output', type=validate_dir, default='.',
                                 help='The directory to store the results.')
+    parser_analyze.add_argument('-w', '--workers', type=int, default=os.cpu_count(),
+                                help='The number of tools which may run at the same time. Further tools are queued. '
+                                     'Default: the number of CPU cores')
+    parser_analyze.add_argument('--memory', type=int, metavar='MB',
+                                help='The memory in MB the running tools may use together. A tool only starts if '
+                                     'the memory its adapter expects it to need is free. Default: unlimited')
+    parser_analyze.add_argument('--no_cache', action='store_true',
+                                help='Run every tool even if the result cache contains a result of an identical run.')
+    parser_analyze.add_argument('--all_contracts', action='store_true',
+                                help='Analyze every contract of a solidity file. Tools analyzing whole files run once '
+                                     'for the file, the other tools once per contract.')
+    parser_analyze.add_argument('--compile_once', action='store_true',
+                                help='Compile a solidity contract once with the minimal allowed compiler and let the '
+                                     'bytecode compatible tools test its runtime bytecode instead of compiling it '
+                                     'themselves.')
+
+    parser_batch = subparsers.add_parser('analyze-batch', help='Analyze many smart contracts in one process.')
+    parser_batch.add_argument('source',
+                              help='A directory which is searched recursively for contract files, a glob pattern '
+                                   '(quote it to prevent the shell from expanding it) or a JSONL manifest with one '
+                                   '{"path": ..., "name": ...} object per line. "name" is optional.')
+    parser_batch.add_argument('-t', '--tools', action='extend', nargs='+', metavar='TOOL',
+                              help='The smart contract analyzing tools the testbed should use. Default are all tools.')
+    parser_batch.add_argument('-o', '--output', default='results.jsonl',
+                              help='The file receiving the results of the contracts as soon as they are available. '
+                                   'Written as CSV if the file ends with ".csv", otherwise as JSONL. '
+                                   'Default: results.jsonl')
+    parser_batch.add_argument('-w', '--workers', type=int, default=os.cpu_count(),
+                              help='The number of tools which may run at the same time. '
+                                   'Default: the number of CPU cores')
+    parser_batch.add_argument('--timeout', type=int, default=30 * 60,
+                              help='The timeout of every tool in secs. Default: 1800')
+    parser_batch.add_argument('--memory', type=int, metavar='MB',
+                              help='The memory in MB the running tools may use together. A tool only starts if '
+                                   'the memory its adapter expects it to need is free. Default: unlimited')
+    parser_batch.add_argument('--no_cache', action='store_true',
+                              help='Run every tool even if the result cache contains a result of an identical run.')
+    parser_batch.add_argument('--compile_once', action='store_true',
+                              help='Compile a solidity contract once with the minimal allowed compiler and let the '
+                                   'bytecode compatible tools test its runtime bytecode instead of compiling it '
+                                   'themselves.')
+    parser_batch.add_argument('--pool', type=pool_type, action='append', default=[], metavar='TOOL=SIZE[:MAX_JOBS]',
+                              help='Keep SIZE pre-started containers of the tool and dispatch its analyses into them '
+                                   'instead of starting a container per analysis. A container is replaced after '
+                                   'MAX_JOBS analyses (default: 50). Can be given several times.')
 
     parser_server = subparsers.add_parser('server', help='Start the server.')
     parser_server.add_argument('-t', '--timeout', help='Set the timeout of a test-run in secs.. Default: 10s', type=int,
                                default=30 * 60)
     parser_server.add_argument('-a', '--active_test_runs',
-                               help='Limit the number of active test-runs on the server. Default: 10', type=int,
-                               default=10)
+                               help='Limit the number of queued or running test-runs on the server. Default: 10',
+                               type=int, default=10)
+    parser_server.add_argument('-w', '--workers', type=int, default=os.cpu_count(),
+                               help='The number of tools which may run at the same time. Further tools are queued. '
+                                    'Default: the number of CPU cores')
+    parser_server.add_argument('--memory', type=int, metavar='MB',
+                               help='The memory in MB the running tools may use together. A tool only starts if '
+                                    'the memory its adapter expects it to need is free. Default: unlimited')
+    parser_server.add_argument('--no_cache', action='store_true',
+                               help='Run every tool even if the result cache contains a result of an identical run.')
+    parser_server.add_argument('--compile_once', action='store_true',
+                               help='Compile a solidity contract once with the minimal allowed compiler and let the '
+                                    'bytecode compatible tools test its runtime bytecode instead of compiling it '
+                                    'themselves.')
+    parser_server.add_argument('--abandon_after', type=int, metavar='SECS',
+                               help='Cancel running test-runs whose results have not been requested for SECS seconds. '
+                                    'Default: never')
+    parser_server.add_argument('--plain_reports', action='store_true',
+                               help='Store the reports of the test-runs uncompressed instead of gzip-compressed.')
+    parser_server.add_argument('--x_sendfile', action='store_true',
+                               help='Let the web server in front of the testbed send the report files '
+                                    '("X-Sendfile" header).')
+    parser_server.add_argument('--pool', type=pool_type, action='append', default=[], metavar='TOOL=SIZE[:MAX_JOBS]',
+                               help='Keep SIZE pre-started containers of the tool and dispatch its analyses into them '
+                                    'instead of starting a container per analysis. A container is replaced after '
+                                    'MAX_JOBS analyses (default: 50). Can be given several times.')
     parser_server.add_argument('-p', '--port', help='The port on which the webserver should listen to.', type=int,
                                default=5000)
 
     parser_update = subparsers.add_parser('update', help='Install a new tool or update an old one.')
     parser_update.add_argument('name', help='The name of the tool.')
     parser_update.add_argument('-s', '--script', type=py_file_type,
-                               help='The path to the script with the "get_tool_test_run" function. '
+                               help='The path to the script with the "create_tool_test_run" function. '
                                     'This function must return the subclass which interacts with the tool.'
                                     ' Required when adding a new tool.')
     parser_update.add_argument('-l', '--link', help='The link to the tool\'s homepage.')
@@ -137,6 +184,9 @@ if __name__ == '__main__':
                                     '   Must be one of the installed compilers in "resources/solc-versions". '
                                     'Leave empty if the tool does not have a preferred version.',
                                default='')
+    parser_update.add_argument('--max_output_size', type=float, metavar='MB',
+                               help='The maximal size of the output of a command of the tool in MB. Larger outputs '
+                                    'are truncated to their head and tail. Use 0 to restore the default.')
     parser_update.add_argument('-i', '--tool_security_issues', type=csv_file_type,
                                help='A CSV-file with the security issues a tool looks for. Can only be called when '
                                     'the testbed already knows the tool. To tell the testbed about the tool, '
@@ -147,67 +197,187 @@ if __name__ == '__main__':
     parser_update.add_argument('-e', '--tool_errors', type=csv_file_type,
                                help='Similar to --tool_security_issue, only that the CSV-File should contain the errors the tool might encounter'
                                     ' during the testing process.')
+    parser_update.add_argument('--replace', action='store_true',
+                               help='Delete the identifiers of the tool which are not in the imported CSV-files, so '
+                                    'that the tool gets exactly the identifiers of the files.')
+
+    parser_export = subparsers.add_parser('export', help='Export the identifiers of the security issues and errors of '
+                                                         'tools as CSV-files, which can be imported with "update".')
+    parser_export.add_argument('-t', '--tools', nargs='+', metavar='TOOL',
+                               help='The tools to export. Defaults to all tools.')
+    parser_export.add_argument('-o', '--output', type=validate_dir, default='.',
+                               help='The directory the files <tool>_security_issues.csv and <tool>_errors.csv are '
+                                    'written to. Defaults to the current directory.')
 
     parser_remove = subparsers.add_parser('remove', help='Remove an embedded tool.')
-    parser_remove.add_argument('tool', choices=tool_names, help='The tool to remove.')
+    parser_remove.add_argument('tool', help='The tool to remove.')
 
     # get the requested subparser and process the given command accordingly
     args = parser.parse_args()
     attributes = vars(args)
     if args.sub_command == 'analyze':
+        from concurrent import futures
+        from typing import Dict
+
+        from tabulate import tabulate
+
+        import toolbox
+        from logic import compilation_cache, containers, result_cache
+        from logic.orm import Contract, SolidityContract, SecurityIssue, Tool, get_tools, tools_to_tool_names
+        from logic.scheduler import configure as configure_scheduler
+        from logic.test_runner import TestRun
+
+        check_tool_names(args.tools or [])
         if not args.tools:
             tools = get_tools()
         else:
             tools = get_tools(args.tools)
+        if args.all_contracts and os.path.splitext(args.contract_path)[1] not in SolidityContract.file_extensions:
+            parser.error('--all_contracts requires a solidity file.')
         if not args.contract_name:
             args.contract_name=os.path.splitext(os.path.basename(args.contract_path))[0]
         output = f'{os.path.abspath(args.output)}/{args.contract_name}-{datetime.now().strftime("%Y-%m-%d_%H-%M-%S")}'
         os.mkdir(output)
-        if os.path.splitext(args.contract_path)[1] in SolidityContract.file_extensions:
-            contract = SolidityContract(path=args.contract_path, name=args.contract_name)
+        configure_scheduler(args.workers, args.memory)
+        result_cache.configure(enable=not args.no_cache)
+        containers.start_reaper()
+        if args.all_contracts:
+            from logic.file_run import FileRun
+
+            file_run = FileRun(args.contract_path, tools, compile_once=args.compile_once)
+            print(f'Analyzing the contracts {", ".join(file_run.contract_names)}.')
+            file_run.run()
+            pending = file_run.get_futures()
+            while pending:
+                try:
+                    done, _ = futures.wait(pending, timeout=60, return_when=futures.FIRST_COMPLETED)
+                except KeyboardInterrupt:
+                    print('Cancelling the test-runs. Press Ctrl-C again to exit at once.')
+                    file_run.cancel()
+                    continue
+                if not done:
+                    still_running = ",".join(sorted(f'{tool.name}({contract_name or "file"})'
+                                                    for contract_name, tool in pending.values()))
+                    print(f'Checking for tools to finish. Still running: {still_running}')
+                for future in done:
+                    contract_name, tool = pending.pop(future)
+                    if future.exception():
+                        print(f'Tool {tool.name} failed for {contract_name or "the file"}: {future.exception()}\n')
+                        continue
+                    tool_test_run = file_run.get_tool_test_run(contract_name, tool)
+                    report_file = f'{output}/{contract_name or "file"}_{tool.name}.txt'
+                    tool_test_run.save_report(report_file)
+                    print(f'Tool {tool.name} has terminated for {contract_name or "the file"} in '
+                          f'{toolbox.timedelta_to_string(tool_test_run.get_execution_time())}.\n'
+                          f'The report-file can be seen here: {report_file}\n')
+
+            table = []
+            for contract_name, issue_statuses in file_run.get_security_issues_statuses().items():
+                for issue, tool_statuses in issue_statuses.items():
+                    table += [[contract_name, issue.title] + [tool_statuses[tool] for tool in tools]]
+            tab = tabulate(table, ['Contract', 'Security Issues'] + tools_to_tool_names(tools))
+            print(tab)
+            summary_path = f'{output}/summary.txt'
+            with open(summary_path, 'w', encoding='utf-8') as f:
+                f.write(tab)
+            print(f'Testing {args.contract_path} has terminated.')
         else:
-            contract = Contract(path=args.contract_path)
-        test_run = TestRun(contract, tools)
-        test_run.run()
-        terminated_tools_last_poll = set()
-        terminated_tools = set()
-        duration = 0
-        while len(terminated_tools) != len(tools) or duration == 0:
-            terminated_tools = set(test_run.get_terminated_tools())
-            if duration % 60 == 1:
-                print(
-                    f'Checking for tools to finish. Still running: {",".join([tool.name for tool in sorted(set(tools) - terminated_tools, key=lambda t: t.name)])}')
-            time.sleep(1)
-            duration += 1
-            recently_terminated_tools = terminated_tools - terminated_tools_last_poll
-            terminated_tools_last_poll = terminated_tools
-            for tool in recently_terminated_tools:
-                tool_test_run = test_run.get_tool_test_run(tool)
+            if os.path.splitext(args.contract_path)[1] in SolidityContract.file_extensions:
+                contract = SolidityContract(path=args.contract_path, name=args.contract_name)
+            else:
+                contract = Contract(path=args.contract_path)
+            test_run = TestRun(contract, tools, compile_once=args.compile_once)
+            test_run.run()
+            pending = set(tools)
+
+            def on_finished(finished):
+                if finished is None:
+                    still_running = ",".join(sorted(tool.name for tool in pending))
+                    print(f'Checking for tools to finish. Still running: {still_running}')
+                    return
+                tool, tool_test_run = finished
+                if tool not in pending:
+                    return
+                pending.discard(tool)
+                if tool_test_run.get_future().exception():
+                    print(f'Tool {tool.name} failed: {tool_test_run.get_future().exception()}\n')
+                    return
                 report_file = f'{output}/{tool.name}.txt'
-                shutil.copyfile(tool_test_run.get_report(), report_file)
+                tool_test_run.save_report(report_file)
                 print(
                     f'Tool {tool.name} has terminated in {toolbox.timedelta_to_string(tool_test_run.get_execution_time())}.\n'
                     f'The report-file can be seen here: {report_file}\n')
 
-        table_dicts: Dict[SecurityIssue, Dict[Tool, str]] = test_run.get_security_issues_statuses()
-        table = []
-        headers = ['Security Issues']
-        done = False
-        for issue, tool_status_dict in table_dicts.items():
-            table += [[issue.title] + list(iter(tool_status_dict.values()))]
-            if not done:
-                headers += tools_to_tool_names(iter(tool_status_dict.keys()))
-                done = True
-        tab = tabulate(table, headers)
-        print(tab)
-        summary_path = f'{output}/summary.txt'
-        with open(summary_path, 'w', encoding='utf-8') as f:
-            f.write(tab)
-        print(f'Testing {contract.path} has terminated.')
-
+            try:
+                for finished in test_run.as_completed(heartbeat=60):
+                    on_finished(finished)
+            except KeyboardInterrupt:
+                print('Cancelling the test-run. Press Ctrl-C again to exit at once.')
+                test_run.cancel()
+                for finished in test_run.as_completed(heartbeat=60):
+                    on_finished(finished)
+
+            table_dicts: Dict[SecurityIssue, Dict[Tool, str]] = test_run.get_security_issues_statuses()
+            table = []
+            headers = ['Security Issues']
+            done = False
+            for issue, tool_status_dict in table_dicts.items():
+                table += [[issue.title] + list(iter(tool_status_dict.values()))]
+                if not done:
+                    headers += tools_to_tool_names(iter(tool_status_dict.keys()))
+                    done = True
+            tab = tabulate(table, headers)
+            print(tab)
+            summary_path = f'{output}/summary.txt'
+            with open(summary_path, 'w', encoding='utf-8') as f:
+                f.write(tab)
+            print(f'Testing {contract.path} has terminated.')
+        print(compilation_cache.format_stats())
+
+
+    elif args.sub_command == 'analyze-batch':
+        import atexit
+
+        from logic import compilation_cache, container_pool, containers, result_cache
+        from logic.batch import BatchRun, collect_contracts, create_sink
+        from logic.orm import get_tools
+        from logic.scheduler import configure as configure_scheduler
+
+        check_tool_names(args.tools or [])
+        tools = get_tools(args.tools) if args.tools else get_tools()
+        if not tools:
+            parser.error('no tools installed')
+        contracts = collect_contracts(args.source)
+        print(f'Found {len(contracts)} contracts.')
+        scheduler = configure_scheduler(args.workers, args.memory)
+        result_cache.configure(enable=not args.no_cache)
+        container_pool.configure(dict(args.pool))
+        atexit.register(container_pool.shutdown)
+        containers.start_reaper()
+        sink = create_sink(args.output)
+        try:
+            # keep enough test-runs in flight to occupy every execution slot twice
+            max_in_flight = -(-2 * scheduler.slots // len(tools))
+            BatchRun(contracts, tools, sink, max_in_flight, timeout=args.timeout,
+                     compile_once=args.compile_once).run()
+        except KeyboardInterrupt:
+            print('Interrupted. Killing the containers of the batch.')
+            containers.kill_own()
+            raise
+        finally:
+            sink.close()
+        print(compilation_cache.format_stats())
+        print(f'The results can be seen here: {os.path.abspath(args.output)}')
 
     elif args.sub_command == 'server':
-        server_config = {'allowed_active_test_runs': args.active_test_runs, 'timeout': args.timeout}
+        import json
+
+        server_config = {'allowed_active_test_runs': args.active_test_runs, 'timeout': args.timeout,
+                         'execution_slots': args.workers, 'execution_memory_mb': args.memory,
+                         'result_cache': not args.no_cache,
+                         'container_pools': dict(args.pool), 'compile_once': args.compile_once,
+                         'compress_reports': not args.plain_reports, 'x_sendfile': args.x_sendfile,
+                         'abandon_after': args.abandon_after}
         with open('server/config.json', 'w', encoding='utf-8') as f:
             f.write(json.dumps(server_config))
         from server.web_pages import app
@@ -215,6 +385,9 @@ if __name__ == '__main__':
         app.run(host='0.0.0.0', debug=True, port=args.port)
 
     elif args.sub_command == 'update':
+        from logic import patterns
+        from logic.orm import Tool, get_db_session
+
         sess = get_db_session()
         sess.commit()
         tool = sess.query(Tool).filter(Tool.name == args.name).first()
@@ -232,25 +405,47 @@ if __name__ == '__main__':
             tool.link = args.link
         tool.analyses_whole_file = args.analyses_all_contracts
         tool.bytecode_compatible = args.bytecode
+        if args.max_output_size is not None:
+            tool.max_output_size = int(args.max_output_size * 1024 ** 2) or None
         if added:
             sess.add(tool)
         sess.commit()
         if args.solidity:
             tool.solc_version = args.solidity
-        if hasattr(args, 'tool_security_issues') and args.tool_security_issues:
-            import_security_issues_or_errors(args.tool_security_issues, tool.name, True, sess)
-            sess.commit()
-            print(f'Successfully imported {args.tool_security_issues}.')
-        if hasattr(args, 'tool_errors') and args.tool_errors:
-            import_security_issues_or_errors(args.tool_errors, tool.name, False, sess)
-            sess.commit()
-            print(f'Successfully imported {args.tool_errors}.')
+        # both files are imported in one transaction, so that a rejected file leaves the identifiers unchanged
+        imported = []
+        try:
+            for file, security_issues in ((args.tool_security_issues, True), (args.tool_errors, False)):
+                if file:
+                    imported.append((file, patterns.import_csv(file, tool.name, security_issues, sess, args.replace)))
+        except ValueError as e:
+            sess.rollback()
+            parser.error(str(e))
+        sess.commit()
+        for file, diff in imported:
+            print(f'Successfully imported {file}: {diff}')
         if added:
             print(f'Successfully added {tool}.')
         else:
             print(f'Successfully updated {tool}')
 
+    elif args.sub_command == 'export':
+        from logic import patterns
+        from logic.orm import get_db_session
+
+        tool_names = check_tool_names(args.tools or [])
+        sess = get_db_session()
+        for tool_name in args.tools or tool_names:
+            for security_issues, kind in ((True, 'security_issues'), (False, 'errors')):
+                path = f'{args.output}/{tool_name}_{kind}.csv'
+                with open(path, 'w', encoding='utf-8', newline='') as f:
+                    count = patterns.export_patterns(tool_name, security_issues, f, sess)
+                print(f'Exported {count} identifiers to {path}.')
+
     elif args.sub_command == 'remove':
+        from logic.orm import Tool, get_db_session
+
+        check_tool_names([args.tool])
         sess = get_db_session()
         sess.query(Tool).filter(Tool.name == args.tool).delete()
         sess.commit()
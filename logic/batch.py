@@ -0,0 +1,229 @@
+import csv
+import glob
+import json
+import os
+import queue
+import time
+from datetime import timedelta
+from threading import Lock
+from typing import List, Tuple, Optional, Dict
+
+from logic.orm import Tool, Contract, SolidityContract
+from logic.test_runner import TestRun
+from toolbox import timedelta_to_string
+
+"""
+    Summary
+    -------
+    Analyzes many contracts with one process. The contracts are tested through the process-wide scheduler, so that
+    the number of concurrently running tools stays bounded. The result of every contract is written to a sink as soon
+    as all of its tools have terminated.
+"""
+
+
+def collect_contracts(source: str) -> List[Tuple[str, Optional[str]]]:
+    """Returns the paths and optional contract names of the contracts to analyze.
+
+    Parameters
+    ----------
+    source : str
+        One of
+            - a directory, which is searched recursively for contract files,
+            - a JSONL manifest with one object per line containing "path" and optionally "name". Relative paths are
+              resolved against the directory of the manifest,
+            - a glob pattern. "**" matches any number of directories.
+
+    Returns
+    -------
+    List[Tuple[str, Optional[str]]]
+        The absolute paths and the names of the contracts. The name is None if it should be taken from the file.
+    """
+    extensions = tuple(f'.{extension}' for extension in Contract.file_extensions)
+    if os.path.isdir(source):
+        contracts = []
+        for dir_path, _, filenames in os.walk(source):
+            for filename in sorted(filenames):
+                if filename.endswith(extensions):
+                    contracts.append((os.path.abspath(os.path.join(dir_path, filename)), None))
+        return sorted(contracts)
+    if source.endswith('.jsonl') and os.path.isfile(source):
+        contracts = []
+        manifest_dir = os.path.dirname(os.path.abspath(source))
+        with open(source, encoding='utf-8') as f:
+            for line_number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                if 'path' not in entry:
+                    raise ValueError(f'{source}:{line_number}: the entry has no "path".')
+                contracts.append((os.path.join(manifest_dir, entry['path']), entry.get('name')))
+        return contracts
+    return [(os.path.abspath(path), None) for path in sorted(glob.glob(source, recursive=True))
+            if path.endswith(extensions)]
+
+
+def create_contract(path: str, name: Optional[str] = None) -> Contract:
+    if os.path.splitext(path)[1] in SolidityContract.file_extensions:
+        return SolidityContract(path=path, name=name)
+    return Contract(path=path)
+
+
+class JsonlSink:
+    """Writes one JSON object per contract."""
+
+    def __init__(self, path: str):
+        self._file = open(path, 'w', encoding='utf-8')
+
+    def write(self, result: Dict):
+        self._file.write(json.dumps(result) + '\n')
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class CsvSink:
+    """Writes one row per contract and tool."""
+    header = ['path', 'name', 'tool', 'status', 'execution_time', 'security_issues', 'errors', 'message']
+
+    def __init__(self, path: str):
+        self._file = open(path, 'w', encoding='utf-8', newline='')
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(CsvSink.header)
+
+    def write(self, result: Dict):
+        if not result['tools']:
+            self._writer.writerow([result['path'], result['name'], '', result['status'], '', '', '',
+                                   result.get('message', '')])
+        for tool_name, tool_result in result['tools'].items():
+            self._writer.writerow([result['path'], result['name'], tool_name, tool_result['status'],
+                                   tool_result.get('execution_time', ''),
+                                   ';'.join(tool_result.get('security_issues', [])),
+                                   ';'.join(tool_result.get('errors', [])), tool_result.get('message', '')])
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+def create_sink(path: str):
+    if path.endswith('.csv'):
+        return CsvSink(path)
+    return JsonlSink(path)
+
+
+class BatchRun:
+    """Tests a list of contracts with the same tools.
+
+    Parameters
+    ----------
+    contracts : List[Tuple[str, Optional[str]]]
+        The paths and names of the contracts. See <collect_contracts>.
+    tools : List[Tool]
+    sink : JsonlSink or CsvSink
+        Receives the result of every contract.
+    max_in_flight : int
+        The maximal number of contracts whose test-runs exist at the same time. Bounds the memory and the temporary
+        files of the batch while the scheduler bounds the number of running tools.
+    timeout : int, optional
+        The timeout of every tool in secs.
+    compile_once : bool, default=False
+        See <TestRun>.
+    """
+
+    def __init__(self, contracts: List[Tuple[str, Optional[str]]], tools: List[Tool], sink, max_in_flight: int,
+                 timeout=None, compile_once=False):
+        self._contracts = contracts
+        self._tools = tools
+        self._sink = sink
+        self._max_in_flight = max(1, max_in_flight)
+        self._timeout = timeout
+        self._compile_once = compile_once
+        self._finished: queue.Queue = queue.Queue()
+        self._done = 0
+        self._failed = 0
+        self._start = None
+        self._last_progress = 0
+
+    def run(self, progress_interval: float = 5):
+        self._start = self._last_progress = time.monotonic()
+        pending = iter(self._contracts)
+        in_flight = 0
+        exhausted = False
+        while not exhausted or in_flight:
+            while not exhausted and in_flight < self._max_in_flight:
+                try:
+                    path, name = next(pending)
+                except StopIteration:
+                    exhausted = True
+                    break
+                if self.__start(path, name):
+                    in_flight += 1
+            if in_flight:
+                # wakes up to print the progress while the contracts in flight take long
+                try:
+                    test_run = self._finished.get(timeout=progress_interval)
+                except queue.Empty:
+                    test_run = None
+                if test_run is not None:
+                    in_flight -= 1
+                    self.__write(self.__collect_result(test_run))
+            if time.monotonic() - self._last_progress >= progress_interval:
+                self.print_progress()
+        self.print_progress()
+
+    def __start(self, path: str, name: Optional[str]) -> bool:
+        try:
+            test_run = TestRun(create_contract(path, name), self._tools, self._timeout, self._compile_once)
+            remaining = set(self._tools)
+            lock = Lock()
+
+            def on_tool_done(tool, tool_test_run):
+                with lock:
+                    remaining.discard(tool)
+                    finished = not remaining
+                if finished:
+                    self._finished.put(test_run)
+
+            test_run.add_done_callback(on_tool_done)
+            test_run.run()
+        except Exception as e:
+            self._failed += 1
+            self.__write({'path': path, 'name': name, 'status': 'failed', 'message': str(e), 'tools': {}})
+            return False
+        return True
+
+    def __collect_result(self, test_run: TestRun) -> Dict:
+        contract = test_run._contract
+        result = {'path': contract.path, 'name': getattr(contract, 'name', None), 'status': 'terminated',
+                  'tools': {}}
+        for tool in self._tools:
+            tool_test_run = test_run.get_tool_test_run(tool)
+            exception = tool_test_run.get_future().exception()
+            if exception:
+                result['status'] = 'failed'
+                result['tools'][tool.name] = {'status': 'failed', 'message': str(exception)}
+                continue
+            result['tools'][tool.name] = {
+                'status': 'terminated',
+                'execution_time': tool_test_run.get_execution_time().total_seconds(),
+                'security_issues': [issue.title for issue in tool_test_run.get_security_issues()],
+                'errors': [error.title for error in tool_test_run.get_errors()],
+            }
+        if result['status'] == 'failed':
+            self._failed += 1
+        return result
+
+    def __write(self, result: Dict):
+        self._sink.write(result)
+        self._done += 1
+
+    def print_progress(self):
+        self._last_progress = time.monotonic()
+        elapsed = self._last_progress - self._start
+        total = len(self._contracts)
+        rate = self._done / elapsed if elapsed else 0
+        message = f'{self._done}/{total} contracts ({self._failed} failed), {rate * 60:.1f} contracts/min'
+        if rate and self._done < total:
+            message += f', ETA {timedelta_to_string(timedelta(seconds=(total - self._done) / rate))}'
+        print(message)
@@ -0,0 +1,134 @@
+import time
+from threading import Lock
+from typing import Dict, FrozenSet, Iterable, List, Optional, Union
+
+from sqlalchemy.orm import subqueryload
+
+from logic import matcher
+from logic.orm import Tool, SecurityIssue, Error, ToolError, ToolSecurityIssue, engine, session_factory
+
+"""
+    Summary
+    -------
+    An immutable snapshot of the catalog: the installed tools, the security issues, the errors and the identifiers
+    mapping the output of the tools to them.
+    The catalog only changes when the tools are updated, so the snapshot is loaded once with all relationships and
+    read without locks and without queries afterwards. Every change of a catalog table increments <CatalogVersion> by
+    a trigger. The version is checked at most every <check_interval> secs and a new snapshot replaces the old one as a
+    whole when it has changed. The objects of a snapshot are detached from all database sessions and must not be
+    modified.
+"""
+
+# the minimal number of secs between two checks of the catalog version
+check_interval = 5.0
+
+
+class Catalog:
+    """A snapshot of the catalog at a version.
+
+    Parameters
+    ----------
+    version : int
+        The <CatalogVersion> the snapshot has been loaded at.
+    tools : List[Tool]
+    security_issues : List[SecurityIssue]
+    errors : List[Error]
+    """
+
+    def __init__(self, version: int, tools: List[Tool], security_issues: List[SecurityIssue], errors: List[Error]):
+        self.version = version
+        self._tools: Dict[str, Tool] = {tool.name: tool for tool in sorted(tools, key=lambda t: t.name)}
+        self._security_issues: Dict[str, SecurityIssue] = {issue.title: issue for issue in security_issues}
+        self._errors: Dict[str, Error] = {error.title: error for error in errors}
+        self._checked_security_issues: Dict[str, FrozenSet[str]] = {
+            tool.name: frozenset(tool_security_issue.security_issue_title
+                                 for tool_security_issue in tool.tool_security_issues) for tool in tools}
+        self._checked_errors: Dict[str, FrozenSet[str]] = {
+            tool.name: frozenset(tool_error.error_title for tool_error in tool.tool_errors) for tool in tools}
+        self._matchers: Dict[str, matcher.Matcher] = {}
+
+    def get_tool(self, tool_name: str) -> Tool:
+        """Raises KeyError if the tool is not installed."""
+        return self._tools[tool_name]
+
+    def get_tools(self, tool_names: Union[Iterable[str], str] = 'all') -> List[Tool]:
+        """Returns the tools sorted by name. Names of tools which are not installed are ignored."""
+        if tool_names == 'all':
+            return list(self._tools.values())
+        tool_names = set(tool_names)
+        return [tool for name, tool in self._tools.items() if name in tool_names]
+
+    def get_tool_names(self) -> List[str]:
+        return list(self._tools)
+
+    def get_security_issue(self, title: str) -> Optional[SecurityIssue]:
+        return self._security_issues.get(title)
+
+    def get_error(self, title: str) -> Optional[Error]:
+        return self._errors.get(title)
+
+    def get_checked_security_issues(self, tool_name: str) -> FrozenSet[str]:
+        """Returns the titles of the security issues the tool checks for."""
+        return self._checked_security_issues.get(tool_name, frozenset())
+
+    def get_checked_errors(self, tool_name: str) -> FrozenSet[str]:
+        """Returns the titles of the errors which can be identified in the output of the tool."""
+        return self._checked_errors.get(tool_name, frozenset())
+
+    def get_matcher(self, tool_name: str) -> matcher.Matcher:
+        """Returns the compiled matcher of the tool. See <matcher.get_matcher>."""
+        tool_matcher = self._matchers.get(tool_name)
+        if tool_matcher is None:
+            # compiling twice in a race is harmless
+            tool_matcher = self._matchers.setdefault(tool_name, matcher.get_matcher(self.get_tool(tool_name)))
+        return tool_matcher
+
+
+_snapshot: Optional[Catalog] = None
+_checked_at = 0.0
+_lock = Lock()
+
+
+def get() -> Catalog:
+    """Returns the current snapshot. Loads a new one if the catalog has changed since the last check."""
+    snapshot = _snapshot
+    if snapshot is not None and time.monotonic() - _checked_at < check_interval:
+        return snapshot
+    return _refresh()
+
+
+def invalidate():
+    """Checks the catalog version on the next call of <get>, e.g. after the catalog has been changed."""
+    global _checked_at
+    _checked_at = 0.0
+
+
+def _refresh() -> Catalog:
+    global _snapshot, _checked_at
+    with _lock:
+        if _snapshot is not None and time.monotonic() - _checked_at < check_interval:
+            return _snapshot
+        # the version is read first, so that a change during the load only causes another load on the next check
+        version = _read_version()
+        if _snapshot is None or _snapshot.version != version:
+            _snapshot = _load(version)
+        _checked_at = time.monotonic()
+        return _snapshot
+
+
+def _read_version() -> int:
+    with engine.connect() as connection:
+        return connection.execute('SELECT version FROM catalog_version WHERE id = 1').scalar() or 0
+
+
+def _load(version: int) -> Catalog:
+    sess = session_factory()
+    try:
+        tools = sess.query(Tool).options(subqueryload(Tool.tool_errors).subqueryload(ToolError.error)).options(
+            subqueryload(Tool.tool_security_issues).subqueryload(ToolSecurityIssue.security_issue)).all()
+        security_issues = sess.query(SecurityIssue).all()
+        errors = sess.query(Error).all()
+    finally:
+        # closing the session detaches the loaded objects without expiring them
+        sess.close()
+    return Catalog(version, tools, security_issues, errors)
@@ -0,0 +1,150 @@
+import hashlib
+import os
+import shutil
+import subprocess
+import tempfile
+from threading import Lock
+from typing import Dict, List
+
+from toolbox import test_bed_path
+
+"""
+    Summary
+    -------
+    A content-addressed, on-disk cache for the bytecode of compiled solidity contracts.
+    An entry is keyed by the SHA-256 hash of the source file, the version of the solidity compiler and the name of the
+    contract. Entries are written to a temporary directory and moved into place atomically, so that several processes
+    can share the cache. The least recently used entries are evicted when the cache exceeds <max_size>.
+    Imported files are not part of the key, so changes of imported files only take effect once the entry is evicted.
+"""
+
+cache_dir = f'{test_bed_path}/resources/compilation-cache'
+solc_versions_dir = f'{test_bed_path}/resources/solc-versions'
+
+max_size = 256 * 1024 ** 2
+hits = 0
+misses = 0
+_counters_lock = Lock()
+# compiling the same source concurrently in one process is wasted work. The sources share a fixed number of locks,
+# so that the locks do not grow with the number of compiled sources
+_compile_locks = [Lock() for _ in range(64)]
+
+
+def configure(max_size_mb: float = None):
+    global max_size
+    if max_size_mb is not None:
+        max_size = int(max_size_mb * 1024 ** 2)
+
+
+def get_stats() -> Dict[str, int]:
+    """Returns the number of hits and misses of the cache in this process."""
+    with _counters_lock:
+        return {'hits': hits, 'misses': misses}
+
+
+def format_stats() -> str:
+    stats = get_stats()
+    return f'Compilation cache: {stats["hits"]} hits, {stats["misses"]} misses.'
+
+
+def get_entry_path(source_hash: str, solc_version: str, contract_name: str, extension='bin') -> str:
+    return f'{cache_dir}/{source_hash}/{solc_version}/{contract_name}.{extension}'
+
+
+def get_bytecode_file(source_path: str, solc_version: str, contract_name: str, extensions: List[str] = None) -> str:
+    """Returns the path to the bytecode of the contract compiled by the solidity compiler <solc_version>.
+
+    Compiles the source file if the cache has no entry for it. The returned file must not be modified.
+
+    Parameters
+    ----------
+    source_path : str
+    solc_version : str
+        The name of a directory in <solc_versions_dir>.
+    contract_name : str
+    extensions : List[str], default=['bin']
+        The outputs of the compiler to cache, named by their file extensions, e.g. "bin" and "bin-runtime". The path
+        to the first one is returned.
+
+    Raises
+    ------
+    FileNotFoundError
+        If the compiler did not produce the output for the contract.
+    """
+    global hits, misses
+    extensions = extensions or ['bin']
+    source_hash = _hash_file(source_path)
+    entry_paths = [get_entry_path(source_hash, solc_version, contract_name, extension) for extension in extensions]
+    if all(os.path.isfile(path) for path in entry_paths):
+        _touch(entry_paths)
+        with _counters_lock:
+            hits += 1
+        return entry_paths[0]
+
+    with _compile_locks[hash(f'{source_hash}/{solc_version}') % len(_compile_locks)]:
+        if not all(os.path.isfile(path) for path in entry_paths):
+            with _counters_lock:
+                misses += 1
+            _compile(source_path, source_hash, solc_version, extensions)
+            evict()
+    for path in entry_paths:
+        if not os.path.isfile(path):
+            raise FileNotFoundError(
+                f'{path} should contain the compiled contract {contract_name} from {os.path.basename(source_path)} but '
+                f'does not. Used solc version: {solc_version}')
+    return entry_paths[0]
+
+
+def _compile(source_path: str, source_hash: str, solc_version: str, extensions: List[str]):
+    entry_dir = os.path.dirname(get_entry_path(source_hash, solc_version, ''))
+    os.makedirs(entry_dir, exist_ok=True)
+    # the compiler writes to a directory in the cache, so that its outputs can be moved into place atomically
+    output_dir = tempfile.mkdtemp(dir=entry_dir, prefix='.tmp-')
+    try:
+        subprocess.run([f'{solc_versions_dir}/{solc_version}/solc', '-o', output_dir]
+                       + [f'--{extension}' for extension in extensions] + [source_path],
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        for filename in os.listdir(output_dir):
+            os.replace(f'{output_dir}/{filename}', f'{entry_dir}/{filename}')
+    finally:
+        shutil.rmtree(output_dir, ignore_errors=True)
+
+
+def _hash_file(path: str) -> str:
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 ** 2), b''):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def _touch(paths: List[str]):
+    for path in paths:
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+
+def evict():
+    """Deletes the least recently used entries until the cache is not larger than <max_size>."""
+    entries = []
+    for dir_path, _, filenames in os.walk(cache_dir):
+        if '/.tmp-' in dir_path:
+            continue
+        for filename in filenames:
+            path = f'{dir_path}/{filename}'
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+    total_size = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total_size <= max_size:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        total_size -= size
@@ -0,0 +1,300 @@
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import uuid
+from threading import Lock, Thread
+from typing import Dict, List, Optional, Set
+
+from logic import containers, solidity_scanner
+from toolbox import test_bed_path
+
+"""
+    Summary
+    -------
+    Optional pools of long-lived containers per tool image.
+    A pooled container is started once and then receives jobs via <docker exec>, which saves the startup and teardown
+    of a container per analysis. Every container mounts a shared work directory in which each job gets its own
+    directory holding a copy of the contract and the job's output. The installed solidity compilers are mounted
+    read-only.
+    Pools are configured per tool. A pool warms up on its first use; as long as no warm container is idle, tools fall
+    back to <docker run>.
+"""
+
+docker_cmd_prefix = ['sudo', 'docker']
+solc_versions_dir = f'{test_bed_path}/resources/solc-versions'
+docker_jobs_dir = '/testbed/jobs'
+docker_solc_versions_dir = '/testbed/solc-versions'
+# options of <docker run> which are also accepted by <docker exec>
+exec_options = {'-w', '--workdir', '-e', '--env', '-u', '--user'}
+
+
+class Lease:
+    """The exclusive use of a pooled container for one job.
+
+    Attributes
+    ----------
+    container : str
+        The ID of the container.
+    job_dir : str
+        The directory of the job on the host.
+    run_id : str, optional
+        The ID of the test-run the job belongs to. The lease is recorded by it, see <containers.kill_run>.
+    """
+
+    def __init__(self, pool: 'ContainerPool', container: str, run_id: Optional[str] = None):
+        self.pool = pool
+        self.container = container
+        self.job_dir = tempfile.mkdtemp(dir=pool.work_dir)
+        self.run_id = run_id
+        self._output_dirs: Dict[str, str] = {}
+        self._killed = False
+        if run_id:
+            containers.add_lease(run_id, self)
+
+    def to_container_path(self, host_path: str) -> str:
+        return f'{docker_jobs_dir}/{os.path.relpath(host_path, self.pool.work_dir)}'
+
+    def add_contract(self, contract_path: str) -> str:
+        """Copies the contract and the files it imports, directly or indirectly, into the job directory.
+
+        Returns
+        -------
+        str
+            The path to the contract inside the container.
+        """
+        contract_dir = f'{self.job_dir}/contract'
+        contract_path = os.path.realpath(contract_path)
+        paths = solidity_scanner.get_imported_files(contract_path)
+        # keeps the relative paths between the files, also for imports from parent directories
+        root_dir = os.path.commonpath([os.path.dirname(path) for path in paths])
+        for path in paths:
+            target = f'{contract_dir}/{os.path.relpath(path, root_dir)}'
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            shutil.copyfile(path, target)
+        return self.to_container_path(f'{contract_dir}/{os.path.relpath(contract_path, root_dir)}')
+
+    def add_solc_dir(self, solc_dir: str) -> str:
+        """Returns the path to the compiler directory inside the container. Copies compilers which are not installed."""
+        if os.path.realpath(os.path.dirname(solc_dir)) == os.path.realpath(solc_versions_dir):
+            return f'{docker_solc_versions_dir}/{os.path.basename(solc_dir)}'
+        job_solc_dir = f'{self.job_dir}/solc'
+        shutil.copytree(solc_dir, job_solc_dir)
+        return self.to_container_path(job_solc_dir)
+
+    def add_output_dir(self, output_dir: str) -> str:
+        """Creates an output directory for the job. Its content is copied to <output_dir> when the job ends.
+
+        Returns
+        -------
+        str
+            The path to the output directory inside the container.
+        """
+        job_output_dir = f'{self.job_dir}/output'
+        os.makedirs(job_output_dir)
+        os.chmod(job_output_dir, 0o777)
+        self._output_dirs[job_output_dir] = output_dir
+        return self.to_container_path(job_output_dir)
+
+    def kill(self):
+        """Kills the container, e.g. because the job has been cancelled. The container is replaced on release."""
+        self._killed = True
+        containers.kill([self.container])
+
+    def release(self, failed=False):
+        """Copies the job's output back, deletes the job directory and returns the container to the pool.
+
+        Parameters
+        ----------
+        failed : bool, default=False
+            Whether the job has been interrupted, e.g. by a timeout. The processes of such a job might still run
+            inside the container, so the container is replaced instead of reused.
+        """
+        if self.run_id:
+            containers.remove_lease(self.run_id, self)
+        try:
+            for job_output_dir, output_dir in self._output_dirs.items():
+                shutil.copytree(job_output_dir, output_dir, dirs_exist_ok=True)
+        finally:
+            shutil.rmtree(self.job_dir, ignore_errors=True)
+            self.pool.give_back(self.container, failed or self._killed)
+
+
+class ContainerPool:
+    """A pool of pre-started containers of one docker image.
+
+    Parameters
+    ----------
+    docker_image : str
+    size : int
+        The number of containers kept running.
+    max_jobs : int, default=50
+        The number of jobs after which a container is replaced by a fresh one.
+    """
+
+    def __init__(self, docker_image: str, size: int, max_jobs: int = 50):
+        self.docker_image = docker_image
+        self.size = size
+        self.max_jobs = max_jobs
+        self.work_dir = tempfile.mkdtemp(prefix='testbed-pool-')
+        os.chmod(self.work_dir, 0o777)
+        self.entrypoint: List[str] = []
+        self._run_opts: Optional[List[str]] = None
+        self._idle: List[str] = []
+        self._containers: Set[str] = set()
+        self._jobs: Dict[str, int] = {}
+        self._starting = 0
+        self._lock = Lock()
+
+    def __str__(self):
+        return f'ContainerPool(image={self.docker_image}, size={self.size})'
+
+    def try_acquire(self, run_opts: List[str], run_id: Optional[str] = None) -> Optional[Lease]:
+        """Returns a lease on an idle, healthy container for the test-run or None if there is none.
+
+        The first call starts the containers of the pool in the background with the <docker run> options <run_opts>.
+        Calls with other options always return None, since the containers have not been started with them.
+        """
+        with self._lock:
+            if self._run_opts is None:
+                self._run_opts = list(run_opts)
+                self._replenish()
+                return None
+            if run_opts != self._run_opts:
+                return None
+            container = self._idle.pop() if self._idle else None
+        if container is None:
+            return None
+        if not self._is_healthy(container):
+            self.give_back(container, failed=True)
+            return None
+        return Lease(self, container, run_id)
+
+    def give_back(self, container: str, failed=False):
+        with self._lock:
+            self._jobs[container] = self._jobs.get(container, 0) + 1
+            if not failed and container in self._containers and self._jobs[container] < self.max_jobs:
+                self._idle.append(container)
+                return
+            self._containers.discard(container)
+            self._jobs.pop(container, None)
+            self._replenish()
+        Thread(target=_remove_container, args=(container,), daemon=True).start()
+
+    def shutdown(self):
+        with self._lock:
+            containers = list(self._containers)
+            self._containers.clear()
+            self._idle.clear()
+            self.size = 0
+        for container in containers:
+            _remove_container(container)
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+
+    def _replenish(self):
+        # must be called with self._lock held
+        missing = self.size - len(self._containers) - self._starting
+        for _ in range(max(0, missing)):
+            self._starting += 1
+            Thread(target=self._start_container, daemon=True).start()
+
+    def _start_container(self):
+        container = None
+        try:
+            if not self.entrypoint:
+                self.entrypoint = _get_entrypoint(self.docker_image)
+            result = subprocess.run(
+                docker_cmd_prefix + ['run', '-d', '--rm', '--label', 'testbed.pool=1',
+                                     '--name', f'testbed-pool-{uuid.uuid4().hex[:12]}',
+                                     '-v', f'{self.work_dir}:{docker_jobs_dir}',
+                                     '-v', f'{solc_versions_dir}:{docker_solc_versions_dir}:ro']
+                + containers.get_label_opts() + self._run_opts
+                + ['--entrypoint', 'tail', self.docker_image, '-f', '/dev/null'],
+                stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=120)
+            if result.returncode == 0:
+                container = result.stdout.decode().strip()
+            else:
+                print(f'{self}: could not start a container: {result.stderr.decode().strip()}')
+        except (OSError, subprocess.TimeoutExpired) as e:
+            print(f'{self}: could not start a container: {e}')
+        with self._lock:
+            self._starting -= 1
+            if container and self.size > len(self._containers):
+                self._containers.add(container)
+                self._idle.append(container)
+                container = None
+        if container:
+            _remove_container(container)
+
+    @staticmethod
+    def _is_healthy(container: str) -> bool:
+        try:
+            result = subprocess.run(docker_cmd_prefix + ['inspect', '-f', '{{.State.Running}}', container],
+                                    stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, timeout=30)
+        except (OSError, subprocess.TimeoutExpired):
+            return False
+        return result.returncode == 0 and result.stdout.decode().strip() == 'true'
+
+
+def _get_entrypoint(docker_image: str) -> List[str]:
+    result = subprocess.run(docker_cmd_prefix + ['image', 'inspect', '-f', '{{json .Config.Entrypoint}}', docker_image],
+                            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, timeout=30)
+    if result.returncode != 0:
+        return []
+    return json.loads(result.stdout.decode() or 'null') or []
+
+
+def _remove_container(container: str):
+    subprocess.run(docker_cmd_prefix + ['rm', '-f', container], stdout=subprocess.DEVNULL,
+                   stderr=subprocess.DEVNULL)
+
+
+def split_docker_opts(docker_opts: List[str]):
+    """Splits options of <docker run> into options accepted by <docker exec> and options needed to start a container.
+
+    Every option must either be followed by its value or contain it after a "=".
+    """
+    exec_opts, run_opts = [], []
+    i = 0
+    while i < len(docker_opts):
+        option = docker_opts[i]
+        values = [option] if '=' in option or i + 1 == len(docker_opts) else docker_opts[i:i + 2]
+        (exec_opts if option.split('=')[0] in exec_options else run_opts).extend(values)
+        i += len(values)
+    return exec_opts, run_opts
+
+
+_settings: Dict[str, Dict] = {}
+_pools: Dict[str, ContainerPool] = {}
+_pools_lock = Lock()
+
+
+def configure(tool_pools: Dict[str, Dict]):
+    """Enables pools for the tools.
+
+    Parameters
+    ----------
+    tool_pools : Dict[str, Dict]
+        Maps the name of a tool to the settings of its pool: "size" and optionally "max_jobs".
+    """
+    with _pools_lock:
+        _settings.update({tool_name: settings for tool_name, settings in tool_pools.items() if settings.get('size')})
+
+
+def get_pool(tool_name: str, docker_image: str) -> Optional[ContainerPool]:
+    """Returns the pool of the tool or None if no pool is configured for the tool."""
+    with _pools_lock:
+        if tool_name not in _pools and tool_name in _settings:
+            settings = _settings[tool_name]
+            _pools[tool_name] = ContainerPool(docker_image, settings['size'], settings.get('max_jobs', 50))
+        return _pools.get(tool_name)
+
+
+def shutdown():
+    """Removes the containers of all pools."""
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.shutdown()
@@ -0,0 +1,149 @@
+import fcntl
+import os
+import subprocess
+import uuid
+from threading import Lock, Thread
+from typing import Dict, List, Optional, Set, TextIO
+
+from toolbox import test_bed_path
+
+"""
+    Summary
+    -------
+    Labels, kills and reaps the docker containers started by the tools.
+    Killing a <docker run> client does not stop its container, so the containers of timed out and cancelled tools are
+    killed through docker. Every container started by the testbed gets a unique name and the labels <run_label> with
+    the ID of its test-run and <boot_label> with the boot ID of the testbed process, a random ID generated at import.
+    A process holds a lock on its file in <boots_dir> as long as it is running, so that the containers of a boot whose
+    file is not locked are orphans, even if a new process got the same PID. They are killed by <reap_orphans>.
+    Jobs sent into pooled containers via <docker exec> cannot be labelled, so their leases are recorded per test-run.
+"""
+
+docker_cmd_prefix = ['sudo', 'docker']
+run_label = 'testbed.run'
+boot_label = 'testbed.boot'
+boots_dir = f'{test_bed_path}/resources/boots'
+boot_id = uuid.uuid4().hex
+
+_boot_file: Optional[TextIO] = None
+_boot_lock = Lock()
+# test-run ID -> the leases of pooled containers, see <container_pool.Lease>
+_leases: Dict[str, Set] = {}
+_leases_lock = Lock()
+
+
+def create_name() -> str:
+    return f'testbed-{uuid.uuid4().hex[:12]}'
+
+
+def get_label_opts(run_id: Optional[str] = None) -> List[str]:
+    """Returns the options of <docker run> labelling a container with the test-run and the testbed process."""
+    _register_boot()
+    return ['--label', f'{run_label}={run_id or ""}', '--label', f'{boot_label}={boot_id}']
+
+
+def kill(containers: List[str]):
+    """Kills the containers. Containers which have already stopped are ignored."""
+    if not containers:
+        return
+    try:
+        subprocess.run(docker_cmd_prefix + ['kill'] + containers, stdout=subprocess.DEVNULL,
+                       stderr=subprocess.DEVNULL, timeout=60)
+    except (OSError, subprocess.TimeoutExpired) as e:
+        print(f'Could not kill the containers {", ".join(containers)}: {e}')
+
+
+def add_lease(run_id: str, lease):
+    """Records the lease of a pooled container by the test-run, so that <kill_run> finds it."""
+    with _leases_lock:
+        _leases.setdefault(run_id, set()).add(lease)
+
+
+def remove_lease(run_id: str, lease):
+    with _leases_lock:
+        leases = _leases.get(run_id)
+        if leases is not None:
+            leases.discard(lease)
+            if not leases:
+                del _leases[run_id]
+
+
+def kill_run(run_id: str):
+    """Kills the containers of the test-run, including the pooled containers leased by it."""
+    with _leases_lock:
+        leases = list(_leases.get(run_id, ()))
+    for lease in leases:
+        lease.kill()
+    kill([container for container, _ in _list(f'{run_label}={run_id}')])
+
+
+def kill_own():
+    """Kills the containers started by this process."""
+    kill([container for container, _ in _list(f'{boot_label}={boot_id}')])
+
+
+def reap_orphans() -> int:
+    """Kills the containers whose testbed process is not running anymore. Returns the number of killed containers."""
+    _register_boot()
+    orphans = [container for container, boot in _list(boot_label) if not _is_alive(boot)]
+    kill(orphans)
+    if orphans:
+        print(f'Killed {len(orphans)} orphaned containers.')
+    # deletes the files of the dead processes which had no running containers
+    for boot in os.listdir(boots_dir):
+        _is_alive(boot)
+    return len(orphans)
+
+
+def start_reaper():
+    """Reaps the orphaned containers on a background thread."""
+    Thread(target=reap_orphans, name='testbed-container-reaper', daemon=True).start()
+
+
+def _list(label_filter: str) -> List[List[str]]:
+    """Returns the IDs of the running containers matching the label filter together with their boot ID."""
+    try:
+        result = subprocess.run(docker_cmd_prefix + ['ps', '--filter', f'label={label_filter}', '--format',
+                                                     f'{{{{.ID}}}} {{{{.Label "{boot_label}"}}}}'],
+                                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, timeout=60)
+    except (OSError, subprocess.TimeoutExpired):
+        return []
+    if result.returncode != 0:
+        return []
+    return [(line.split() + [''])[:2] for line in result.stdout.decode().splitlines() if line.strip()]
+
+
+def _register_boot():
+    """Locks the file of the boot ID for the lifetime of the process. The lock is released when the process dies."""
+    global _boot_file
+    with _boot_lock:
+        if _boot_file is not None:
+            return
+        os.makedirs(boots_dir, exist_ok=True)
+        # the file is locked before it gets its name, so that no other process takes it for the file of a dead boot
+        _boot_file = open(f'{boots_dir}/{boot_id}.tmp', 'w')
+        fcntl.flock(_boot_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        os.replace(f'{boots_dir}/{boot_id}.tmp', f'{boots_dir}/{boot_id}')
+
+
+def _is_alive(boot: str) -> bool:
+    if boot == boot_id:
+        return True
+    if not boot or os.sep in boot or boot.startswith('.') or boot.endswith('.tmp'):
+        # containers without a valid boot ID have not been started by the testbed
+        return True
+    path = f'{boots_dir}/{boot}'
+    try:
+        with open(path) as f:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return True
+    except FileNotFoundError:
+        return False
+    # nobody holds the lock, so the process of the boot has died
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+    return False
@@ -0,0 +1,104 @@
+import atexit
+from collections import deque
+from concurrent.futures import Future
+from threading import Condition, Lock, Thread
+from typing import Any, Callable, Deque, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from logic.orm import get_db_session, remove_db_session
+
+"""
+    Summary
+    -------
+    Provides the process-wide writer which commits the results of the tools to the database.
+    SQLite allows a single writer at a time and every commit syncs the journal, so the writes of many tools finishing
+    at once are queued and committed by a single thread in one transaction. A write is a function adding or changing
+    rows in the session it is passed; it must not commit. If a batch fails, its writes are repeated one by one, so
+    that a failing write does not discard the others.
+"""
+
+
+class Writer:
+    """Commits queued writes in batches on a background thread.
+
+    Parameters
+    ----------
+    max_batch : int, default=64
+        The maximal number of writes committed in one transaction.
+    max_delay : float, default=0.05
+        The number of secs the writer waits for further writes after the first write of a batch.
+    """
+
+    def __init__(self, max_batch=64, max_delay=0.05):
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self._queue: Deque[Tuple[Callable[[Session], Any], Future]] = deque()
+        self._condition = Condition()
+        self._pending = 0
+        self._thread: Optional[Thread] = None
+
+    def submit(self, write: Callable[[Session], Any]) -> Future:
+        """Queues the write. The future is resolved with the result of <write> once it has been committed."""
+        future = Future()
+        with self._condition:
+            self._queue.append((write, future))
+            self._pending += 1
+            if self._thread is None:
+                self._thread = Thread(target=self.__work, name='testbed-db-writer', daemon=True)
+                self._thread.start()
+            self._condition.notify_all()
+        return future
+
+    def flush(self, timeout: float = None) -> bool:
+        """Waits until all queued writes have been committed. Returns False if the timeout has expired."""
+        with self._condition:
+            return self._condition.wait_for(lambda: self._pending == 0, timeout)
+
+    def __work(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._queue)
+                # wait a little, so that writes arriving shortly after each other share a transaction
+                self._condition.wait_for(lambda: len(self._queue) >= self.max_batch, self.max_delay)
+                batch = [self._queue.popleft() for _ in range(min(len(self._queue), self.max_batch))]
+            try:
+                self.__commit(batch)
+            finally:
+                remove_db_session()
+                with self._condition:
+                    self._pending -= len(batch)
+                    self._condition.notify_all()
+
+    @staticmethod
+    def __commit(batch: List[Tuple[Callable[[Session], Any], Future]]):
+        sess = get_db_session()
+        try:
+            results = [write(sess) for write, _ in batch]
+            sess.commit()
+        except Exception as e:
+            sess.rollback()
+            if len(batch) > 1:
+                for write in batch:
+                    Writer.__commit([write])
+            else:
+                print(f'Could not write to the database: {e}')
+                batch[0][1].set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
+
+
+_writer: Optional[Writer] = None
+_writer_lock = Lock()
+
+
+def get_writer() -> Writer:
+    """Returns the process-wide writer."""
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = Writer()
+            # the writer thread is a daemon, so the queued writes must be committed before the process exits
+            atexit.register(_writer.flush, 60)
+        return _writer
@@ -0,0 +1,178 @@
+import asyncio
+import subprocess
+from concurrent.futures import Future
+from threading import Lock, Thread
+from typing import Callable, Coroutine, List, Optional, Union, IO, Tuple
+
+"""
+    Summary
+    -------
+    Provides the execution engine which supervises the processes started by the tools.
+    The engine runs a single asyncio event loop on a background thread. Processes are started without a shell via
+    <asyncio.create_subprocess_exec> and their timeouts are awaited on the loop instead of blocking a thread each.
+    The output of a process can be read through a pipe while it runs, so that it is processed as it arrives.
+"""
+
+File = Union[None, int, IO]
+chunk_size = 64 * 1024
+
+
+class Engine:
+    """Owns the event loop on which the processes of the tools are supervised."""
+
+    def __init__(self):
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[Thread] = None
+        self._lock = Lock()
+
+    def get_loop(self) -> asyncio.AbstractEventLoop:
+        """Returns the event loop of the engine. Starts the loop on first use."""
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = Thread(target=self._loop.run_forever, name='testbed-engine', daemon=True)
+                self._thread.start()
+            return self._loop
+
+    def submit(self, coroutine: Coroutine) -> Future:
+        """Schedules the coroutine on the event loop. Can be called from any thread."""
+        return asyncio.run_coroutine_threadsafe(coroutine, self.get_loop())
+
+    def run_process(self, args: List[str], stdout: File = None, stderr: File = subprocess.STDOUT,
+                    timeout: float = None, on_output: Callable[[bytes], None] = None) -> int:
+        """Runs the process on the event loop and blocks until it has terminated.
+
+        Parameters
+        ----------
+        args : List[str]
+            The program and its arguments. No shell is involved.
+        stdout, stderr : file, int or None
+            Where to redirect the output of the process. Accepts the same values as <subprocess.Popen>.
+        timeout : float, optional
+            The number of secs. after which the process is killed.
+        on_output : Callable[[bytes], None], optional
+            Called on the event loop with every chunk of the stdout of the process as soon as it is read. The stdout
+            is then read through a pipe and written to <stdout>, which must be a binary file or None.
+
+        Returns
+        -------
+        int
+            The return code of the process.
+
+        Raises
+        ------
+        subprocess.TimeoutExpired
+            If the process has been killed because of the timeout.
+        """
+        return self.submit(run_process(args, stdout=stdout, stderr=stderr, timeout=timeout,
+                                       on_output=on_output)).result()
+
+    def run_processes(self, commands: List[Tuple[List[str], File]], timeout: float = None,
+                      on_output: Callable[[int, bytes], None] = None) -> List[int]:
+        """Runs several processes at once and blocks until all of them have terminated.
+
+        The processes share one deadline: when <timeout> expires, every process still running is killed.
+
+        Parameters
+        ----------
+        commands : List[Tuple[List[str], file]]
+            The arguments of every process and where to redirect its stdout and stderr to.
+        timeout : float, optional
+        on_output : Callable[[int, bytes], None], optional
+            Called with the index of the process and every chunk of its output. See <run_process>.
+
+        Returns
+        -------
+        List[int]
+            The return codes in the order of <commands>.
+
+        Raises
+        ------
+        subprocess.TimeoutExpired
+            If the processes have been killed because of the timeout.
+        """
+        return self.submit(run_processes(commands, timeout=timeout, on_output=on_output)).result()
+
+
+async def run_process(args: List[str], stdout: File = None, stderr: File = subprocess.STDOUT,
+                      timeout: float = None, on_output: Callable[[bytes], None] = None) -> int:
+    """Starts the process and awaits its termination. See <Engine.run_process>."""
+    process = await _create_process(args, stdout, stderr, on_output)
+    try:
+        return await asyncio.wait_for(_wait(process, stdout, on_output), timeout)
+    except asyncio.TimeoutError:
+        await _kill(process)
+        raise subprocess.TimeoutExpired(args, timeout)
+    except asyncio.CancelledError:
+        await _kill(process)
+        raise
+
+
+async def run_processes(commands: List[Tuple[List[str], File]], timeout: float = None,
+                        on_output: Callable[[int, bytes], None] = None) -> List[int]:
+    """Starts the processes and awaits their termination. See <Engine.run_processes>."""
+    processes = []
+    waits = []
+    try:
+        for index, (args, stdout) in enumerate(commands):
+            process_on_output = (lambda chunk, index=index: on_output(index, chunk)) if on_output else None
+            processes.append(await _create_process(args, stdout, subprocess.STDOUT, process_on_output))
+            waits.append(asyncio.ensure_future(_wait(processes[-1], stdout, process_on_output)))
+        _, pending = await asyncio.wait(waits, timeout=timeout)
+    except BaseException:
+        for wait in waits:
+            wait.cancel()
+        await asyncio.gather(*[_kill(process) for process in processes])
+        raise
+    if pending:
+        for wait in pending:
+            wait.cancel()
+        await asyncio.gather(*[_kill(process) for process in processes])
+        raise subprocess.TimeoutExpired([args for args, _ in commands], timeout)
+    return [process.returncode for process in processes]
+
+
+async def _create_process(args: List[str], stdout: File, stderr: File,
+                          on_output: Optional[Callable[[bytes], None]]) -> asyncio.subprocess.Process:
+    if on_output is None:
+        return await asyncio.create_subprocess_exec(*args, stdout=stdout, stderr=stderr)
+    return await asyncio.create_subprocess_exec(*args, stdout=subprocess.PIPE, stderr=stderr)
+
+
+async def _wait(process: asyncio.subprocess.Process, stdout: File,
+                on_output: Optional[Callable[[bytes], None]]) -> int:
+    """Awaits the termination of the process. Reads its output first if it is piped."""
+    if on_output is not None:
+        while True:
+            chunk = await process.stdout.read(chunk_size)
+            if not chunk:
+                break
+            if stdout is not None:
+                stdout.write(chunk)
+            try:
+                on_output(chunk)
+            except Exception as e:
+                print(f'Could not process the output of {process.pid}: {e}')
+    return await process.wait()
+
+
+async def _kill(process: asyncio.subprocess.Process):
+    if process.returncode is None:
+        try:
+            process.kill()
+        except ProcessLookupError:
+            pass
+        await process.wait()
+
+
+_engine: Optional[Engine] = None
+_engine_lock = Lock()
+
+
+def get_engine() -> Engine:
+    """Returns the process-wide engine."""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = Engine()
+        return _engine
@@ -0,0 +1,111 @@
+from concurrent.futures import Future
+from typing import Dict, List, Optional, Tuple
+
+from logic.orm import Tool, SolidityContract, SecurityIssue
+from logic.test_runner import TestRun, discovered_errors_count
+from logic.tools.tool_test_run import ToolTestRun
+
+"""
+    Summary
+    -------
+    Analyzes every contract of a solidity file.
+    Tools which analyze the whole file (<Tool.analyses_whole_file>) run once for the file and their findings are
+    attributed to the contracts afterwards. The other tools run once per contract. All test-runs are executed by the
+    scheduler, so that the number of running tools stays bounded.
+"""
+
+
+class FileRun:
+    """Tests every deployable contract of a solidity file with the same tools.
+
+    Parameters
+    ----------
+    path : str
+        The path to the .sol-file.
+    tools : List[Tool]
+    timeout : int, optional
+    compile_once : bool, default=False
+        See <TestRun>. Only applies to the tools which run once per contract.
+    """
+
+    def __init__(self, path: str, tools: List[Tool], timeout=None, compile_once=False):
+        first_contract = SolidityContract(path)
+        self.contract_names = [definition.name for definition in first_contract.get_source_info().contracts
+                               if definition.kind == 'contract' and definition.deployable] or [first_contract.name]
+        self._tools = tools
+        self._whole_file_tools = [tool for tool in tools if tool.analyses_whole_file]
+        self._per_contract_tools = [tool for tool in tools if not tool.analyses_whole_file]
+        # the whole-file tools test the file through its first contract. They always test the source, since the
+        # runtime bytecode of the first contract neither contains the other contracts nor names any of them
+        self._file_test_run: Optional[TestRun] = None
+        if self._whole_file_tools:
+            self._file_test_run = TestRun(SolidityContract(path, name=self.contract_names[0]), self._whole_file_tools,
+                                          timeout, compile_once=False)
+        self._contract_test_runs: Dict[str, TestRun] = {}
+        if self._per_contract_tools:
+            for name in self.contract_names:
+                contract = first_contract if name == first_contract.name else SolidityContract(path, name=name)
+                self._contract_test_runs[name] = TestRun(contract, self._per_contract_tools, timeout, compile_once)
+
+    def run(self):
+        for test_run in self.get_test_runs():
+            test_run.run()
+
+    def cancel(self):
+        """Cancels all test-runs. See <TestRun.cancel>."""
+        for test_run in self.get_test_runs():
+            test_run.cancel()
+
+    def get_test_runs(self) -> List[TestRun]:
+        return ([self._file_test_run] if self._file_test_run else []) + list(self._contract_test_runs.values())
+
+    def get_futures(self) -> Dict[Future, Tuple[Optional[str], Tool]]:
+        """Returns the futures of all tool test-runs with the contract name and the tool.
+
+        The contract name is None for tools analyzing the whole file.
+        """
+        futures = {}
+        if self._file_test_run:
+            futures.update({future: (None, tool) for future, tool in self._file_test_run.get_futures().items()})
+        for name, test_run in self._contract_test_runs.items():
+            futures.update({future: (name, tool) for future, tool in test_run.get_futures().items()})
+        return futures
+
+    def get_tool_test_run(self, contract_name: Optional[str], tool: Tool) -> ToolTestRun:
+        if contract_name is None:
+            return self._file_test_run.get_tool_test_run(tool)
+        return self._contract_test_runs[contract_name].get_tool_test_run(tool)
+
+    def get_security_issues_statuses(self) -> Dict[str, Dict[SecurityIssue, Dict[Tool, str]]]:
+        """Returns the statuses of the security issues per contract. See <TestRun.get_security_issues_statuses>.
+
+        A security issue found by a whole-file tool is "found" for the contracts it is attributed to and "not found"
+        for the others.
+        """
+        attributions = {tool: self.__attribute(tool) for tool in self._whole_file_tools}
+        statuses = {}
+        for name in self.contract_names:
+            contract_statuses: Dict[SecurityIssue, Dict[Tool, str]] = {}
+            if self._file_test_run:
+                for issue, tool_statuses in self._file_test_run.get_security_issues_statuses().items():
+                    contract_statuses[issue] = {}
+                    for tool, status in tool_statuses.items():
+                        if status == 'found' and attributions[tool] is not None \
+                                and issue.title not in attributions[tool][name]:
+                            status = 'not found'
+                        contract_statuses[issue][tool] = status
+            if name in self._contract_test_runs:
+                for issue, tool_statuses in self._contract_test_runs[name].get_security_issues_statuses().items():
+                    contract_statuses.setdefault(issue, {}).update(tool_statuses)
+            contract_statuses = {issue: {tool: tool_statuses.get(tool, 'not checked') for tool in self._tools}
+                                 for issue, tool_statuses in contract_statuses.items()}
+            statuses[name] = dict(sorted(contract_statuses.items(), key=discovered_errors_count, reverse=True))
+        return statuses
+
+    def __attribute(self, tool: Tool) -> Optional[Dict[str, set]]:
+        if tool not in self._file_test_run.get_terminated_tools():
+            return None
+        tool_test_run = self._file_test_run.get_tool_test_run(tool)
+        return {name: {issue.title for issue in issues}
+                for name, issues in tool_test_run.identify_security_issues_per_contract(self.contract_names).items()}
+
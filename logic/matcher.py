@@ -0,0 +1,185 @@
+import codecs
+import re
+from functools import lru_cache
+from threading import Lock
+from typing import Dict, FrozenSet, List, Optional, Pattern, Set, Tuple
+
+from logic.orm import Tool
+
+"""
+    Summary
+    -------
+    Classifies the output of a tool by the identifiers of its <ToolSecurityIssue>s and <ToolError>s.
+    The identifiers of a tool are compiled once into a single regular expression, so that the output is scanned for
+    all security issues and errors at once. Matchers only hold the titles of the security issues and errors, so that
+    they can be shared by test-runs with different database sessions.
+    A <StreamMatcher> classifies output chunk by chunk while the tool is still running.
+"""
+
+
+class Matcher:
+    """Finds the security issues and errors whose identifiers match a text.
+
+    Parameters
+    ----------
+    issue_patterns : List[Tuple[str, str]]
+        The identifiers and titles of the security issues. An empty identifier matches every text.
+    error_patterns : List[Tuple[str, str]]
+        The identifiers and titles of the errors. Errors with an empty identifier are never matched.
+    """
+
+    def __init__(self, issue_patterns: List[Tuple[str, str]], error_patterns: List[Tuple[str, str]]):
+        self._always_matching_issues = {issue for identifier, issue in issue_patterns if not identifier}
+        # index -> (identifier, is_security_issue, title)
+        self._patterns: List[Tuple[str, bool, str]] = \
+            [(identifier, True, issue) for identifier, issue in issue_patterns if identifier] + \
+            [(identifier, False, error) for identifier, error in error_patterns if identifier]
+        self._compiled: List[Pattern] = [re.compile(identifier) for identifier, _, _ in self._patterns]
+        self._combine = lru_cache(maxsize=64)(self._combine_uncached)
+
+    def match(self, text: str, security_issues=True, errors=True) -> Tuple[Set[str], Set[str]]:
+        """Returns the titles of the security issues and errors whose identifiers match the text."""
+        remaining = frozenset(index for index, (_, is_issue, _) in enumerate(self._patterns)
+                              if (security_issues and is_issue) or (errors and not is_issue))
+        matched = self._match_indexes(text, remaining)
+        found_issues = set(self._always_matching_issues) if security_issues else set()
+        found_errors = set()
+        for index in matched:
+            _, is_issue, item = self._patterns[index]
+            (found_issues if is_issue else found_errors).add(item)
+        return found_issues, found_errors
+
+    def _match_indexes(self, text: str, remaining: FrozenSet[int]) -> List[int]:
+        matched = []
+        while remaining:
+            combined = self._combine(remaining)
+            if combined is None:
+                # the identifiers cannot be combined, e.g. because they use numbered back-references
+                return matched + [index for index in remaining if self._compiled[index].search(text)]
+            found = {int(match.lastgroup[1:]) for match in combined.finditer(text)}
+            if not found:
+                break
+            matched += found
+            # an identifier matching at the same position as a found one is shadowed by it, so scan again
+            remaining = remaining - found
+        return matched
+
+    def _combine_uncached(self, indexes: FrozenSet[int]) -> Optional[Pattern]:
+        try:
+            return re.compile('|'.join(f'(?P<p{index}>{self._patterns[index][0]})' for index in sorted(indexes)))
+        except re.error:
+            return None
+
+
+class StreamMatcher:
+    """Classifies output which arrives in chunks, e.g. through the pipe of a running tool.
+
+    The last <carry_over> characters of the output are scanned again together with the next chunk, so that identifiers
+    matching across the boundary of two chunks are found, as long as their match is not longer than <carry_over>.
+    Identifiers which have been found are not searched for again. Once the output has been closed, the matches are the
+    same as those of <Matcher.match> for the whole output, except for identifiers anchored at the start of the text.
+
+    Parameters
+    ----------
+    matcher : Matcher
+    carry_over : int, default=4096
+    """
+
+    def __init__(self, matcher: Matcher, carry_over=4096):
+        self._matcher = matcher
+        self._carry_over = carry_over
+        self._decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        self._tail = ''
+        self._remaining = frozenset(range(len(matcher._patterns)))
+        self._issues: Set[str] = set(matcher._always_matching_issues)
+        self._errors: Set[str] = set()
+        self._lock = Lock()
+        self.closed = False
+
+    def feed(self, chunk: bytes) -> Tuple[Set[str], Set[str]]:
+        """Scans the next chunk of the output. Returns the titles of the security issues and errors found first."""
+        with self._lock:
+            return self.__scan(self._decoder.decode(chunk))
+
+    def close(self) -> Tuple[Set[str], Set[str]]:
+        """Scans the rest of the output. Must be called when the output has ended."""
+        with self._lock:
+            found = self.__scan(self._decoder.decode(b'', final=True))
+            self.closed = True
+            return found
+
+    def get_matches(self) -> Tuple[Set[str], Set[str]]:
+        """Returns the titles of the security issues and errors found so far."""
+        with self._lock:
+            return set(self._issues), set(self._errors)
+
+    def __scan(self, text: str) -> Tuple[Set[str], Set[str]]:
+        text = self._tail + text
+        self._tail = text[-self._carry_over:]
+        new_issues, new_errors = set(), set()
+        if not text or not self._remaining:
+            return new_issues, new_errors
+        found = self._matcher._match_indexes(text, self._remaining)
+        self._remaining = self._remaining - set(found)
+        for index in found:
+            _, is_issue, item = self._matcher._patterns[index]
+            if is_issue and item not in self._issues:
+                new_issues.add(item)
+            elif not is_issue and item not in self._errors:
+                new_errors.add(item)
+        self._issues |= new_issues
+        self._errors |= new_errors
+        return new_issues, new_errors
+
+
+_matchers: Dict[Tuple[str, int], Matcher] = {}
+_lock = Lock()
+
+
+def get_matcher(tool: Tool) -> Matcher:
+    """Returns the matcher of the tool. The matcher is compiled on first use and whenever the identifiers change."""
+    issue_patterns = [(tool_security_issue.identifier, tool_security_issue.security_issue_title)
+                      for tool_security_issue in tool.tool_security_issues]
+    error_patterns = [(tool_error.identifier, tool_error.error_title) for tool_error in tool.tool_errors]
+    key = (tool.name, hash((tuple(issue_patterns), tuple(error_patterns))))
+    with _lock:
+        matcher = _matchers.get(key)
+    if matcher is None:
+        matcher = Matcher(issue_patterns, error_patterns)
+        with _lock:
+            for outdated_key in [k for k in _matchers if k[0] == tool.name]:
+                del _matchers[outdated_key]
+            _matchers[key] = matcher
+    return matcher
+
+
+def invalidate(tool_name: str = None):
+    """Forgets the compiled matcher of the tool or of all tools."""
+    with _lock:
+        for key in [key for key in _matchers if tool_name is None or key[0] == tool_name]:
+            del _matchers[key]
+
+
+def split_output_by_contract(text: str, contract_names: List[str]) -> Dict[str, str]:
+    """Splits the output of a tool at the lines naming "<file>.sol:<contract>".
+
+    The text preceding the first such line belongs to every contract.
+
+    Returns
+    -------
+    Dict[str, str]
+        The sections of the contracts named in the output. Empty if the output names none of the contracts.
+    """
+    if not contract_names:
+        return {}
+    marker = re.compile(r'^.*?\.sol:(' + '|'.join(re.escape(name) for name in contract_names) + r')\b.*$',
+                        re.MULTILINE)
+    sections: Dict[str, str] = {}
+    matches = list(marker.finditer(text))
+    if not matches:
+        return sections
+    preamble = text[:matches[0].start()]
+    for match, next_match in zip(matches, matches[1:] + [None]):
+        end = next_match.start() if next_match else len(text)
+        sections[match.group(1)] = sections.get(match.group(1), preamble) + text[match.start():end]
+    return sections
@@ -1,17 +1,19 @@
+import hashlib
 import os
 import re
-import subprocess
-import tempfile
 from threading import Lock
-from typing import List, Tuple, Optional, Union, Iterator
+from typing import List, Tuple, Optional, Union, Iterator, Dict
 
 import semver
-from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, Float, Table
-from sqlalchemy import create_engine
+from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, Float, Table, Index
+from sqlalchemy import create_engine, inspect, event
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.ext.hybrid import hybrid_property
 from sqlalchemy.orm import relationship, sessionmaker, scoped_session, reconstructor
+from sqlalchemy.pool import QueuePool
 
+from logic import compilation_cache, solidity_scanner
 from toolbox import get_range_for_installed_solcs
 from toolbox import test_bed_path
 
@@ -23,8 +25,26 @@ from toolbox import test_bed_path
 """
 
 db_path = f'{test_bed_path}/resources/db.sqlite'
+_version_comparator_regex = re.compile(r'(<=|>=|<|>|==?|!=|\^)?(\d\.\d+\.\d+)\b')
+
+# WAL lets the request threads read while a tool thread writes. With synchronous=NORMAL, a commit is not flushed to
+# disk before the next checkpoint, which may lose the last commits on a power loss, but never corrupts the database.
+sqlite_pragmas = ['journal_mode=WAL', 'synchronous=NORMAL', 'busy_timeout=10000', 'temp_store=MEMORY',
+                  'cache_size=-16000']
+
+# the connections are kept open, so that the pragmas are only set once per connection
+engine = create_engine('sqlite:///{}?check_same_thread=False'.format(db_path), echo=False, poolclass=QueuePool,
+                       pool_size=8, max_overflow=-1)
+
+
+@event.listens_for(engine, 'connect')
+def _set_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for pragma in sqlite_pragmas:
+        cursor.execute(f'PRAGMA {pragma}')
+    cursor.close()
+
 
-engine = create_engine('sqlite:///{}?check_same_thread=False'.format(db_path), echo=False)
 Base = declarative_base()
 
 
@@ -47,6 +67,9 @@ class Tool(Base):
         If so, the contract must be compiled in hex decimals.
     only_bytecode : Boolean, optional (default=False)
         Whether the tool can only work with a bytecode contract.
+    max_output_size : Integer, optional
+        The maximal number of bytes of the output of a command of the tool which are kept. Larger outputs are
+        truncated to their head and tail. Defaults to <output_capture.default_max_size> if None.
     _security_issues, optional
         The _security_issues the tool looks for and the _security_issues which can occur when terminated the tool.
     tool_security_issues, optional
@@ -60,6 +83,7 @@ class Tool(Base):
     link = Column(String)
     bytecode_compatible = Column(Boolean, default=False)
     analyses_whole_file = Column(Boolean)
+    max_output_size = Column(Integer)
 
     security_issues = relationship('SecurityIssue', secondary='tool_security_issues', order_by='SecurityIssue.title',
                                    backref='tools', lazy='subquery')
@@ -140,6 +164,11 @@ class ToolSecurityIssue(Base):
     security_issue_title = Column(String, ForeignKey('security_issues.title'), primary_key=True)
     identifier = Column(String, primary_key=True, default='')
 
+    # the primary key already indexes the lookups by tool_name
+    __table_args__ = (
+        Index('ix_tool_security_issues_security_issue_title', 'security_issue_title'),
+    )
+
     def __str__(self):
         return 'ToolSecurityIssue(tools_name={}, security_issues_id={})'.format(self.tool_name,
                                                                                 self.security_issue_title)
@@ -177,6 +206,11 @@ class ToolError(Base):
     error_title = Column(String, ForeignKey('errors.title'), primary_key=True)
     identifier = Column(String, primary_key=True, default='')
 
+    # the primary key already indexes the lookups by tool_name
+    __table_args__ = (
+        Index('ix_tool_errors_error_title', 'error_title'),
+    )
+
     # id_is_regex = Column(Boolean,default=True)
     # error=relationship('Error')
 
@@ -210,10 +244,16 @@ class Contract(Base):
         The address of the contract on the Ethereum blockchain, if it is already deployed.
     source : String, optional
         The source where the contract code comes from.
+    size : Integer, optional
+        The size of the contract file in bytes.
+    content_hash : String, optional
+        The SHA-256 hash of the contract file's content.
     filename
     dir_path
     filename_extension
     is_bytecode
+    runtime_bytecode : bool, default=False
+        Whether a bytecode contract contains the runtime bytecode instead of the creation bytecode. Not stored.
 
     Class Attributes
     ----------------
@@ -230,6 +270,7 @@ class Contract(Base):
     # TODO: rename to reference
     source = Column(String)
     size = Column(Integer)
+    content_hash = Column(String)
     class_type = Column(String)
 
     __tablename__ = 'contracts'
@@ -241,6 +282,7 @@ class Contract(Base):
 
     bytecode_extensions = ['hex', 'bin']
     file_extensions = bytecode_extensions + ['sol']
+    runtime_bytecode = False
 
     def __init__(self, path, address=None, source=None, size=None):
         self.path = path
@@ -279,6 +321,8 @@ class SolidityContract(Contract):
     name = Column(String, primary_key=True, nullable=False)
     solc_from = Column(String, nullable=False)
     solc_to = Column(String, nullable=False)
+    # the scan of the file, see <logic.solidity_scanner.SourceInfo.to_json>
+    source_info = Column(String)
     file_extensions = ['.sol']
 
     __tablename__ = 'solidity_contracts'
@@ -288,6 +332,11 @@ class SolidityContract(Contract):
 
     def __init__(self, path, address=None, source=None, name=None):
         super().__init__(path, address=address, source=source)
+        self.init_on_load()
+        self._source_info = solidity_scanner.scan_file(path)
+        self.source_info = self._source_info.to_json()
+        self.content_hash = self._source_info.content_hash
+        self.size = self._source_info.size
         if name is None:
             name = self._get_name_of_first_contract()
         self.name = name
@@ -295,13 +344,22 @@ class SolidityContract(Contract):
         self.solc_from = None
         self.solc_to = None
         self._assign_contract_solcs_range()
-        self.init_on_load()
 
     @reconstructor
     def init_on_load(self):
-        self.tmp_dir = None
+        self._bytecode_files: Dict[str, str] = {}
+        self._source_info: Optional[solidity_scanner.SourceInfo] = None
         self._lock = Lock()
 
+    def get_source_info(self) -> solidity_scanner.SourceInfo:
+        """Returns the contracts, pragma directives and imports of the file. Stored rows are not scanned again."""
+        if self._source_info is None:
+            if self.source_info:
+                self._source_info = solidity_scanner.SourceInfo.from_json(self.source_info)
+            else:
+                self._source_info = solidity_scanner.scan_file(self.path)
+        return self._source_info
+
     def __str__(self):
         return f'SolidityContract(path={self.path},name={self.name}, size={self.size})'
 
@@ -325,15 +383,10 @@ class SolidityContract(Contract):
             if no contract can be found in the file
         """
 
-        with open(self.path, encoding='utf-8') as f:
-            uncommented = '{}\n'.format(re.sub(r'\/\/.*$', '', f.read(), flags=re.MULTILINE))
-            uncommented = re.sub(r'/\*.*?\*/', ' ', uncommented, flags=re.DOTALL)
-
-            matcher = re.findall(r'\bcontract\b\s+(\w[\w\d]*)\b', uncommented)
-            if matcher:
-                return matcher[0]
-            else:
-                raise ValueError('Could not find the contract\'s name of {}'.format(self))
+        names = self.get_source_info().get_contract_names('contract')
+        if names:
+            return names[0]
+        raise ValueError('Could not find the contract\'s name of {}'.format(self))
 
     def _assign_contract_solcs_range(self) -> Tuple[semver.VersionInfo, semver.VersionInfo]:
         """extracts the minimal and maximal solidity compiler version allowed to compile the contract
@@ -352,39 +405,34 @@ class SolidityContract(Contract):
         NotImplementedError
             If the pragma directive is either invalid or there are several pragma directives but no solidity compiler version satisfying every directive.
         """
-        with open(self.path, encoding='utf-8') as f:
-            lines = f.readlines()
         min_version = semver.VersionInfo.parse('0.0.0')
         max_version = semver.VersionInfo.parse('99.99.99')
-        for line in lines:
-            version_regex = r'(?:<|>|<=|>=|==?|!=|\^)?\d\.\d+\.\d+\b'
-            if re.search(r'pragma\s+solidity\s+' + version_regex, line):
-                comparators = re.findall(version_regex, line)
-                for comparator in comparators:
-                    version = semver.VersionInfo.parse(re.findall(r'\d\.\d+\.\d+\b', comparator)[0])
-                    if re.search(r'<=', comparator):
-                        max_version = min(version, max_version)
-                    elif re.search(r'>=', comparator):
-                        min_version = max(version, min_version)
-                    elif re.search(r'<', comparator):
-                        if version.patch == 0:
-                            max_version = min(version.replace(minor=version.minor - 1, patch=99), max_version)
-                        else:
-                            max_version = min(version.replace(patch=version.patch - 1), max_version)
-                    elif re.search(r'>', comparator):
-                        if version.patch == 99:
-                            min_version = max(version.replace(minor=version.minor + 1, patch=0), min_version)
-                        else:
-                            min_version = max(version.replace(patch=version.patch + 1), min_version)
-                    elif re.search(r'!=', comparator):
-                        raise NotImplementedError('pragma version directive "!=" is not supported!')
-                    elif re.search(r'\^', comparator):
-                        min_version = max(version, min_version)
-                        max_version = min(version.replace(patch=99), max_version)
+        for pragma in self.get_source_info().pragmas:
+            for comparator, version in _version_comparator_regex.findall(pragma):
+                version = semver.VersionInfo.parse(version)
+                if comparator == '<=':
+                    max_version = min(version, max_version)
+                elif comparator == '>=':
+                    min_version = max(version, min_version)
+                elif comparator == '<':
+                    if version.patch == 0:
+                        max_version = min(version.replace(minor=version.minor - 1, patch=99), max_version)
+                    else:
+                        max_version = min(version.replace(patch=version.patch - 1), max_version)
+                elif comparator == '>':
+                    if version.patch == 99:
+                        min_version = max(version.replace(minor=version.minor + 1, patch=0), min_version)
                     else:
-                        # if there is =,== or no comparator before x.x.x:
-                        min_version = max(version, min_version)
-                        max_version = min(version, max_version)
+                        min_version = max(version.replace(patch=version.patch + 1), min_version)
+                elif comparator == '!=':
+                    raise NotImplementedError('pragma version directive "!=" is not supported!')
+                elif comparator == '^':
+                    min_version = max(version, min_version)
+                    max_version = min(version.replace(patch=99), max_version)
+                else:
+                    # if there is =,== or no comparator before x.x.x:
+                    min_version = max(version, min_version)
+                    max_version = min(version, max_version)
 
         if min_version > max_version:
             raise ValueError(
@@ -392,46 +440,64 @@ class SolidityContract(Contract):
         self.solc_from = str(min_version)
         self.solc_to = str(max_version)
 
-    # TODO: move to SolidityContract and change, eigenes dir
-    def get_bytecode_file(self) -> str:
-        """compiles a .sol-contract and stores the .bin results in output_dir
+    def get_bytecode_file(self, runtime=False) -> str:
+        """Returns the path to the bytecode of the contract compiled with the minimal allowed solidity compiler.
+
+        The bytecode is taken from the shared compilation cache, see <logic.compilation_cache>. The returned file must
+        not be modified.
+
         Parameters
         ----------
-        contract : Contract
-        output_dir : str
-            The path to the output directory
+        runtime : bool, default=False
+            Whether to return the runtime bytecode instead of the creation bytecode.
         """
+        extension = 'bin-runtime' if runtime else 'bin'
         with self._lock:
-            if not self.tmp_dir:
-                self.tmp_dir = tempfile.mkdtemp()
-                print(self.solc_from, self.solc_to)
+            if extension not in self._bytecode_files:
                 min_version, _ = get_range_for_installed_solcs(self.solc_from, self.solc_to)
-                subprocess.run(
-                    f'"{test_bed_path}/resources/solc-versions/{min_version}/solc" -o "{self.tmp_dir}" --bin "{self.path}"',
-                    shell=True
-                    , stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
-                )
-            bin_path = f'{self.tmp_dir}/{self.name}.bin'
-            if not os.path.exists(bin_path):
-                raise FileNotFoundError(
-                    f'{bin_path} should contain the compiled contract {self.name} from {self.filename} but does not. Used solc version: {min_version}')
+                self._bytecode_files[extension] = compilation_cache.get_bytecode_file(
+                    self.path, str(min_version), self.name, [extension])
+            bin_path = self._bytecode_files[extension]
             if os.path.getsize(bin_path) == 0:
                 raise ValueError(
-                    f'Compiling contract {self.name} in {self.filename} with solc-version {min_version} returned an empty bin file. '
+                    f'Compiling contract {self.name} in {self.filename} returned an empty bin file. '
                     f'A possible reason is that the contract is an interface or contains abstract methods.')
             return bin_path
 
 
 evaluations_security_issues = Table('evaluations_security_issues', Base.metadata,
                                     Column('evaluations_id', Integer, ForeignKey('evaluations.id')),
-                                    Column('security_issues_title', String, ForeignKey('security_issues.title')))
+                                    Column('security_issues_title', String, ForeignKey('security_issues.title')),
+                                    Index('ix_evaluations_security_issues_evaluations_id', 'evaluations_id'))
 
 evaluations_errors = Table('evaluations_errors', Base.metadata,
                            Column('evaluations_id', Integer, ForeignKey('evaluations.id')),
-                           Column('errors_title', String, ForeignKey('errors.title')))
+                           Column('errors_title', String, ForeignKey('errors.title')),
+                           Index('ix_evaluations_errors_evaluations_id', 'evaluations_id'))
 
 
 class Evaluation(Base):
+    """The stored result of testing a contract with a tool. Used as cache entry by <logic.result_cache>.
+
+    Attributes
+    ----------
+    contract_hash : String
+        The SHA-256 hash of the contract file's content.
+    contract_name : String
+        The name of the tested contract. Empty for bytecode contracts.
+    tool_digest : String
+        The ID of the tool's docker image.
+    used_solc : String
+        The version of the solidity compiler used by the tool. Empty if the tool did not use a compiler.
+    execution_time : Float
+        The execution time of the tool in secs.
+    output_dir : String
+        The directory containing the raw output files of the tool.
+    size : Integer
+        The total size of the files in <output_dir> in bytes.
+    created_at, last_used : Float
+        POSIX timestamps used for the eviction of the cache.
+    """
     __tablename__ = 'evaluations'
     id = Column(Integer, primary_key=True, autoincrement=True)
     solidity_contract_path = Column(String, ForeignKey('solidity_contracts.path'))
@@ -439,13 +505,180 @@ class Evaluation(Base):
     execution_time = Column(Float)
     report_file = Column(String)
     used_solc = Column(String)
+    contract_hash = Column(String)
+    contract_name = Column(String)
+    tool_digest = Column(String)
+    output_dir = Column(String)
+    size = Column(Integer)
+    created_at = Column(Float)
+    last_used = Column(Float)
     security_issues = relationship('SecurityIssue', secondary='evaluations_security_issues')
     errors = relationship('Error', secondary='evaluations_errors')
     solidity_contract = relationship('SolidityContract')
     tool = relationship('Tool')
 
+    __table_args__ = (
+        Index('ix_evaluations_key', 'contract_hash', 'contract_name', 'tool_name', 'tool_digest', 'used_solc'),
+        Index('ix_evaluations_last_used', 'last_used'),
+    )
+
+
+tool_outcomes_security_issues = Table('tool_outcomes_security_issues', Base.metadata,
+                                      Column('tool_outcomes_id', Integer, ForeignKey('tool_outcomes.id')),
+                                      Column('security_issues_title', String, ForeignKey('security_issues.title')),
+                                      Index('ix_tool_outcomes_security_issues_tool_outcomes_id', 'tool_outcomes_id'))
+
+tool_outcomes_errors = Table('tool_outcomes_errors', Base.metadata,
+                             Column('tool_outcomes_id', Integer, ForeignKey('tool_outcomes.id')),
+                             Column('errors_title', String, ForeignKey('errors.title')),
+                             Index('ix_tool_outcomes_errors_tool_outcomes_id', 'tool_outcomes_id'))
+
+
+class TestRunRecord(Base):
+    """A test-run started by the server. Stored by <logic.run_store>, so that its results survive restarts.
 
-Base.metadata.create_all(engine)
+    Attributes
+    ----------
+    id : String
+        A random UUID in hex format.
+    contract_path : String
+        The path to the contract inside <workspace>.
+    contract_name : String
+        The name of the tested contract. None for bytecode contracts.
+    tool_names : String
+        The comma-separated names of the tools.
+    workspace : String
+        The directory holding the contract and the reports of the test-run.
+    status : String
+        One of "Running", "Terminated", "Cancelled" and "Interrupted". Runs which were running when the server stopped
+        are interrupted.
+    created_at : Float
+        POSIX timestamp.
+    tool_outcomes
+        The <ToolOutcome>s of the tools which have finished.
+    """
+    __tablename__ = 'test_runs'
+    id = Column(String, primary_key=True)
+    contract_path = Column(String, nullable=False)
+    contract_name = Column(String)
+    tool_names = Column(String, nullable=False)
+    workspace = Column(String, nullable=False)
+    status = Column(String, nullable=False)
+    created_at = Column(Float, nullable=False)
+    tool_outcomes = relationship('ToolOutcome', cascade='all,delete,delete-orphan', backref='test_run',
+                                 lazy='subquery')
+
+    __table_args__ = (
+        Index('ix_test_runs_status', 'status'),
+        Index('ix_test_runs_created_at', 'created_at'),
+    )
+
+
+class ToolOutcome(Base):
+    """The outcome of a tool of a <TestRunRecord>.
+
+    Attributes
+    ----------
+    status : String
+        "Terminated" or "Failed".
+    execution_time : Float
+        The execution time of the tool in secs. None if the tool failed.
+    report_file : String
+        The path to the report of the tool inside the workspace of the test-run.
+    message : String
+        The reason why the tool failed.
+    """
+    __tablename__ = 'tool_outcomes'
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    test_run_id = Column(String, ForeignKey('test_runs.id'), nullable=False)
+    tool_name = Column(String, ForeignKey('tools.name'), nullable=False)
+    status = Column(String, nullable=False)
+    execution_time = Column(Float)
+    report_file = Column(String)
+    message = Column(String)
+    security_issues = relationship('SecurityIssue', secondary='tool_outcomes_security_issues', lazy='subquery')
+    errors = relationship('Error', secondary='tool_outcomes_errors', lazy='subquery')
+
+    __table_args__ = (
+        Index('ix_tool_outcomes_test_run_id', 'test_run_id'),
+    )
+
+
+class CatalogVersion(Base):
+    """The version of the catalog, i.e. of the tables of the tools, security issues, errors and their identifiers.
+
+    The single row is incremented by triggers on every change of a catalog table, so that <logic.catalog> notices
+    changes made by any process, e.g. by "cmd.py update" while the server runs.
+    """
+    __tablename__ = 'catalog_version'
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
+
+catalog_tables = ['tools', 'security_issues', 'errors', 'tool_security_issues', 'tool_errors']
+
+
+def _migrate_schema():
+    """Adds the columns and indexes which were introduced after the database had been created.
+
+    <create_all> only creates missing tables, but not missing columns or indexes of existing tables.
+    """
+    inspector = inspect(engine)
+    with engine.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            existing_columns = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing_columns:
+                    column_type = column.type.compile(engine.dialect)
+                    connection.execute(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}')
+    for table in Base.metadata.sorted_tables:
+        existing_indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing_indexes:
+                index.create(engine)
+
+
+def _create_catalog_triggers():
+    with engine.begin() as connection:
+        if connection.execute('SELECT COUNT(*) FROM catalog_version').scalar() == 0:
+            connection.execute('INSERT INTO catalog_version (id, version) VALUES (1, 0)')
+        for table in catalog_tables:
+            for operation in ('INSERT', 'UPDATE', 'DELETE'):
+                connection.execute(f'CREATE TRIGGER IF NOT EXISTS {table}_{operation.lower()}_bumps_catalog_version '
+                                   f'AFTER {operation} ON {table} '
+                                   'BEGIN UPDATE catalog_version SET version = version + 1 WHERE id = 1; END')
+
+
+def _get_schema_fingerprint() -> int:
+    """Returns a hash of the tables, columns, indexes and triggers defined by this module, which fits into the
+    user_version of SQLite."""
+    description = [f'triggers:{",".join(catalog_tables)}']
+    for table in Base.metadata.sorted_tables:
+        description.append(f'table:{table.name}')
+        description += [f'column:{column.name}:{column.type}:{column.nullable}' for column in table.columns]
+        description += sorted(f'index:{index.name}:{",".join(column.name for column in index.columns)}'
+                              for index in table.indexes)
+    return int(hashlib.sha256('\n'.join(description).encode('utf-8')).hexdigest()[:7], 16)
+
+
+def _ensure_schema():
+    """Creates and migrates the schema, unless the database has already been migrated to the current schema.
+
+    The fingerprint of the schema is stored as user_version of the database after a migration, so that importing
+    this module does not inspect the schema of an up-to-date database.
+    """
+    fingerprint = _get_schema_fingerprint()
+    with engine.connect() as connection:
+        if connection.execute('PRAGMA user_version').scalar() == fingerprint:
+            return
+    Base.metadata.create_all(engine)
+    _migrate_schema()
+    _create_catalog_triggers()
+    with engine.connect() as connection:
+        connection.execute(f'PRAGMA user_version = {fingerprint}')
+
+
+_ensure_schema()
 session_factory = sessionmaker(bind=engine)
 Session = scoped_session(session_factory)
 
@@ -455,10 +688,30 @@ def get_db_session() -> Session:
     return Session()
 
 
+def remove_db_session():
+    """Closes the session of the current thread. Must be called when a request or a job of a reused thread ends."""
+    Session.remove()
+
+
 def get_error(error_title) -> Error:
     return get_db_session().query(Error).filter(Error.title == error_title).one()
 
 
+def get_or_create_error(error_title, description=None) -> Error:
+    """Returns the error with the title. Creates it as an error of the testbed if it does not exist."""
+    sess = get_db_session()
+    error = sess.query(Error).filter(Error.title == error_title).first()
+    if error is None:
+        try:
+            sess.add(Error(title=error_title, description=description, testbed_level=True))
+            sess.commit()
+        except IntegrityError:
+            # created by another thread meanwhile
+            sess.rollback()
+        error = sess.query(Error).filter(Error.title == error_title).one()
+    return error
+
+
 def get_tools(tool_names: Union[Optional[List[str]], str] = 'all') -> List[Tool]:
     """
 
@@ -470,11 +723,12 @@ def get_tools(tool_names: Union[Optional[List[str]], str] = 'all') -> List[Tool]
     Returns
     -------
     List[Tool]
+        The tools of the current catalog snapshot, sorted by name. They must not be modified.
     """
-    if tool_names == 'all':
-        return get_db_session().query(Tool).order_by(Tool.name).all()
-    else:
-        return get_db_session().query(Tool).filter(Tool.name.in_(tool_names)).order_by(Tool.name).all()
+    # the tools are read from the catalog snapshot, which imports this module
+    from logic import catalog
+
+    return catalog.get().get_tools(tool_names)
 
 
 def tools_to_tool_names(tools: Iterator[Tool]):
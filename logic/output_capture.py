@@ -0,0 +1,86 @@
+from collections import deque
+from typing import Deque, Optional
+
+"""
+    Summary
+    -------
+    Captures the output of the tools with a bounded size.
+    If the output of a command exceeds the maximal size, only its head and its tail are kept, separated by a marker
+    stating the number of dropped bytes. The tail is kept in memory until the output is closed, so a capture holds
+    about half of its maximal size in memory at most.
+"""
+
+# the maximal size of the output of a command in bytes, unless its tool sets <Tool.max_output_size>
+default_max_size = 32 * 1024 ** 2
+truncation_marker = '\n[... {} bytes of output truncated by the testbed ...]\n'
+
+
+def configure(default_max_size_mb: float = None):
+    global default_max_size
+    if default_max_size_mb is not None:
+        default_max_size = int(default_max_size_mb * 1024 ** 2)
+
+
+class CappedOutput:
+    """A binary file which keeps the head and the tail of the output written to it.
+
+    Parameters
+    ----------
+    path : str
+    max_size : int, optional
+        The maximal number of bytes of the output kept in the file, not counting the truncation marker. The first and
+        the second half are taken from the head and the tail of the output. Unbounded if None.
+
+    Attributes
+    ----------
+    truncated : int
+        The number of bytes which have been dropped.
+    """
+
+    def __init__(self, path: str, max_size: Optional[int] = None):
+        self._file = open(path, 'wb')
+        self._head_size = max_size // 2 if max_size is not None else None
+        self._tail_size = max_size - self._head_size if max_size is not None else None
+        self._written = 0
+        self._tail: Deque[bytes] = deque()
+        self._tail_length = 0
+        self.truncated = 0
+
+    def write(self, data: bytes) -> int:
+        if self._head_size is None:
+            return self._file.write(data)
+        length = len(data)
+        if self._written < self._head_size:
+            head = data[:self._head_size - self._written]
+            self._file.write(head)
+            self._written += len(head)
+            data = data[len(head):]
+        if data:
+            self._tail.append(data)
+            self._tail_length += len(data)
+            while self._tail_length > self._tail_size:
+                overflow = self._tail_length - self._tail_size
+                if len(self._tail[0]) <= overflow:
+                    dropped = self._tail.popleft()
+                    overflow = len(dropped)
+                else:
+                    self._tail[0] = self._tail[0][overflow:]
+                self._tail_length -= overflow
+                self.truncated += overflow
+        return length
+
+    def close(self):
+        if self._file.closed:
+            return
+        if self.truncated:
+            self._file.write(truncation_marker.format(self.truncated).encode('utf-8'))
+        for chunk in self._tail:
+            self._file.write(chunk)
+        self._tail.clear()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -0,0 +1,139 @@
+import csv
+import re
+from typing import Dict, Iterable, List, TextIO, Tuple
+
+from sqlalchemy import and_, bindparam
+from sqlalchemy.orm import Session
+
+from logic.orm import SecurityIssue, Error, ToolSecurityIssue, ToolError
+
+"""
+    Summary
+    -------
+    Imports and exports the identifiers with which the security issues and errors are found in the output of a tool.
+    The identifiers are kept in CSV files with the title in the first and the identifier in the second column. A file
+    is validated as a whole against the known titles before anything is written, and its new identifiers are inserted
+    with a single statement, so that large files are imported in one transaction.
+"""
+
+# the maximal number of problems listed when a file is rejected
+max_listed_problems = 20
+
+
+class PatternDiff:
+    """The difference between the identifiers of a tool in the database and those of an imported file.
+
+    Attributes
+    ----------
+    added : List[Tuple[str, str]]
+        The titles and identifiers which are in the file, but were not in the database.
+    removed : List[Tuple[str, str]]
+        The titles and identifiers which are in the database, but not in the file. They have only been deleted if the
+        import replaced the identifiers of the tool.
+    unchanged : List[Tuple[str, str]]
+        The titles and identifiers which are both in the database and in the file.
+    replaced : bool
+        Whether the removed identifiers have been deleted.
+    """
+
+    def __init__(self, added: List[Tuple[str, str]], removed: List[Tuple[str, str]],
+                 unchanged: List[Tuple[str, str]], replaced: bool):
+        self.added = added
+        self.removed = removed
+        self.unchanged = unchanged
+        self.replaced = replaced
+
+    def __str__(self):
+        lines = [f'{len(self.added)} added, {len(self.removed)} {"removed" if self.replaced else "not in the file"}, '
+                 f'{len(self.unchanged)} unchanged.']
+        lines += [f'+ {title}: {identifier}' for title, identifier in self.added]
+        lines += [f'{"-" if self.replaced else "?"} {title}: {identifier}' for title, identifier in self.removed]
+        return '\n'.join(lines)
+
+
+def read_csv(path: str) -> List[Tuple[str, str]]:
+    """Returns the titles and identifiers of the file. A missing identifier is read as an empty one."""
+    with open(path, encoding='utf-8', newline='') as f:
+        return [(row[0], row[1] if len(row) > 1 else '') for row in csv.reader(f) if row and row[0]]
+
+
+def import_csv(path: str, tool_name: str, security_issues: bool, sess: Session, replace=False) -> PatternDiff:
+    """Imports the identifiers of the file. See <import_patterns>."""
+    return import_patterns(read_csv(path), tool_name, security_issues, sess, replace)
+
+
+def import_patterns(patterns: Iterable[Tuple[str, str]], tool_name: str, security_issues: bool, sess: Session,
+                    replace=False) -> PatternDiff:
+    """Adds the identifiers of the security issues or errors of the tool which are not in the database yet.
+
+    Nothing is written if a title is unknown or an identifier is not a valid regular expression. The changes are not
+    committed.
+
+    Parameters
+    ----------
+    patterns : Iterable[Tuple[str, str]]
+        The titles and identifiers.
+    tool_name : str
+    security_issues : bool
+        Whether the patterns identify security issues or errors.
+    sess : Session
+    replace : bool, default=False
+        Whether the identifiers of the tool which are not in <patterns> are deleted.
+
+    Raises
+    ------
+    ValueError
+        If the patterns are invalid.
+    """
+    model, title_column = (ToolSecurityIssue, 'security_issue_title') if security_issues else (ToolError, 'error_title')
+    table = model.__table__
+    patterns = list(dict.fromkeys(patterns))
+    _validate(patterns, security_issues, sess)
+
+    existing = {tuple(row) for row in
+                sess.query(getattr(model, title_column), model.identifier).filter(model.tool_name == tool_name)}
+    added = [pattern for pattern in patterns if pattern not in existing]
+    removed = sorted(existing.difference(patterns))
+    unchanged = [pattern for pattern in patterns if pattern in existing]
+    if added:
+        sess.execute(table.insert(), [{'tool_name': tool_name, title_column: title, 'identifier': identifier}
+                                      for title, identifier in added])
+    if replace and removed:
+        sess.execute(table.delete().where(and_(table.c.tool_name == bindparam('b_tool_name'),
+                                               table.c[title_column] == bindparam('b_title'),
+                                               table.c.identifier == bindparam('b_identifier'))),
+                     [{'b_tool_name': tool_name, 'b_title': title, 'b_identifier': identifier}
+                      for title, identifier in removed])
+    return PatternDiff(added, removed, unchanged, replace)
+
+
+def export_patterns(tool_name: str, security_issues: bool, out: TextIO, sess: Session) -> int:
+    """Writes the identifiers of the security issues or errors of the tool as CSV. Returns the number of rows.
+
+    The rows are sorted, so that exports of the same identifiers are identical.
+    """
+    model, title_column = (ToolSecurityIssue, 'security_issue_title') if security_issues else (ToolError, 'error_title')
+    rows = sess.query(getattr(model, title_column), model.identifier).filter(model.tool_name == tool_name) \
+        .order_by(getattr(model, title_column), model.identifier).all()
+    writer = csv.writer(out, lineterminator='\n')
+    writer.writerows(rows)
+    return len(rows)
+
+
+def _validate(patterns: List[Tuple[str, str]], security_issues: bool, sess: Session):
+    known_titles = {title for title, in sess.query(SecurityIssue.title if security_issues else Error.title)}
+    problems = []
+    unknown_titles: Dict[str, None] = dict.fromkeys(title for title, _ in patterns if title not in known_titles)
+    for title in unknown_titles:
+        problems.append(f'The {"security issue" if security_issues else "error"} "{title}" must be added to the '
+                        f'"{"security_issues" if security_issues else "errors"}" table first.')
+    for title, identifier in patterns:
+        try:
+            re.compile(identifier)
+        except re.error as e:
+            problems.append(f'The identifier "{identifier}" of "{title}" is not a valid regular expression: {e}')
+    if problems:
+        listed = problems[:max_listed_problems]
+        if len(problems) > len(listed):
+            listed.append(f'... and {len(problems) - len(listed)} more problems.')
+        raise ValueError('\n'.join(listed))
@@ -0,0 +1,192 @@
+import hashlib
+import os
+import shutil
+import subprocess
+import time
+import uuid
+from datetime import timedelta
+from threading import Lock
+from typing import Dict, Optional, Tuple
+
+from logic import solidity_scanner
+from logic.db_writer import get_writer
+from logic.orm import Evaluation, SecurityIssue, Error, get_db_session
+from toolbox import test_bed_path
+
+"""
+    Summary
+    -------
+    A persistent cache for the results of tool test-runs.
+    An entry is keyed by the content hash and name of the contract, the tool's name, the ID of the tool's docker image
+    and the used solidity compiler. The content hash of a solidity contract covers the files it imports, so that a
+    change of an imported file invalidates the entry. It stores the raw output files of the tool, the security issues
+    and errors identified in them and the execution time. Entries are stored as rows of the <Evaluation> table.
+"""
+
+cache_dir = f'{test_bed_path}/resources/result-cache'
+
+enabled = True
+max_age = timedelta(days=30)
+max_size = 1024 ** 3
+
+_image_ids: Dict[str, Tuple[float, Optional[str]]] = {}
+_image_ids_lock = Lock()
+_image_id_ttl = 10 * 60
+
+
+def configure(enable: bool = None, max_age_days: float = None, max_size_mb: float = None):
+    global enabled, max_age, max_size
+    if enable is not None:
+        enabled = enable
+    if max_age_days is not None:
+        max_age = timedelta(days=max_age_days)
+    if max_size_mb is not None:
+        max_size = int(max_size_mb * 1024 ** 2)
+
+
+def hash_file(path: str) -> str:
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 ** 2), b''):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def hash_contract(path: str) -> str:
+    """Returns the hash of the contract file together with the files it imports transitively.
+
+    The hash of a contract without imports is the hash of its file.
+    """
+    paths = solidity_scanner.get_imported_files(path)
+    if len(paths) == 1:
+        return hash_file(path)
+    sha256 = hashlib.sha256()
+    contract_dir = os.path.dirname(paths[0])
+    for imported_path in paths:
+        sha256.update(f'{os.path.relpath(imported_path, contract_dir)}\0{hash_file(imported_path)}\n'.encode())
+    return sha256.hexdigest()
+
+
+def get_image_id(docker_image: str) -> Optional[str]:
+    """Returns the ID of the local docker image or None if docker cannot inspect the image.
+
+    The IDs are remembered for some minutes, so that pulling a new version of an image invalidates the cache entries
+    of the tool shortly afterwards.
+    """
+    with _image_ids_lock:
+        if docker_image in _image_ids and time.time() - _image_ids[docker_image][0] < _image_id_ttl:
+            return _image_ids[docker_image][1]
+    try:
+        result = subprocess.run(['sudo', 'docker', 'image', 'inspect', '--format', '{{.Id}}', docker_image],
+                                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, timeout=30)
+        image_id = result.stdout.decode().strip() if result.returncode == 0 else None
+    except (OSError, subprocess.TimeoutExpired):
+        image_id = None
+    with _image_ids_lock:
+        _image_ids[docker_image] = (time.time(), image_id or None)
+    return image_id or None
+
+
+def get_key(tool_test_run) -> Optional[Dict[str, str]]:
+    """Returns the cache key of the tool test-run or None if the test-run cannot be cached."""
+    docker_image = getattr(tool_test_run, 'docker_image', None)
+    if not enabled or not docker_image:
+        return None
+    tool_digest = get_image_id(docker_image)
+    if not tool_digest:
+        return None
+    contract = tool_test_run._contract
+    used_solc = getattr(tool_test_run, 'used_solc', None)
+    return {
+        'contract_hash': hash_contract(contract.path),
+        'contract_name': getattr(contract, 'name', None) or '',
+        'tool_name': tool_test_run._tool.name,
+        'tool_digest': tool_digest,
+        'used_solc': os.path.basename(used_solc) if used_solc else '',
+    }
+
+
+def lookup(key: Dict[str, str]) -> Optional[Evaluation]:
+    """Returns the cache entry for the key and marks it as recently used. Returns None on a cache miss."""
+    sess = get_db_session()
+    evaluation = sess.query(Evaluation).filter_by(**key).order_by(Evaluation.last_used.desc()).first()
+    if evaluation is None:
+        return None
+    evaluation_id = evaluation.id
+    if time.time() - (evaluation.created_at or 0) > max_age.total_seconds() \
+            or not evaluation.output_dir or not os.path.isdir(evaluation.output_dir):
+        get_writer().submit(lambda writer_sess: _delete_by_id(writer_sess, evaluation_id))
+        return None
+    now = time.time()
+    get_writer().submit(lambda writer_sess: writer_sess.query(Evaluation).filter(Evaluation.id == evaluation_id)
+                        .update({'last_used': now}))
+    return evaluation
+
+
+def store(key: Dict[str, str], output_files: Dict[str, Optional[str]], security_issues, errors,
+          execution_time: timedelta, contract_path: str = None):
+    """Copies the output files into the cache and adds an entry for the key. Evicts old entries afterwards.
+
+    The entry is written by the database writer, so it may not be found right after this call.
+    """
+    output_dir = f'{cache_dir}/{uuid.uuid4().hex}'
+    os.makedirs(output_dir)
+    size = 0
+    for name, path in output_files.items():
+        if path and os.path.isfile(path):
+            shutil.copyfile(path, f'{output_dir}/{name}')
+            size += os.path.getsize(path)
+    security_issue_titles = [issue.title for issue in security_issues]
+    error_titles = [error.title for error in errors]
+    now = time.time()
+
+    def write(sess):
+        evaluation = Evaluation(solidity_contract_path=contract_path, execution_time=execution_time.total_seconds(),
+                                created_at=now, last_used=now, size=size, output_dir=output_dir, **key)
+        evaluation.security_issues = sess.query(SecurityIssue).filter(
+            SecurityIssue.title.in_(security_issue_titles)).all()
+        evaluation.errors = sess.query(Error).filter(Error.title.in_(error_titles)).all()
+        for outdated in sess.query(Evaluation).filter_by(**key):
+            _delete(sess, outdated)
+        sess.add(evaluation)
+        _evict(sess)
+
+    get_writer().submit(write)
+
+
+def restore(evaluation: Evaluation, name: str, path: str) -> bool:
+    """Copies the cached output file <name> to <path>. Returns False if the entry does not contain the file."""
+    cached_file = f'{evaluation.output_dir}/{name}'
+    if not os.path.isfile(cached_file):
+        return False
+    shutil.copyfile(cached_file, path)
+    return True
+
+
+def evict():
+    """Deletes entries older than <max_age> and the least recently used entries exceeding <max_size>."""
+    get_writer().submit(_evict).result()
+
+
+def _evict(sess):
+    for evaluation in sess.query(Evaluation).filter(Evaluation.created_at < time.time() - max_age.total_seconds()):
+        _delete(sess, evaluation)
+    sess.flush()
+    total_size = 0
+    for evaluation in sess.query(Evaluation).filter(Evaluation.output_dir != None) \
+            .order_by(Evaluation.last_used.desc()):
+        total_size += evaluation.size or 0
+        if total_size > max_size:
+            _delete(sess, evaluation)
+
+
+def _delete(sess, evaluation: Evaluation):
+    if evaluation.output_dir:
+        shutil.rmtree(evaluation.output_dir, ignore_errors=True)
+    sess.delete(evaluation)
+
+
+def _delete_by_id(sess, evaluation_id: int):
+    evaluation = sess.query(Evaluation).get(evaluation_id)
+    if evaluation is not None:
+        _delete(sess, evaluation)
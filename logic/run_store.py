@@ -0,0 +1,344 @@
+import gzip
+import os
+import shutil
+import time
+import uuid
+import zipfile
+from datetime import timedelta
+from threading import Lock, Thread, Event
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from logic import catalog, compilation_cache
+from logic.db_writer import get_writer
+from logic.orm import TestRunRecord, ToolOutcome, Tool, SecurityIssue, Error, Contract, SolidityContract, \
+    get_db_session, remove_db_session
+from logic.test_runner import TestRun
+from logic.tools.tool_test_run import ToolTestRun
+from toolbox import test_bed_path
+
+"""
+    Summary
+    -------
+    Persists the test-runs of the server in the database, so that their results survive restarts.
+    Every test-run gets a random ID and a workspace directory holding its contract and the reports of its tools. The
+    report of a tool is written to the workspace as soon as the tool terminates and the archive of all reports as soon
+    as the test-run is done. Both are written by threads of the store, so that they do not occupy execution slots of
+    the scheduler. The test-runs which are still running are additionally kept in memory. Test-runs older
+    than <max_age> are deleted by a background sweeper.
+"""
+
+runs_dir = f'{test_bed_path}/resources/runs'
+
+
+class OverloadError(Exception):
+    pass
+
+
+class StoredToolTestRun:
+    """The outcome of a tool of a restored test-run. Provides the parts of <ToolTestRun> used to display results."""
+
+    def __init__(self, outcome: Optional[ToolOutcome]):
+        self._status = outcome.status if outcome else 'Interrupted'
+        self._execution_time = timedelta(seconds=outcome.execution_time) \
+            if outcome and outcome.execution_time is not None else None
+        self._report_file = outcome.report_file if outcome else None
+        self._security_issues = sorted(outcome.security_issues, key=lambda s: s.title) if outcome else []
+        self._errors = sorted(outcome.errors, key=lambda e: e.title) if outcome else []
+
+    def get_status(self) -> str:
+        return self._status
+
+    def get_terminated(self) -> bool:
+        return self._status == 'Terminated'
+
+    def get_queue_position(self) -> Optional[int]:
+        return None
+
+    def get_execution_time(self) -> timedelta:
+        return self._execution_time
+
+    def get_security_issues(self) -> List[SecurityIssue]:
+        return self._security_issues
+
+    def get_errors(self) -> List[Error]:
+        return self._errors
+
+    def get_report(self) -> str:
+        if not self._report_file or not os.path.isfile(self._report_file):
+            raise FileNotFoundError(f'The report {self._report_file} does not exist.')
+        return self._report_file
+
+
+class RestoredTestRun(TestRun):
+    """A finished or interrupted test-run loaded from the database. It cannot be run again."""
+
+    def __init__(self, record: TestRunRecord, tools: List[Tool]):
+        super().__init__(_create_contract(record.contract_path, record.contract_name), tools)
+        self._status = record.status
+        self._started = True
+        outcomes = {outcome.tool_name: outcome for outcome in record.tool_outcomes}
+        for tool in tools:
+            self._tool_test_runs[tool] = StoredToolTestRun(outcomes.get(tool.name))
+            self._finished_tools.append(tool)
+            self._update_statuses(tool)
+
+    def run(self):
+        raise PermissionError(f'Cannot run the restored test-run of {self._contract} again.')
+
+    def cancel(self):
+        pass
+
+    def get_status(self) -> str:
+        return self._status
+
+
+def _create_contract(path: str, name: Optional[str]) -> Contract:
+    if os.path.splitext(path)[1] in SolidityContract.file_extensions:
+        return SolidityContract(path, name=name)
+    return Contract(path)
+
+
+class RunStore:
+    """Stores the test-runs of the server.
+
+    Parameters
+    ----------
+    allowed_active_test_runs : int, default=10
+        The maximal number of test-runs running at the same time.
+    max_age : timedelta, default=1 day
+        The age after which finished test-runs and their workspaces are deleted.
+    compress_reports : bool, default=True
+        Whether the reports are stored gzip-compressed.
+    abandon_after : timedelta, optional
+        The time after which running test-runs which have not been accessed are cancelled by the sweeper. Running
+        test-runs are never cancelled if None.
+    """
+
+    def __init__(self, allowed_active_test_runs=10, max_age=timedelta(days=1), compress_reports=True,
+                 abandon_after: Optional[timedelta] = None):
+        self.allowed_active_test_runs = allowed_active_test_runs
+        self.max_age = max_age
+        self.compress_reports = compress_reports
+        self.abandon_after = abandon_after
+        self._active: Dict[str, TestRun] = {}
+        self._last_access: Dict[str, float] = {}
+        # the number of tools per running test-run whose outcomes have not been submitted yet and the submitted writes
+        self._remaining_tools: Dict[str, int] = {}
+        self._writes: Dict[str, List[Future]] = {}
+        self._lock = Lock()
+        self._archive_lock = Lock()
+        # writes the reports and archives, the tools finish on the threads of the scheduler
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='testbed-run-store')
+        self._sweeper: Optional[Thread] = None
+        self._stop = Event()
+
+    def create_workspace(self) -> Tuple[str, str]:
+        """Returns a new run ID and the empty workspace directory of the run."""
+        run_id = uuid.uuid4().hex
+        workspace = f'{runs_dir}/{run_id}'
+        os.makedirs(workspace)
+        return run_id, workspace
+
+    def put(self, run_id: str, workspace: str, test_run: TestRun):
+        """Stores the test-run before it is run. Its outcomes are stored as soon as its tools finish.
+
+        Raises
+        ------
+        OverloadError
+            If <allowed_active_test_runs> test-runs are already running.
+        """
+        contract = test_run._contract
+        record = TestRunRecord(id=run_id, contract_path=contract.path, contract_name=getattr(contract, 'name', None),
+                               tool_names=','.join(tool.name for tool in test_run._tools), workspace=workspace,
+                               status='Running', created_at=time.time())
+        sess = get_db_session()
+        with self._lock:
+            if sess.query(TestRunRecord).filter(TestRunRecord.status == 'Running').count() \
+                    >= self.allowed_active_test_runs:
+                raise OverloadError
+            sess.add(record)
+            sess.commit()
+            self._active[run_id] = test_run
+            self._last_access[run_id] = time.monotonic()
+            self._remaining_tools[run_id] = len(test_run._tools)
+            self._writes[run_id] = []
+        test_run.add_done_callback(lambda tool, tool_test_run: self._executor.submit(
+            self.__persist, run_id, workspace, test_run, tool, tool_test_run))
+
+    def get(self, run_id: str) -> TestRun:
+        """Returns the test-run with the ID.
+
+        Raises
+        ------
+        KeyError
+            If there is no such test-run or its workspace has been deleted.
+        """
+        with self._lock:
+            if run_id in self._active:
+                self._last_access[run_id] = time.monotonic()
+                return self._active[run_id]
+        sess = get_db_session()
+        record = sess.query(TestRunRecord).get(run_id)
+        if record is None or not os.path.isfile(record.contract_path):
+            raise KeyError(run_id)
+        return RestoredTestRun(record, catalog.get().get_tools(record.tool_names.split(',')))
+
+    def __persist(self, run_id: str, workspace: str, test_run: TestRun, tool: Tool, tool_test_run: ToolTestRun):
+        try:
+            self.__on_tool_done(run_id, workspace, test_run, tool, tool_test_run)
+        except Exception as e:
+            print(f'Could not store the outcome of {tool.name} for {run_id}: {e}')
+        finally:
+            remove_db_session()
+
+    def __on_tool_done(self, run_id: str, workspace: str, test_run: TestRun, tool: Tool,
+                       tool_test_run: ToolTestRun):
+        exception = tool_test_run.get_future().exception()
+        report_file = None
+        if not exception:
+            report_file = f'{workspace}/{tool.name}.txt' + ('.gz' if self.compress_reports else '')
+            try:
+                tool_test_run.save_report(report_file, self.compress_reports)
+            except Exception as e:
+                print(f'Could not save the report of {tool.name} for {run_id}: {e}')
+                report_file = None
+
+        def write(sess):
+            outcome = ToolOutcome(test_run_id=run_id, tool_name=tool.name)
+            if exception:
+                outcome.status = 'Failed'
+                outcome.message = str(exception)
+            else:
+                outcome.status = 'Terminated'
+                outcome.execution_time = tool_test_run.get_execution_time().total_seconds()
+                outcome.report_file = report_file
+                outcome.security_issues = sess.query(SecurityIssue).filter(SecurityIssue.title.in_(
+                    [issue.title for issue in tool_test_run.get_security_issues()])).all()
+                outcome.errors = sess.query(Error).filter(
+                    Error.title.in_([error.title for error in tool_test_run.get_errors()])).all()
+            sess.add(outcome)
+
+        written = get_writer().submit(write)
+        # the tools may finish at the same time on several threads, only the last one finishes the test-run
+        with self._lock:
+            self._writes[run_id].append(written)
+            self._remaining_tools[run_id] -= 1
+            if self._remaining_tools[run_id] > 0:
+                return
+            del self._remaining_tools[run_id]
+            writes = self._writes.pop(run_id)
+        try:
+            # the archive is made of the written outcomes
+            for written in writes:
+                try:
+                    written.result()
+                except Exception as e:
+                    print(f'Could not store an outcome of {run_id}: {e}')
+            get_writer().submit(lambda sess: sess.query(TestRunRecord).filter(TestRunRecord.id == run_id).update(
+                {'status': test_run.get_status()})).result()
+            self.get_archive(run_id)
+        except Exception as e:
+            print(f'Could not archive the reports of {run_id}: {e}')
+        finally:
+            with self._lock:
+                self._active.pop(run_id, None)
+                self._last_access.pop(run_id, None)
+
+    def touch(self, run_id: str):
+        """Marks the running test-run as accessed, e.g. by a client waiting for its changes."""
+        with self._lock:
+            if run_id in self._last_access:
+                self._last_access[run_id] = time.monotonic()
+
+    def cancel(self, run_id: str):
+        """Cancels the test-run if it is running. See <TestRun.cancel>."""
+        with self._lock:
+            test_run = self._active.get(run_id)
+        if test_run is not None:
+            test_run.cancel()
+
+    def get_report_file(self, run_id: str, tool_name: str) -> Optional[str]:
+        """Returns the path to the stored report of the tool or None if it has not been stored (yet).
+
+        The path ends with ".gz" if the report is compressed.
+        """
+        outcome = get_db_session().query(ToolOutcome).filter(ToolOutcome.test_run_id == run_id,
+                                                             ToolOutcome.tool_name == tool_name).first()
+        if outcome is None or not outcome.report_file or not os.path.isfile(outcome.report_file):
+            return None
+        return outcome.report_file
+
+    def get_archive(self, run_id: str) -> str:
+        """Returns the path to a zip archive of all reports of the finished test-run. Creates it on first use.
+
+        Raises
+        ------
+        KeyError
+            If there is no such test-run.
+        RuntimeError
+            If the test-run is still running.
+        """
+        sess = get_db_session()
+        record = sess.query(TestRunRecord).get(run_id)
+        if record is None:
+            raise KeyError(run_id)
+        if record.status == 'Running':
+            raise RuntimeError(f'The test-run {run_id} is still running.')
+        archive = f'{record.workspace}/reports.zip'
+        with self._archive_lock:
+            if os.path.isfile(archive):
+                return archive
+            # the archive is written under another name first, so that it is never served incompletely
+            tmp_archive = f'{archive}.tmp'
+            with zipfile.ZipFile(tmp_archive, 'w', compression=zipfile.ZIP_DEFLATED) as zip_file:
+                for outcome in sorted(record.tool_outcomes, key=lambda o: o.tool_name):
+                    if not outcome.report_file or not os.path.isfile(outcome.report_file):
+                        continue
+                    with (gzip.open if outcome.report_file.endswith('.gz') else open)(outcome.report_file, 'rb') as f, \
+                            zip_file.open(f'{outcome.tool_name}.txt', 'w') as member:
+                        shutil.copyfileobj(f, member, 1024 ** 2)
+            os.replace(tmp_archive, archive)
+        return archive
+
+    def recover(self):
+        """Marks the test-runs which were running when the server stopped as interrupted."""
+        sess = get_db_session()
+        sess.query(TestRunRecord).filter(TestRunRecord.status == 'Running').update({'status': 'Interrupted'})
+        sess.commit()
+
+    def sweep(self):
+        """Deletes the finished test-runs older than <max_age> and their workspaces and cancels abandoned test-runs."""
+        if self.abandon_after is not None:
+            with self._lock:
+                abandoned = [run_id for run_id, last_access in self._last_access.items()
+                             if time.monotonic() - last_access > self.abandon_after.total_seconds()]
+            for run_id in abandoned:
+                print(f'Cancelling the abandoned test-run {run_id}.')
+                self.cancel(run_id)
+        sess = get_db_session()
+        expired = sess.query(TestRunRecord).filter(
+            TestRunRecord.status != 'Running', TestRunRecord.created_at < time.time() - self.max_age.total_seconds())
+        for record in expired:
+            shutil.rmtree(record.workspace, ignore_errors=True)
+            sess.delete(record)
+        sess.commit()
+
+    def start_sweeper(self, interval: float = 10 * 60):
+        """Sweeps every <interval> secs. on a background thread."""
+        if self._sweeper is not None:
+            return
+
+        def sweep_periodically():
+            while not self._stop.wait(interval):
+                try:
+                    self.sweep()
+                except Exception as e:
+                    print(f'Could not sweep the test-runs: {e}')
+                print(compilation_cache.format_stats())
+
+        self._sweeper = Thread(target=sweep_periodically, name='testbed-run-sweeper', daemon=True)
+        self._sweeper.start()
+
+    def stop_sweeper(self):
+        self._stop.set()
@@ -0,0 +1,250 @@
+import os
+import time
+from collections import deque
+from threading import Condition, Lock, Thread
+from typing import Callable, Deque, Dict, List, Optional
+
+"""
+    Summary
+    -------
+    Provides the process-wide scheduler which executes the tool test-runs.
+    The scheduler owns a fixed number of execution slots, one per CPU core it may use, and optionally a memory budget.
+    A job occupies as many slots as the CPU cores it is expected to use. Jobs which do not fit wait in a FIFO queue.
+    A later job may start before the first queued job (backfilling) if it fits into the free resources and is
+    expected to finish before enough resources for the first job become free, so that the first job is not delayed
+    by the jobs overtaking it.
+"""
+
+
+class Job:
+    """A unit of work waiting for or occupying an execution slot.
+
+    Attributes
+    ----------
+    target : Callable[[], None]
+        The function executed on the worker thread.
+    name : str
+        A human-readable name of the job.
+    on_start : Callable[[], None], optional
+        Called on the worker thread right before <target>.
+    on_cancel : Callable[[], None], optional
+        Called on the thread of the scheduler resolving cancelled jobs if the job is cancelled while queued.
+    cpus : int, default=1
+        The number of execution slots the job occupies. Jobs needing more slots than the scheduler has occupy all.
+    memory_mb : int, default=0
+        The memory the job is expected to use. Only limits the jobs of schedulers with a memory budget.
+    duration : float, optional
+        The typical number of secs the job runs. Jobs without a duration are never started ahead of others.
+    """
+
+    def __init__(self, target: Callable[[], None], name: str = 'job', on_start: Optional[Callable[[], None]] = None,
+                 cpus=1, memory_mb=0, duration: Optional[float] = None,
+                 on_cancel: Optional[Callable[[], None]] = None):
+        self.target = target
+        self.name = name
+        self.on_start = on_start
+        self.on_cancel = on_cancel
+        self.cpus = max(1, cpus)
+        self.memory_mb = memory_mb
+        self.duration = duration
+
+    def __str__(self):
+        return f'Job(name={self.name})'
+
+
+class Scheduler:
+    """Executes jobs on a bounded number of worker threads.
+
+    Parameters
+    ----------
+    slots : int
+        The number of execution slots, i.e. of CPU cores the running jobs may use together.
+    memory_mb : int, optional
+        The memory the running jobs may use together. Unlimited if None. A job needing more memory runs alone.
+    """
+
+    def __init__(self, slots: int, memory_mb: Optional[int] = None):
+        if slots < 1:
+            raise ValueError('A scheduler needs at least one execution slot.')
+        self._slots = slots
+        self.memory_mb = memory_mb
+        self._queue: Deque[Job] = deque()
+        self._condition = Condition()
+        self._workers: List[Thread] = []
+        self._running = 0
+        # running job -> its start as time.monotonic()
+        self._started: Dict[Job, float] = {}
+        # cancelled jobs whose <on_cancel> has not been called yet
+        self._cancelled: Deque[Job] = deque()
+        self._canceller: Optional[Thread] = None
+
+    @property
+    def slots(self) -> int:
+        return self._slots
+
+    def resize(self, slots: int):
+        """Changes the number of execution slots. Running jobs are not interrupted."""
+        if slots < 1:
+            raise ValueError('A scheduler needs at least one execution slot.')
+        with self._condition:
+            self._slots = slots
+            if self._queue:
+                self._ensure_workers()
+            self._condition.notify_all()
+
+    def submit(self, job: Job):
+        """Appends the job to the queue. The job starts as soon as enough execution slots are free."""
+        with self._condition:
+            self._queue.append(job)
+            self._ensure_workers()
+            self._condition.notify_all()
+
+    def cancel(self, job: Job) -> bool:
+        """Removes the job from the queue. Returns False if the job is not queued, e.g. because it has started.
+
+        The <on_cancel> of the job is called afterwards on a thread of the scheduler, so that the caller does not
+        wait for it.
+        """
+        with self._condition:
+            for queued_job in self._queue:
+                if queued_job is job:
+                    self._queue.remove(queued_job)
+                    if job.on_cancel:
+                        self._cancelled.append(job)
+                        if self._canceller is None:
+                            self._canceller = Thread(target=self._resolve_cancelled, name='testbed-canceller',
+                                                     daemon=True)
+                            self._canceller.start()
+                    # the jobs behind it may fit now
+                    self._condition.notify_all()
+                    return True
+        return False
+
+    def get_queued_count(self) -> int:
+        with self._condition:
+            return len(self._queue)
+
+    def get_running_count(self) -> int:
+        with self._condition:
+            return self._running
+
+    def get_position(self, job: Job) -> Optional[int]:
+        """Returns the number of jobs ahead of <job> in the queue or None if the job is not queued."""
+        with self._condition:
+            for position, queued_job in enumerate(self._queue):
+                if queued_job is job:
+                    return position
+        return None
+
+    def _ensure_workers(self):
+        self._workers = [worker for worker in self._workers if worker.is_alive()]
+        while len(self._workers) < self._slots:
+            worker = Thread(target=self._work, name=f'testbed-worker-{len(self._workers)}', daemon=True)
+            self._workers.append(worker)
+            worker.start()
+
+    def _next_job(self) -> Job:
+        with self._condition:
+            # surplus workers of a shrunk scheduler simply keep waiting here
+            while True:
+                job = self.__pick() if self._running < self._slots else None
+                if job is not None:
+                    break
+                self._condition.wait()
+            self._queue.remove(job)
+            self._running += 1
+            self._started[job] = time.monotonic()
+            # further jobs may fit into the remaining resources
+            self._condition.notify_all()
+            return job
+
+    def __pick(self) -> Optional[Job]:
+        """Returns the first queued job, a job which may start ahead of it or None if no job may start now."""
+        if not self._queue:
+            return None
+        free_cpus = self._slots - sum(self.__get_cpus(job) for job in self._started)
+        free_memory = self.memory_mb - sum(job.memory_mb for job in self._started) if self.memory_mb else None
+        first = self._queue[0]
+        if self.__fits(first, free_cpus, free_memory):
+            return first
+        now = time.monotonic()
+        first_start = self.__get_expected_start(first, free_cpus, free_memory, now)
+        for job in list(self._queue)[1:]:
+            if job.duration is not None and now + job.duration <= first_start \
+                    and self.__fits(job, free_cpus, free_memory):
+                return job
+        return None
+
+    def __get_expected_start(self, job: Job, free_cpus: int, free_memory: Optional[int], now: float) -> float:
+        """Returns when the running jobs are expected to have freed enough resources for the job.
+
+        Running jobs without a duration are expected to finish now, so that no job is started ahead of them.
+        """
+        ends = sorted(((start + running_job.duration if running_job.duration is not None else now, running_job)
+                       for running_job, start in self._started.items()), key=lambda end: end[0])
+        for end, running_job in ends:
+            free_cpus += self.__get_cpus(running_job)
+            if free_memory is not None:
+                free_memory += running_job.memory_mb
+            if self.__fits(job, free_cpus, free_memory):
+                return max(end, now)
+        return now
+
+    def __fits(self, job: Job, free_cpus: int, free_memory: Optional[int]) -> bool:
+        if self.__get_cpus(job) > free_cpus:
+            return False
+        # a job needing more than the whole budget runs alone
+        return free_memory is None or job.memory_mb <= free_memory or not self._started
+
+    def _work(self):
+        while True:
+            job = self._next_job()
+            try:
+                if job.on_start:
+                    job.on_start()
+                job.target()
+            except Exception as e:
+                print(f'{job}: {e}')
+            finally:
+                with self._condition:
+                    self._running -= 1
+                    self._started.pop(job, None)
+                    self._condition.notify_all()
+
+    def _resolve_cancelled(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._cancelled)
+                job = self._cancelled.popleft()
+            try:
+                job.on_cancel()
+            except Exception as e:
+                print(f'{job}: {e}')
+
+    def __get_cpus(self, job: Job) -> int:
+        return min(job.cpus, self._slots)
+
+
+_scheduler: Optional[Scheduler] = None
+_scheduler_lock = Lock()
+
+
+def get_scheduler() -> Scheduler:
+    """Returns the process-wide scheduler. Creates it with one slot per CPU core if it has not been configured."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = Scheduler(os.cpu_count() or 1)
+        return _scheduler
+
+
+def configure(slots: int, memory_mb: Optional[int] = None) -> Scheduler:
+    """Sets the number of execution slots and the memory budget of the process-wide scheduler."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = Scheduler(slots, memory_mb)
+        else:
+            _scheduler.resize(slots)
+            _scheduler.memory_mb = memory_mb
+        return _scheduler
@@ -0,0 +1,152 @@
+import hashlib
+import json
+import os
+import re
+from collections import OrderedDict
+from threading import Lock
+from typing import List, Optional
+
+"""
+    Summary
+    -------
+    Scans solidity source files in a single pass for the contracts they define, their pragma directives and imports.
+    Comments and string literals are skipped. The results are remembered by the content hash of the file, so that
+    identical files are scanned once.
+"""
+
+_token_regex = re.compile(r'''
+      (?P<comment>//[^\n]*|/\*.*?(?:\*/|\Z))
+    | \bpragma\s+solidity\s+(?P<pragma>[^;]*);
+    | \bimport\b(?P<import>[^;]*);
+    | \b(?:(?P<abstract>abstract)\s+)?(?P<kind>contract|interface|library)\s+(?P<name>[A-Za-z_$][\w$]*)
+    | (?P<string>"(?:[^"\\\n]|\\.)*"|'(?:[^'\\\n]|\\.)*')
+''', re.VERBOSE | re.DOTALL)
+_string_regex = re.compile(r'"((?:[^"\\\n]|\\.)*)"|\'((?:[^\'\\\n]|\\.)*)\'')
+
+
+class ContractDefinition:
+    """A contract, interface or library defined in a source file.
+
+    Attributes
+    ----------
+    name : str
+    kind : str
+        One of "contract", "interface" and "library".
+    abstract : bool
+        Whether the contract is declared abstract.
+    """
+
+    def __init__(self, name: str, kind: str, abstract=False):
+        self.name = name
+        self.kind = kind
+        self.abstract = abstract
+
+    def __str__(self):
+        return f'ContractDefinition(name={self.name}, kind={self.kind}, abstract={self.abstract})'
+
+    @property
+    def deployable(self) -> bool:
+        """Whether the definition compiles to bytecode of its own."""
+        return self.kind != 'interface' and not self.abstract
+
+
+class SourceInfo:
+    """The result of scanning a source file.
+
+    Attributes
+    ----------
+    content_hash : str
+        The SHA-256 hash of the file's content.
+    size : int
+        The size of the file in bytes.
+    contracts : List[ContractDefinition]
+        The definitions in the order of the file.
+    pragmas : List[str]
+        The version constraints of the "pragma solidity" directives, e.g. "^0.4.24" or ">=0.5.0 <0.7.0".
+    imports : List[str]
+        The paths of the imported files.
+    """
+
+    def __init__(self, content_hash: str, size: int, contracts: List[ContractDefinition], pragmas: List[str],
+                 imports: List[str]):
+        self.content_hash = content_hash
+        self.size = size
+        self.contracts = contracts
+        self.pragmas = pragmas
+        self.imports = imports
+
+    def get_contract_names(self, kind: Optional[str] = None) -> List[str]:
+        return [contract.name for contract in self.contracts if kind is None or contract.kind == kind]
+
+    def to_json(self) -> str:
+        return json.dumps({
+            'content_hash': self.content_hash,
+            'size': self.size,
+            'contracts': [[contract.name, contract.kind, contract.abstract] for contract in self.contracts],
+            'pragmas': self.pragmas,
+            'imports': self.imports,
+        })
+
+    @staticmethod
+    def from_json(text: str) -> 'SourceInfo':
+        info = json.loads(text)
+        return SourceInfo(info['content_hash'], info['size'],
+                          [ContractDefinition(name, kind, abstract) for name, kind, abstract in info['contracts']],
+                          info['pragmas'], info['imports'])
+
+
+def scan(source: str, content_hash: str = '', size: int = 0) -> SourceInfo:
+    """Scans the source code in a single pass."""
+    contracts, pragmas, imports = [], [], []
+    for match in _token_regex.finditer(source):
+        if match.group('name'):
+            contracts.append(ContractDefinition(match.group('name'), match.group('kind'), bool(match.group('abstract'))))
+        elif match.group('pragma') is not None:
+            pragmas.append(' '.join(match.group('pragma').split()))
+        elif match.group('import') is not None:
+            path = _string_regex.search(match.group('import'))
+            if path:
+                imports.append(path.group(1) if path.group(1) is not None else path.group(2))
+    return SourceInfo(content_hash, size, contracts, pragmas, imports)
+
+
+_cache: 'OrderedDict[str, SourceInfo]' = OrderedDict()
+_cache_lock = Lock()
+_cache_size = 1024
+
+
+def scan_file(path: str) -> SourceInfo:
+    """Reads the file once and returns its scan. Files with the same content are scanned once per process."""
+    with open(path, 'rb') as f:
+        content = f.read()
+    content_hash = hashlib.sha256(content).hexdigest()
+    with _cache_lock:
+        if content_hash in _cache:
+            _cache.move_to_end(content_hash)
+            return _cache[content_hash]
+    source_info = scan(content.decode('utf-8'), content_hash, len(content))
+    with _cache_lock:
+        _cache[content_hash] = source_info
+        if len(_cache) > _cache_size:
+            _cache.popitem(last=False)
+    return source_info
+
+
+def get_imported_files(path: str) -> List[str]:
+    """Returns the real path of the file and of the existing files it imports transitively, the file first.
+
+    Imports resolved by remappings or the base path of the compiler are skipped, since they are no files relative to
+    the importing file. Files which are no solidity files have no imports.
+    """
+    path = os.path.realpath(path)
+    paths = [path]
+    if not path.endswith('.sol'):
+        return paths
+    seen = {path}
+    for importing_path in paths:
+        for imported in scan_file(importing_path).imports:
+            imported_path = os.path.realpath(os.path.join(os.path.dirname(importing_path), imported))
+            if imported_path not in seen and os.path.isfile(imported_path):
+                seen.add(imported_path)
+                paths.append(imported_path)
+    return paths
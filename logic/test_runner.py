@@ -1,22 +1,45 @@
 import os
 import shutil
 import tempfile
-from typing import Dict, List, Union, Tuple
+import uuid
+from concurrent.futures import Future
+from threading import Lock, Condition
+from typing import Dict, Iterator, List, Union, Tuple, Callable, Optional
 
-from logic.orm import Tool, SecurityIssue, ToolSecurityIssue, ToolError, SolidityContract, Contract, get_db_session, \
-    Error
+from logic import catalog
+from logic.orm import Tool, SecurityIssue, SolidityContract, Contract, Error
 from logic.tools.tool_test_run import ToolTestRun
-from logic.tools import maian, manticore, mythril, osiris, oyente, securify2, smartcheck
+from logic.tools import registry
 
 
 class TestRun:
 
-    def __init__(self, contract: Union[SolidityContract, Contract], tools: List[Tool], timeout=None):
+    def __init__(self, contract: Union[SolidityContract, Contract], tools: List[Tool], timeout=None,
+                 compile_once=False, run_id: Optional[str] = None):
         self._contract = contract
+        # the containers of the tools are labelled with the ID, so that they can be killed on cancellation
+        self.run_id = run_id or uuid.uuid4().hex
+        self._cancelled = False
+        # whether the bytecode compatible tools test the runtime bytecode compiled once by the testbed
+        self.compile_once = compile_once
+        self._runtime_bytecode_contract: Optional[Contract] = None
+        self._compiled = False
         self._tools = tools
         self._tool_test_runs: Dict[Tool, ToolTestRun] = dict()
+        self._futures: Dict[Tool, Future] = dict()
         self._started = False
+        self._done_callbacks: List[Callable[[Tool, ToolTestRun], None]] = []
+        self._finished_tools: List[Tool] = []
+        self._callbacks_lock = Lock()
+        # every change of a displayed status gets the next version, starting with 1
+        self._changes: List[Dict] = []
+        self._changed = Condition()
         self.timeout = timeout
+        self._catalog = catalog.get()
+        # copies of the security issues and errors which do not depend on a database session
+        self._security_issues_statuses = self.__create_security_issues_matrix()
+        self._errors_statuses = self.__create_errors_matrix()
+        self._tmp_dir = None
         if type(self._contract) == SolidityContract:
             self._tmp_dir = tempfile.mkdtemp()
 
@@ -25,31 +48,147 @@ class TestRun:
             shutil.rmtree(self._tmp_dir)
 
     def __create_tool_test_run(self, tool: Tool) -> ToolTestRun:
-        if tool.name == 'maian':
-            module = maian
-        elif tool.name == 'manticore':
-            module = manticore
-        elif tool.name == 'mythril':
-            module = mythril
-        elif tool.name == 'osiris':
-            module = osiris
-        elif tool.name == 'oyente':
-            module = oyente
-        elif tool.name == 'securify2':
-            module = securify2
-        elif tool.name == 'smartcheck':
-            module = smartcheck
-        else:
-            raise AttributeError(f'The tool {tool} is not imported in {__name__}.')
-        return module.create_tool_test_run(self._contract, self.timeout)
+        contract = self._contract
+        if tool.bytecode_compatible and self.compile_once and self._contract.is_solidity_contract:
+            contract = self.__get_runtime_bytecode_contract() or contract
+        return registry.create_tool_test_run(tool, contract, self.timeout)
+
+    def __get_runtime_bytecode_contract(self) -> Optional[Contract]:
+        """Returns the runtime bytecode of the contract or None if it cannot be compiled."""
+        if not self._compiled:
+            self._compiled = True
+            try:
+                bytecode_path = f'{self._tmp_dir}/{self._contract.name}.runtime.bin'
+                shutil.copyfile(self._contract.get_bytecode_file(runtime=True), bytecode_path)
+                self._runtime_bytecode_contract = Contract(bytecode_path)
+                self._runtime_bytecode_contract.runtime_bytecode = True
+            except Exception as e:
+                print(f'Could not compile {self._contract}, the tools test its source instead: {e}')
+        return self._runtime_bytecode_contract
 
     def run(self):
         self._started = True
         for tool in self._tools:
-            tool_test_run: ToolTestRun = self.__create_tool_test_run(tool)
+            try:
+                tool_test_run: ToolTestRun = self.__create_tool_test_run(tool)
+            except Exception as e:
+                print(f'Could not create the test-run of {tool.name} for {self._contract}: {e}')
+                tool_test_run = FailedToolTestRun(e)
+            tool_test_run.run_id = self.run_id
             self._tool_test_runs[tool] = tool_test_run
+            self._futures[tool] = Future()
+        for tool, tool_test_run in self._tool_test_runs.items():
+            if isinstance(tool_test_run, FailedToolTestRun):
+                self.__on_tool_done(tool, tool_test_run.get_future())
+                continue
+            tool_test_run.add_start_callback(lambda tool=tool: self.__record_changes(
+                [{'table': 'tools', 'row': 'status', 'tool': tool.name, 'value': 'Running'}]))
+            tool_test_run.add_progress_callback(lambda tool=tool: self.__on_tool_progress(tool))
+            tool_test_run.get_future().add_done_callback(lambda future, tool=tool: self.__on_tool_done(tool, future))
             tool_test_run.run()
 
+    def __on_tool_progress(self, tool: Tool):
+        found_titles = {issue.title for issue in self._tool_test_runs[tool].get_partial_security_issues()}
+        changes = [{'table': 'security_issues', 'row': issue.title, 'tool': tool.name, 'value': status}
+                   for issue, status in self._security_issues_statuses.update(
+                tool, lambda issue, status: 'found (partial)' if status == 'loading' and issue.title in found_titles
+                else status)]
+        self.__record_changes(changes)
+
+    def __on_tool_done(self, tool: Tool, future: Future):
+        changes = []
+        try:
+            changes = self._update_statuses(tool)
+        except Exception as e:
+            print(f'Could not update the statuses of {tool}: {e}')
+        if future.exception():
+            changes.append({'table': 'tools', 'row': 'status', 'tool': tool.name, 'value': 'Failed'})
+        self.__record_changes(changes)
+        # the future of the test-run resolves only after the statuses have been updated
+        if future.exception():
+            self._futures[tool].set_exception(future.exception())
+        else:
+            self._futures[tool].set_result(future.result())
+        with self._callbacks_lock:
+            self._finished_tools.append(tool)
+            callbacks = list(self._done_callbacks)
+        with self._changed:
+            self._changed.notify_all()
+        for callback in callbacks:
+            self.__call_done_callback(callback, tool)
+
+    def __call_done_callback(self, callback: Callable[[Tool, ToolTestRun], None], tool: Tool):
+        try:
+            callback(tool, self._tool_test_runs[tool])
+        except Exception as e:
+            print(f'Callback {callback} failed for {tool}: {e}')
+
+    def add_done_callback(self, callback: Callable[[Tool, ToolTestRun], None]):
+        """Calls <callback(tool, tool_test_run)> as soon as a tool has terminated or failed.
+
+        The callback is called on the thread which finished the tool. Tools which have already finished when the
+        callback is added are reported immediately.
+        """
+        with self._callbacks_lock:
+            self._done_callbacks.append(callback)
+            finished_tools = list(self._finished_tools)
+        for tool in finished_tools:
+            self.__call_done_callback(callback, tool)
+
+    def done(self) -> bool:
+        """Returns whether every tool has terminated or failed and all changes of the statuses have been recorded."""
+        with self._callbacks_lock:
+            return self._started and len(self._finished_tools) == len(self._tools)
+
+    def cancel(self):
+        """Cancels the tools which have not finished yet. Returns at once, see <wait>.
+
+        Queued tools do not start and the containers of running tools are killed. The cancelled tools terminate with
+        the error "testbed cancelled".
+        """
+        self._cancelled = True
+        for tool_test_run in list(self._tool_test_runs.values()):
+            tool_test_run.cancel()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Blocks until every tool has terminated or failed or the timeout expires. Returns whether all are done."""
+        with self._changed:
+            return self._changed.wait_for(self.done, timeout)
+
+    def as_completed(self, heartbeat: Optional[float] = None) -> Iterator[Optional[Tuple[Tool, ToolTestRun]]]:
+        """Yields every tool and its test-run as soon as the tool has terminated or failed.
+
+        A failed tool test-run holds the exception in its future. The statuses of a tool have been updated when it is
+        yielded.
+
+        Parameters
+        ----------
+        heartbeat : float, optional
+            If given, None is yielded whenever no tool has finished for <heartbeat> secs., so that the caller can
+            report the progress.
+        """
+        if not self._started:
+            raise RuntimeError(f'The test-run of {self._contract} has not been started.')
+        yielded = 0
+        while yielded < len(self._tools):
+            with self._changed:
+                finished = self._changed.wait_for(lambda: len(self._finished_tools) > yielded, heartbeat)
+            if not finished:
+                yield None
+                continue
+            with self._callbacks_lock:
+                tools = self._finished_tools[yielded:]
+            for tool in tools:
+                yielded += 1
+                yield tool, self._tool_test_runs[tool]
+
+    def get_futures(self) -> Dict[Future, Tool]:
+        """Returns the futures of the tool test-runs. Can be used with <concurrent.futures.wait> and alike.
+
+        A future is done as soon as the statuses of its tool have been updated.
+        """
+        return {future: tool for tool, future in self._futures.items()}
+
     def get_terminated_tools(self) -> List[Tool]:
         terminated_tools = []
         for tool, tool_test_run in self._tool_test_runs.items():
@@ -61,60 +200,41 @@ class TestRun:
         return self._tool_test_runs[tool]
 
     def get_status(self) -> str:
+        """Returns one of "Before Run", "Queued", "Running", "Terminated" or "Cancelled".
+
+        A test-run is "Queued" as long as none of its tools has got an execution slot of the scheduler. It has
+        terminated as soon as all of its tools have terminated or failed.
+        """
         if not self._started:
             return 'Before Run'
-        if len(self.get_terminated_tools()) < len(self._tools):
-            return 'Running'
-        return 'Terminated'
+        statuses = {tool_test_run.get_status() for tool_test_run in self._tool_test_runs.values()}
+        if statuses <= {'Terminated', 'Failed'}:
+            return 'Cancelled' if self._cancelled else 'Terminated'
+        if statuses == {'Queued'}:
+            return 'Queued'
+        return 'Running'
 
     def get_security_issues_statuses(self) -> Dict[SecurityIssue, Dict[Tool, str]]:
         """Returns the statuses of any _security_issues searched for by any of the tools of the <analyze>-method.
 
             The statuses:
                 "loading" : The tool is still terminated.
+                "found (partial)" : The tool is still running and its output so far contains the security issue.
                 "found", "not found" : self-explaining
                 "not checked" : The tool does not check for this error.
 
+            The statuses are updated whenever a tool terminates or its output reveals a security issue, so reading them neither queries the database nor
+            reads output files. The returned dict must not be modified.
+
             Returns
             -------
             Dict[SecurityIssue,str]
                 str is one of the statuses defined above.
 
             """
-        security_issues_statuses = {}
-        sess = get_db_session()
-
-        # !!!
-        security_issues = sess.query(SecurityIssue).join(ToolSecurityIssue).filter(
-            ToolSecurityIssue.tool_name.in_([tool.name for tool in self._tools])) \
-            .distinct().order_by(SecurityIssue.swc_id == None, SecurityIssue.swc_id, SecurityIssue.title,
-                                 ToolSecurityIssue.tool_name).all()
-        for issue in security_issues:
-            security_issues_statuses[issue] = {}
-            for tool in self._tools:
-                if tool in issue.tools:
-                    status = 'loading'
-                else:
-                    status = 'not checked'
-                security_issues_statuses[issue][tool] = status
-
-        for tool in self.get_terminated_tools():
-            discovered_security_issues = self._tool_test_runs[tool].get_security_issues()
-            for issue in security_issues:
-                if issue in discovered_security_issues:
-                    status = 'found'
-                else:
-                    if issue in tool.security_issues:
-                        status = 'not found'
-                    else:
-                        status = 'not checked'
-                security_issues_statuses[issue][tool] = status
-
-        security_issues_statuses = {key: value for key, value in
-                                    sorted(security_issues_statuses.items(), key=discovered_errors_count, reverse=True)}
-        return security_issues_statuses
-
-    def get_errors_statuses(self) -> Dict[Error, str]:
+        return self._security_issues_statuses.get()
+
+    def get_errors_statuses(self) -> Dict[Error, Dict[Tool, str]]:
         """Returns the statuses of any _error searched for by any of the tools of the <analyze>-method.
 
             The statuses:
@@ -122,41 +242,167 @@ class TestRun:
                 "found", "not found" : self-explaining
                 "not checked" : The tool does not check for this error.
 
+            The statuses are updated whenever a tool terminates. The returned dict must not be modified.
+
             Returns
             -------
             Dict[Error,str]
                 str is one of the statuses defined above.
 
             """
-        error_statuses = {}
-        sess = get_db_session()
-
-        # !!!
-        errors = sess.query(Error).join(ToolError).filter(
-            ToolError.tool_name.in_([tool.name for tool in self._tools])) \
-            .distinct().order_by(Error.title,
-                                 ToolError.tool_name).all()
-        for error in errors:
-            error_statuses[error] = {}
-            for tool in self._tools:
-                if tool in error.tools:
-                    status = 'loading'
-                else:
-                    status = 'not checked'
-                error_statuses[error][tool] = status
-
-        for tool in self.get_terminated_tools():
-            discovered_errors = self._tool_test_runs[tool].get_errors()
-            for error in errors:
-                if error in discovered_errors:
-                    status = 'found'
-                else:
-                    status = 'not found'
-                error_statuses[error][tool] = status
-
-        error_statuses = {key: value for key, value in
-                          sorted(error_statuses.items(), key=discovered_errors_count, reverse=True)}
-        return error_statuses
+        return self._errors_statuses.get()
+
+    def __create_security_issues_matrix(self) -> 'StatusMatrix':
+        checked_titles = {tool: self._catalog.get_checked_security_issues(tool.name) for tool in self._tools}
+        security_issues = {tool_security_issue.security_issue for tool in self._tools
+                           for tool_security_issue in tool.tool_security_issues if tool_security_issue.security_issue}
+        security_issues = sorted(security_issues, key=lambda s: (s.swc_id is None, s.swc_id or 0, s.title))
+        return StatusMatrix(
+            [SecurityIssue(swc_id=issue.swc_id, title=issue.title, description=issue.description, link=issue.link)
+             for issue in security_issues], self._tools,
+            lambda issue, tool: 'loading' if issue.title in checked_titles[tool] else 'not checked')
+
+    def __create_errors_matrix(self) -> 'StatusMatrix':
+        checked_titles = {tool: self._catalog.get_checked_errors(tool.name) for tool in self._tools}
+        errors = {tool_error.error for tool in self._tools for tool_error in tool.tool_errors if tool_error.error}
+        return StatusMatrix(
+            [Error(title=error.title, description=error.description, link=error.link)
+             for error in sorted(errors, key=lambda e: e.title)], self._tools,
+            lambda error, tool: 'loading' if error.title in checked_titles[tool] else 'not checked')
+
+    def _update_statuses(self, tool: Tool) -> List[Dict]:
+        tool_test_run = self._tool_test_runs[tool]
+        if tool_test_run.get_status() == 'Failed':
+            # a failed tool has checked nothing
+            changes = [{'table': 'security_issues', 'row': issue.title, 'tool': tool.name, 'value': status}
+                       for issue, status in self._security_issues_statuses.update(
+                    tool, lambda issue, status: 'not checked' if status in ('loading', 'found (partial)') else status)]
+            changes += [{'table': 'errors', 'row': error.title, 'tool': tool.name, 'value': status}
+                        for error, status in self._errors_statuses.update(
+                    tool, lambda error, status: 'not checked' if status == 'loading' else status)]
+            return changes
+        if not tool_test_run.get_terminated():
+            return []
+        found_titles = {issue.title for issue in tool_test_run.get_security_issues()}
+        checked_titles = self._catalog.get_checked_security_issues(tool.name)
+        changes = [{'table': 'security_issues', 'row': issue.title, 'tool': tool.name, 'value': status}
+                   for issue, status in self._security_issues_statuses.update(
+                tool, lambda issue, _: 'found' if issue.title in found_titles else
+                'not found' if issue.title in checked_titles else 'not checked')]
+        found_titles = {error.title for error in tool_test_run.get_errors()}
+        changes += [{'table': 'errors', 'row': error.title, 'tool': tool.name, 'value': status}
+                    for error, status in self._errors_statuses.update(
+                tool, lambda error, _: 'found' if error.title in found_titles else 'not found')]
+        changes += [{'table': 'tools', 'row': 'status', 'tool': tool.name, 'value': 'Terminated'},
+                    {'table': 'tools', 'row': 'execution_time', 'tool': tool.name,
+                     'value': tool_test_run.get_execution_time().total_seconds()}]
+        return changes
+
+    def __record_changes(self, changes: List[Dict]):
+        with self._changed:
+            for change in changes:
+                change['version'] = len(self._changes) + 1
+                self._changes.append(change)
+            self._changed.notify_all()
+
+    def get_version(self) -> int:
+        """Returns the version of the displayed statuses. It is increased by every change."""
+        with self._changed:
+            return len(self._changes)
+
+    def get_changes(self, since: int, timeout: Optional[float] = None) -> List[Dict]:
+        """Returns the changes of the displayed statuses after the version <since>.
+
+        Blocks until there is a change or the timeout expires if there is none yet. Returns an empty list if all
+        tools are done or the timeout has expired without a change.
+
+        Returns
+        -------
+        List[Dict]
+            The changes ordered by their "version". "table" is one of "tools", "security_issues" and "errors", "row" is
+            the title of the security issue or error or one of "status" and "execution_time" for "tools", "tool" is
+            the name of the tool and "value" the new status or the execution time in secs.
+        """
+        with self._changed:
+            self._changed.wait_for(lambda: len(self._changes) > since or self.done(), timeout)
+            return self._changes[max(0, since):]
+
+
+class FailedToolTestRun:
+    """Stands in for the test-run of a tool which could not be created, e.g. because its compiler is missing.
+
+    Its future holds the exception, so that it is reported like a tool which failed while running.
+    """
+
+    def __init__(self, exception: Exception):
+        self.run_id = None
+        self._future = Future()
+        self._future.set_exception(exception)
+
+    def get_status(self) -> str:
+        return 'Failed'
+
+    def get_terminated(self) -> bool:
+        return False
+
+    def get_cancelled(self) -> bool:
+        return False
+
+    def get_queue_position(self) -> Optional[int]:
+        return None
+
+    def get_execution_time(self) -> None:
+        return None
+
+    def get_future(self) -> Future:
+        return self._future
+
+    def cancel(self):
+        pass
+
+
+class StatusMatrix:
+    """The statuses of security issues or errors per tool.
+
+    The rows are sorted by the number of tools which found them. A sorted snapshot is built whenever the statuses of
+    a tool change, so that reading the matrix is free.
+
+    Parameters
+    ----------
+    rows : List[Union[SecurityIssue, Error]]
+        The rows in the order they take among rows found by the same number of tools.
+    tools : List[Tool]
+    initial_status : Callable[[Union[SecurityIssue, Error], Tool], str]
+    """
+
+    def __init__(self, rows: List[Union[SecurityIssue, Error]], tools: List[Tool],
+                 initial_status: Callable[[Union[SecurityIssue, Error], Tool], str]):
+        self._rows = [(row, {tool: initial_status(row, tool) for tool in tools}) for row in rows]
+        self._lock = Lock()
+        self._snapshot = self.__create_snapshot()
+
+    def update(self, tool: Tool, status: Callable[[Union[SecurityIssue, Error], str], str]) \
+            -> List[Tuple[Union[SecurityIssue, Error], str]]:
+        """Sets the status of every row for the tool to <status(row, current_status)>.
+
+        Returns the rows whose status has changed and their status.
+        """
+        changes = []
+        with self._lock:
+            for row, statuses in self._rows:
+                new_status = status(row, statuses[tool])
+                if statuses[tool] != new_status:
+                    statuses[tool] = new_status
+                    changes.append((row, new_status))
+            self._snapshot = self.__create_snapshot()
+        return changes
+
+    def get(self) -> Dict[Union[SecurityIssue, Error], Dict[Tool, str]]:
+        return self._snapshot
+
+    def __create_snapshot(self) -> Dict[Union[SecurityIssue, Error], Dict[Tool, str]]:
+        snapshot = {row: dict(statuses) for row, statuses in self._rows}
+        return {key: value for key, value in sorted(snapshot.items(), key=discovered_errors_count, reverse=True)}
 
 
 def discovered_errors_count(error_tool_status: Tuple[SecurityIssue, Dict[Tool, str]]) -> int:
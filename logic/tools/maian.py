@@ -1,91 +1,71 @@
 import shutil
-import subprocess
 import tempfile
-from datetime import datetime
-from typing import List
+from datetime import timedelta
+from typing import List, Dict, Optional, Tuple
 
 from logic.orm import SolidityContract, SecurityIssue, Error
-from logic.tools.tool_test_run import ToolTestRun
+from logic.tools.tool_test_run import ToolTestRun, ResourceProfile
 
 
 class Maian(ToolTestRun):
+    docker_image = 'cryptomental/maian-augur-ci'
+    # the three analyses run in parallel
+    resource_profile = ResourceProfile(cpus=3, memory_mb=3072, typical_duration=timedelta(minutes=5),
+                                       bytecode_compatible=True)
 
     def __init__(self, contract, timeout):
         super().__init__(contract, 'maian', timeout)
         self.tmp_dir = tempfile.mkdtemp()
-        self.output_files = []
         if contract.is_solidity_contract:
             self.used_solc = self.get_solc_bin()
         self.options = {0: 'suicidal', 1: 'prodigal', 2: 'greedy'}
+        self.output_files = ['{}/opt_{}.txt'.format(self.tmp_dir, opt) for opt in self.options]
 
     def __del__(self):
         super().__del__()
         shutil.rmtree(self.tmp_dir)
 
     def _execute_tool(self):
-        docker_contract_path = f'/root/test-contracts/{self._contract.filename}'
-        mount_solc = ''
         if type(self._contract) == SolidityContract:
-            mount_solc += f'-v "{self.used_solc}:/root/solc-version"'
-            docker_cmd_without_opt = f'bash -c "export PATH=/root/solc-version:\$PATH &&' \
-                                     f' python maian.py --soliditycode  {docker_contract_path} {self._contract.name}'
+            solc_dir = self.used_solc
+            tool_cmd = f'python maian.py --soliditycode {{docker_contract_path}} {self._contract.name}'
         else:
-            docker_cmd_without_opt = f'bash -c "python maian.py -bs  {docker_contract_path}'
+            solc_dir = None
+            bytecode_opt = '-b' if self._contract.runtime_bytecode else '-bs'
+            tool_cmd = f'python maian.py {bytecode_opt} {{docker_contract_path}}'
 
-        processes: List[subprocess.Popen] = []
-        for opt in self.options:
-            output_file = '{}/opt_{}.txt'.format(self.tmp_dir, opt)
-            self.output_files += [output_file]
-            with open(output_file, 'w', encoding='utf-8') as f:
-                cmd = f'sudo docker run --rm -w /MAIAN/tool -v "{self._contract.dir_path}":/root/test-contracts ' \
-                      f'{mount_solc} cryptomental/maian-augur-ci {docker_cmd_without_opt} --check {opt}"'
-                processes += [
-                    subprocess.Popen(
-                        cmd,
-                        stdout=f,
-                        stderr=subprocess.STDOUT, shell=True)
-                ]
+        commands = [(self.create_docker_cmd(self.docker_image, f'{tool_cmd} --check {opt}',
+                                            docker_opts=['-w', '/MAIAN/tool'], solc_dir=solc_dir),
+                     self.output_files[opt])
+                    for opt in self.options]
+        # the three checks share one deadline and are killed together when it expires
+        self.run_cmds(commands)
 
-        timestamp = datetime.now()
-        runtime = 0
-        while processes:
-            runtime = (datetime.now() - timestamp).total_seconds()
-            if self.timeout and self.timeout < runtime:
-                for process in processes:
-                    process.kill()
-            if processes[0].poll() is not None:
-                del processes[0]
-        if self.timeout and self.timeout < runtime:
-            raise subprocess.TimeoutExpired(cmd, self.timeout)
+    def _get_output_files(self) -> Dict[str, Optional[str]]:
+        return {f'opt_{opt}': self.output_files[opt] for opt in self.options}
 
-    def identify_errors(self) -> List[Error]:
-        errors = set()
+    def identify_security_issues_and_errors(self) -> Tuple[List[SecurityIssue], List[Error]]:
+        streamed = self._get_streamed_matches(self.output_files)
+        if streamed is not None:
+            return streamed
+        security_issues, errors = set(), set()
         for file in self.output_files:
-            with open(file, encoding='utf-8') as f:
-                text = f.read()
-            errors |= set(self.match_errors(text))
-        return sorted(errors, key=lambda e: e.title)
+            with open(file, encoding='utf-8', errors='replace') as f:
+                file_security_issues, file_errors = self.match_output(f.read())
+            security_issues |= set(file_security_issues)
+            errors |= set(file_errors)
+        return sorted(security_issues, key=lambda s: s.title), sorted(errors, key=lambda e: e.title)
 
-    def identify_security_issues(self) -> List[SecurityIssue]:
-        security_issues = set()
-        for file in self.output_files:
-            with open(file, encoding='utf-8') as f:
-                text = f.read()
-            security_issues |= set(self.match_security_issues(text))
-        return sorted(security_issues, key=lambda s: s.title)
-
-    def create_report(self) -> str:
-        report = self.create_standard_report_intro() \
-                 + ToolTestRun.separator + \
-                 'Command-Line Output of the Tool:\n'
+    def write_report(self, out):
+        out.write(self.create_standard_report_intro()
+                  + ToolTestRun.separator +
+                  'Command-Line Output of the Tool:\n')
         for opt, description in self.options.items():
-            report += f'Testing for {description} contracts:\n' + \
-                      ToolTestRun.separator2
-            with open(self.output_files[opt], encoding='utf-8') as f:
-                report += f.read()
-            report += ToolTestRun.separator2
-        report += self.create_standard_security_issues_report()
-        return report
+            out.write(f'Testing for {description} contracts:\n' +
+                      ToolTestRun.separator2)
+            self._copy_output(self.output_files[opt], out)
+            out.write(ToolTestRun.separator2)
+        out.write(self.create_standard_security_issues_report())
 
 
 def create_tool_test_run(contract, timeout):
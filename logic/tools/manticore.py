@@ -1,13 +1,20 @@
 import os
+import shlex
 import subprocess
 import tempfile
-from typing import List, Union
+from datetime import timedelta
+from typing import List, Union, Dict, Optional, Tuple
 
-from logic.orm import Contract, SolidityContract, Error, SecurityIssue
-from logic.tools.tool_test_run import ToolTestRun
+from logic.orm import Contract, SolidityContract, Error, SecurityIssue, Evaluation
+from logic.engine import get_engine
+from logic.tools.tool_test_run import ToolTestRun, ResourceProfile
 
 
 class Manticore(ToolTestRun):
+    docker_image = 'trailofbits/manticore'
+    resource_profile = ResourceProfile(cpus=2, memory_mb=4096, typical_duration=timedelta(minutes=20))
+    # the security issues are written to the findings file when Manticore terminates
+    output_contains_security_issues = False
 
     def __init__(self, contract: Union[Contract, SolidityContract], timeout):
         super().__init__(contract, 'manticore', timeout)
@@ -18,45 +25,48 @@ class Manticore(ToolTestRun):
             self.used_solc = self.get_solc_bin()
 
     def _execute_tool(self):
-        with open(self.cmd_file, 'w', encoding='utf-8') as f:
-            docker_output_dir = '/root/test-output'
-            docker_contract_dir = '/root/test-contract'
-            docker_solc_dir = '/root/solc-version'
-            solc_command = ''
-            solc_mount = ''
-            contract_command = ''
-            if self._contract.is_solidity_contract:
-                solc_mount = f'-v "{self.used_solc}":{docker_solc_dir}'
-                solc_command = f'--solc {docker_solc_dir}/solc'
-                contract_command = f'--contract "{self._contract.name}"'
+        solc_dir = None
+        tool_cmd = 'manticore'
+        if self._contract.is_solidity_contract:
+            solc_dir = self.used_solc
+            tool_cmd += f' --solc {{docker_solc_dir}}/solc --contract {shlex.quote(self._contract.name)}'
+        tool_cmd += ' {docker_contract_path}'
+        command = self.create_docker_cmd(self.docker_image, tool_cmd,
+                                         docker_opts=['--ulimit', 'stack=100000000:100000000'],
+                                         output_dir=self.tmp_dir, solc_dir=solc_dir, working_dir_to_output_dir=True,
+                                         add_solc_to_path=False)
+        self.run_cmd(command, self.cmd_file)
 
-            command = f'sudo docker run --rm --ulimit stack=100000000:100000000 {solc_mount} -v "{self.tmp_dir}":{docker_output_dir}' + \
-                      f' -v {self._contract.dir_path}:{docker_contract_dir} -w {docker_output_dir} trailofbits/manticore manticore ' + \
-                      f' {solc_command} {contract_command} "{docker_contract_dir}/{self._contract.filename}"'
-            subprocess.run(command,
-                           shell=True, stdout=f, stderr=subprocess.STDOUT, timeout=self.timeout)
+        try:
+            output_dir = f'{self.tmp_dir}/{next(filter(lambda dir_name: "mcore_" in dir_name, os.listdir(self.tmp_dir)))}'
+            get_engine().run_process(['sudo', 'chmod', '-R', '777', output_dir],
+                                     stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            self.findings_file = f'{output_dir}/global.findings'
+        except StopIteration as e:
+            self.check_findings_file()
 
-            try:
-                output_dir = f'{self.tmp_dir}/{next(filter(lambda dir_name: "mcore_" in dir_name, os.listdir(self.tmp_dir)))}'
-                subprocess.run(f'sudo chmod -R 777 {output_dir}', shell=True
-                                            , stderr=subprocess.DEVNULL, stdout=subprocess.DEVNULL
-                                            )
-                self.findings_file = f'{output_dir}/global.findings'
-            except StopIteration as e:
-                self.check_findings_file()
+    def _get_output_files(self) -> Dict[str, Optional[str]]:
+        return {'cmd': self.cmd_file, 'findings': self.findings_file}
 
-    def identify_errors(self) -> List[Error]:
-        with open(self.cmd_file, encoding='utf-8') as f:
-            return self.match_errors(f.read())
+    def _restore_output_files(self, evaluation: Evaluation) -> bool:
+        self.findings_file = f'{self.tmp_dir}/global.findings'
+        return super()._restore_output_files(evaluation)
 
-    def identify_security_issues(self) -> List[SecurityIssue]:
+    def identify_security_issues_and_errors(self) -> Tuple[List[SecurityIssue], List[Error]]:
+        streamed = self._get_streamed_matches([self.cmd_file])
+        if streamed is not None:
+            errors = streamed[1]
+        else:
+            with open(self.cmd_file, encoding='utf-8', errors='replace') as f:
+                errors = self.match_errors(f.read())
+        security_issues = []
         if self.check_findings_file():
             with open(self.findings_file, encoding='utf-8') as f:
-                return self.match_security_issues(f.read())
-        return []
+                security_issues = self.match_security_issues(f.read())
+        return security_issues, errors
 
-    def create_report(self) -> str:
-        return self._create_standard_report(self.cmd_file, self.findings_file)
+    def write_report(self, out):
+        self._write_standard_report(out, self.cmd_file, self.findings_file)
 
     def check_findings_file(self):
         if not self.findings_file or not os.path.isfile(self.findings_file):
@@ -1,13 +1,14 @@
 import os
-import subprocess
 import tempfile
-from typing import List
+from datetime import timedelta
 
-from logic.orm import Contract, Error, SecurityIssue
-from logic.tools.tool_test_run import ToolTestRun
+from logic.orm import Contract
+from logic.tools.tool_test_run import ToolTestRun, ResourceProfile
 
 
 class Mythril(ToolTestRun):
+    docker_image = 'mythril/myth'
+    resource_profile = ResourceProfile(memory_mb=2048, typical_duration=timedelta(minutes=5), bytecode_compatible=True)
 
     def __init__(self, contract: Contract, timeout):
         super().__init__(contract, 'mythril', timeout)
@@ -24,21 +25,13 @@ class Mythril(ToolTestRun):
             tool_cmd = f'analyze --solv {self.used_solc[self.used_solc.rfind("/") + 1:]}  {{docker_contract_path}}:{self._contract.name} -t 3'
         else:
             tool_cmd = f'analyze --codefile {{docker_contract_path}} -t 3'
-        command = self.create_docker_cmd('mythril/myth', tool_cmd)
-        with open(self.cmd_file, 'w', encoding='utf-8') as f:
-            subprocess.run(command,
-                           shell=True, stdout=f, stderr=subprocess.STDOUT, timeout=self.timeout)
+            if self._contract.runtime_bytecode:
+                tool_cmd += ' --bin-runtime'
+        command = self.create_docker_cmd(self.docker_image, tool_cmd)
+        self.run_cmd(command, self.cmd_file)
 
-    def identify_errors(self) -> List[Error]:
-        with open(self.cmd_file, encoding='utf-8') as f:
-            return self.match_errors(f.read())
-
-    def identify_security_issues(self) -> List[SecurityIssue]:
-        with open(self.cmd_file, encoding='utf-8') as f:
-            return self.match_security_issues(f.read())
-
-    def create_report(self) -> str:
-        return self._create_standard_report(self.cmd_file)
+    def write_report(self, out):
+        self._write_standard_report(out, self.cmd_file)
 
 
 def create_tool_test_run(contract, timeout):
@@ -1,12 +1,14 @@
-import subprocess
 import tempfile
-from typing import List
+from datetime import timedelta
 
-from logic.orm import Contract, Error, SecurityIssue
-from logic.tools.tool_test_run import ToolTestRun
+from logic.orm import Contract
+from logic.tools.tool_test_run import ToolTestRun, ResourceProfile
 
 
 class Oyente(ToolTestRun):
+    docker_image = 'luongnguyen/oyente'
+    resource_profile = ResourceProfile(memory_mb=1024, typical_duration=timedelta(minutes=2), bytecode_compatible=True,
+                                       analyses_whole_file=True)
 
     def __init__(self, contract: Contract, timeout):
         super().__init__(contract, 'oyente', timeout)
@@ -22,21 +24,11 @@ class Oyente(ToolTestRun):
             solc_dir = None
             bytecode_opt = '--bytecode'
         tool_cmd = f'python /oyente/oyente/oyente.py {bytecode_opt} --source  {{docker_contract_path}}'
-        command = self.create_docker_cmd('luongnguyen/oyente', tool_cmd, solc_dir=solc_dir)
-        with open(self.cmd_file, 'w', encoding='utf-8') as f:
-            subprocess.run(command,
-                           shell=True, stdout=f, stderr=subprocess.STDOUT, timeout=self.timeout)
+        command = self.create_docker_cmd(self.docker_image, tool_cmd, solc_dir=solc_dir)
+        self.run_cmd(command, self.cmd_file)
 
-    def identify_errors(self) -> List[Error]:
-        with open(self.cmd_file, encoding='utf-8') as f:
-            return self.match_errors(f.read())
-
-    def identify_security_issues(self) -> List[SecurityIssue]:
-        with open(self.cmd_file, encoding='utf-8') as f:
-            return self.match_security_issues(f.read())
-
-    def create_report(self) -> str:
-        return self._create_standard_report(self.cmd_file)
+    def write_report(self, out):
+        self._write_standard_report(out, self.cmd_file)
 
 
 def create_tool_test_run(contract, timeout):
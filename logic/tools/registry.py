@@ -0,0 +1,91 @@
+import importlib
+import importlib.metadata
+import importlib.util
+import os
+import sys
+from threading import Lock
+from typing import Any, Dict, Tuple
+
+from logic.orm import Tool, Contract
+from toolbox import test_bed_path
+
+"""
+    Summary
+    -------
+    Resolves the adapter of a tool, i.e. the module whose "create_tool_test_run(contract, timeout)" function returns
+    the <ToolTestRun> of the tool.
+    The adapter is the module at <Tool.script>. Scripts inside the testbed are imported as modules of the testbed,
+    other scripts from their path. If the script does not exist, the adapter is the entry point of the group
+    <entry_point_group> named like the tool, which is either a module or a "create_tool_test_run" function itself.
+    Adapters are imported on their first use, so that a process only imports the adapters of the tools it runs.
+"""
+
+entry_point_group = 'testbed.tools'
+
+# (tool name, script) -> the loaded module or function
+_adapters: Dict[Tuple[str, str], Any] = {}
+_checked_profiles = set()
+_lock = Lock()
+
+
+def create_tool_test_run(tool: Tool, contract: Contract, timeout):
+    """Returns the test-run of the tool for the contract. Imports the adapter of the tool on first use.
+
+    Raises
+    ------
+    LookupError
+        If the tool has no adapter.
+    """
+    adapter = get_adapter(tool)
+    tool_test_run = getattr(adapter, 'create_tool_test_run', adapter)(contract, timeout)
+    _check_profile(tool, tool_test_run)
+    return tool_test_run
+
+
+def get_adapter(tool: Tool) -> Any:
+    """Returns the module or function creating the test-runs of the tool."""
+    key = (tool.name, tool.script)
+    with _lock:
+        adapter = _adapters.get(key)
+        if adapter is None:
+            adapter = _adapters[key] = _load(tool)
+    return adapter
+
+
+def _load(tool: Tool) -> Any:
+    script = os.path.abspath(os.path.join(test_bed_path, tool.script)) if tool.script else None
+    if script and os.path.isfile(script):
+        relative_path = os.path.relpath(script, test_bed_path)
+        if not relative_path.startswith('..'):
+            # the same module object as the one imported by the testbed itself
+            return importlib.import_module(os.path.splitext(relative_path)[0].replace(os.sep, '.'))
+        module_name = f'testbed_adapter_{tool.name}'
+        spec = importlib.util.spec_from_file_location(module_name, script)
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[module_name] = module
+        spec.loader.exec_module(module)
+        return module
+    for entry_point in _get_entry_points():
+        if entry_point.name == tool.name:
+            return entry_point.load()
+    raise LookupError(f'The tool {tool.name} has neither the script {tool.script} nor an entry point in the group '
+                      f'"{entry_point_group}".')
+
+
+def _get_entry_points():
+    entry_points = importlib.metadata.entry_points()
+    if hasattr(entry_points, 'select'):
+        return entry_points.select(group=entry_point_group)
+    return entry_points.get(entry_point_group, [])
+
+
+def _check_profile(tool: Tool, tool_test_run):
+    """Warns once per tool if the modes declared by the adapter differ from those stored in the database."""
+    if tool.name in _checked_profiles:
+        return
+    _checked_profiles.add(tool.name)
+    profile = tool_test_run.resource_profile
+    for mode in ('bytecode_compatible', 'analyses_whole_file'):
+        if bool(getattr(profile, mode)) != bool(getattr(tool, mode)):
+            print(f'The adapter of {tool.name} declares {mode}={getattr(profile, mode)}, but the tool has been '
+                  f'installed with {mode}={bool(getattr(tool, mode))}.')
@@ -1,13 +1,15 @@
 import os
-import subprocess
+import shlex
 import tempfile
-from typing import List
+from datetime import timedelta
 
-from logic.orm import Contract, Error, SecurityIssue
-from logic.tools.tool_test_run import ToolTestRun
+from logic.orm import Contract
+from logic.tools.tool_test_run import ToolTestRun, ResourceProfile
 
 
 class Securify2(ToolTestRun):
+    docker_image = 'securify'
+    resource_profile = ResourceProfile(memory_mb=2048, typical_duration=timedelta(minutes=3))
 
     def __init__(self, contract: Contract, timeout):
         super().__init__(contract, 'securify2', timeout)
@@ -20,29 +22,17 @@ class Securify2(ToolTestRun):
         os.remove(self.cmd_file)
 
     def _execute_tool(self):
-        with open(self.cmd_file, 'w', encoding='utf-8') as f:
-            solc_mount = ''
-            solc_command = ''
-            contract_name = ''
-            if self._contract.is_solidity_contract:
-                solc_mount = f'-v "{self.used_solc}":/home/solc-version'
-                solc_command = f'--solidity /home/solc-version/solc'
-                contract_name = self._contract.name
-            command = f'sudo docker run --rm  {solc_mount} ' \
-                      f'-v "{self._contract.dir_path}":/share securify /share/"{self._contract.filename}" --include-contracts {contract_name} {solc_command}'
-            subprocess.run(command, stdout=f, stderr=subprocess.STDOUT, shell=True,
-                           timeout=self.timeout)
-
-    def identify_errors(self) -> List[Error]:
-        with open(self.cmd_file, encoding='utf-8') as f:
-            return self.match_errors(f.read())
-
-    def identify_security_issues(self) -> List[SecurityIssue]:
-        with open(self.cmd_file, encoding='utf-8') as f:
-            return self.match_security_issues(f.read())
-
-    def create_report(self) -> str:
-        return self._create_standard_report(self.cmd_file)
+        solc_dir = None
+        tool_cmd = '{docker_contract_path}'
+        if self._contract.is_solidity_contract:
+            solc_dir = self.used_solc
+            tool_cmd += f' --include-contracts {shlex.quote(self._contract.name)} --solidity {{docker_solc_dir}}/solc'
+        # the image passes the command to its entrypoint
+        command = self.create_docker_cmd(self.docker_image, tool_cmd, solc_dir=solc_dir, add_solc_to_path=False)
+        self.run_cmd(command, self.cmd_file)
+
+    def write_report(self, out):
+        self._write_standard_report(out, self.cmd_file)
 
 
 def create_tool_test_run(contract, timeout):
@@ -1,13 +1,14 @@
 import os
-import subprocess
 import tempfile
-from typing import List
+from datetime import timedelta
 
-from logic.orm import Contract, Error, SecurityIssue
-from logic.tools.tool_test_run import ToolTestRun
+from logic.orm import Contract
+from logic.tools.tool_test_run import ToolTestRun, ResourceProfile
 
 
 class SmartCheck(ToolTestRun):
+    docker_image = 'smartcheck'
+    resource_profile = ResourceProfile(memory_mb=1024, typical_duration=timedelta(seconds=30))
 
     def __init__(self, contract: Contract, timeout):
         super().__init__(contract, 'smartcheck', timeout)
@@ -18,21 +19,11 @@ class SmartCheck(ToolTestRun):
         os.remove(self.cmd_file)
 
     def _execute_tool(self):
-        with open(self.cmd_file, 'w', encoding='utf-8') as f:
-            subprocess.run(f'sudo docker run --rm -v "{self._contract.dir_path}:'
-                           f'/root/test-contract" smartcheck smartcheck -p /root/test-contract/{self._contract.filename}',
-                           shell=True, stdout=f, stderr=subprocess.STDOUT, timeout=self.timeout)
+        command = self.create_docker_cmd(self.docker_image, 'smartcheck -p {docker_contract_path}')
+        self.run_cmd(command, self.cmd_file)
 
-    def identify_errors(self) -> List[Error]:
-        with open(self.cmd_file, encoding='utf-8') as f:
-            return self.match_errors(f.read())
-
-    def identify_security_issues(self) -> List[SecurityIssue]:
-        with open(self.cmd_file, encoding='utf-8') as f:
-            return self.match_security_issues(f.read())
-
-    def create_report(self) -> str:
-        return self._create_standard_report(self.cmd_file)
+    def write_report(self, out):
+        self._write_standard_report(out, self.cmd_file)
 
 
 def create_tool_test_run(contract, timeout):
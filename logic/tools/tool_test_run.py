@@ -1,43 +1,101 @@
+import gzip
+import shlex
+import shutil
 import subprocess
 import tempfile
 import traceback
+from bisect import bisect_right
 from abc import ABC
+from concurrent.futures import Future, CancelledError
 from datetime import datetime, timedelta
-from threading import Thread
-from typing import List, Union
+from threading import Lock, Thread
+from typing import List, Union, Optional, Dict, Tuple, Callable, TextIO
 
 import os
-import re
 import semver
-from sqlalchemy.orm import subqueryload
 
 import toolbox
-from logic.orm import Contract, Tool, SolidityContract, SecurityIssue, Error, get_db_session, ToolError, \
-    ToolSecurityIssue
-from toolbox import get_range_for_installed_solcs
+from logic import catalog, container_pool, containers, matcher, output_capture, result_cache
+from logic.orm import Contract, Tool, SolidityContract, SecurityIssue, Error, get_db_session, Evaluation, \
+    get_or_create_error, remove_db_session
+from logic.engine import get_engine, run_process, run_processes
+from logic.scheduler import Job, get_scheduler
+from toolbox import get_installed_solcs
 from toolbox import test_bed_path
 
 solc_versions_dir = f'{test_bed_path}/resources/solc-versions'
+docker_cmd_prefix = ['sudo', 'docker']
+
+
+class ResourceProfile:
+    """The resources a tool is expected to use and the modes it supports. Declared by the adapters of the tools.
+
+    Parameters
+    ----------
+    cpus : int, default=1
+        The number of CPU cores the tool keeps busy.
+    memory_mb : int, default=0
+        The memory the tool typically uses in MB. 0 if unknown.
+    typical_duration : timedelta, optional
+        The typical execution time of the tool. None if unknown.
+    bytecode_compatible : bool, default=False
+        Whether the tool can test bytecode contracts. See <Tool.bytecode_compatible>.
+    analyses_whole_file : bool, default=False
+        Whether the tool analyses all contracts of a solidity file at once. See <Tool.analyses_whole_file>.
+    """
+
+    def __init__(self, cpus=1, memory_mb=0, typical_duration: Optional[timedelta] = None, bytecode_compatible=False,
+                 analyses_whole_file=False):
+        self.cpus = cpus
+        self.memory_mb = memory_mb
+        self.typical_duration = typical_duration
+        self.bytecode_compatible = bytecode_compatible
+        self.analyses_whole_file = analyses_whole_file
+
+    def __str__(self):
+        return f'ResourceProfile(cpus={self.cpus}, memory_mb={self.memory_mb}, ' \
+               f'typical_duration={self.typical_duration})'
 
 
 class ToolTestRun(ABC):
     separator = '####################################################\n'
     separator2 = '---------------------------------------------------\n'
+    # the docker image of the tool. Test-runs of subclasses without an image are not cached.
+    docker_image: str = None
+    # whether the security issues are identified in the output of the commands run with <run_cmd> or <run_cmds>.
+    # The output is then classified while the tool runs.
+    output_contains_security_issues = True
+    # the resources the scheduler reserves for the tool
+    resource_profile = ResourceProfile()
 
     def __init__(self, contract: Contract, tool_name, timeout):
         self._contract: Union[Contract, SolidityContract] = contract
-        sess = get_db_session()
-        self._tool: Tool = sess.query(Tool).options(
-            subqueryload(Tool.tool_errors).subqueryload(ToolError.error)).options(
-            subqueryload(Tool.tool_security_issues).subqueryload(ToolSecurityIssue.security_issue)).filter(
-            Tool.name == tool_name).one()
+        snapshot = catalog.get()
+        self._tool: Tool = snapshot.get_tool(tool_name)
         self._status = 'Before Run'
         self._exceptions = set()
+        self._matcher = snapshot.get_matcher(tool_name)
         self.__errors: List[Error] = list()
         self.__security_issues: List[SecurityIssue] = list()
+        self.__identified = False
+        # output file -> the matcher classifying the output while the tool runs
+        self._stream_matchers: Dict[str, matcher.StreamMatcher] = {}
+        self._progress_callbacks: List[Callable[[], None]] = []
         self._execution_time: timedelta = None
         self.__report_file = None
-        self._thread: Thread = None
+        self._job: Job = None
+        self._future: Future = Future()
+        self._start_callbacks: List[Callable[[], None]] = []
+        self._leases: List[container_pool.Lease] = []
+        # the names of the containers started by the running command
+        self._containers: List[str] = []
+        self._cancelled = False
+        self._executed = False
+        self._cache_key: Optional[Dict[str, str]] = None
+        self._cancel_lock = Lock()
+        self._process_future: Optional[Future] = None
+        # the ID of the test-run the containers of the tool are labelled with
+        self.run_id: Optional[str] = None
         self.timeout = timeout
 
     def __del__(self):
@@ -48,16 +106,86 @@ class ToolTestRun(ABC):
         return f'ToolTestRun({self._contract},{self._tool})'
 
     def run(self):
+        """Submits the test-run to the scheduler. The tool starts as soon as an execution slot is free.
+
+        A result in the result cache is restored right away instead, without waiting for an execution slot.
+        """
         if self._status != 'Before Run':
             raise PermissionError(f'Can only run {self} once.')
+        self._status = 'Queued'
+        try:
+            self._cache_key = result_cache.get_key(self)
+            if self._cache_key and self.__restore_from_cache(self._cache_key):
+                self.__on_start()
+                self.__terminate()
+                return
+        except Exception as e:
+            self.__fail(e)
+            return
+        profile = self.resource_profile
+        self._job = Job(self.__run_job, name=str(self), on_start=self.__on_start, cpus=profile.cpus,
+                        memory_mb=profile.memory_mb,
+                        duration=profile.typical_duration.total_seconds() if profile.typical_duration else None,
+                        on_cancel=self.__run_job)
+        get_scheduler().submit(self._job)
+
+    def __run_job(self):
+        try:
+            self.__run()
+        finally:
+            # the worker thread runs other jobs afterwards
+            remove_db_session()
+
+    def __on_start(self):
+        self._status = 'Running'
         print(f'start {self._tool}')
-        self._thread = Thread(target=self.__run, name='Thread-me-1')
-        self._thread.start()
+        for callback in self._start_callbacks:
+            try:
+                callback()
+            except Exception as e:
+                print(f'Callback {callback} failed for {self._tool}: {e}')
+
+    def add_start_callback(self, callback: Callable[[], None]):
+        """Calls <callback()> when the tool gets an execution slot. Must be called before <run>."""
+        self._start_callbacks.append(callback)
+
+    def add_progress_callback(self, callback: Callable[[], None]):
+        """Calls <callback()> whenever the output of the running tool reveals new security issues.
+
+        The callback is called on the thread of the engine and must return quickly. Must be called before <run>.
+        """
+        self._progress_callbacks.append(callback)
+
+    def cancel(self):
+        """Stops the tool. A queued tool does not start and the containers of a running tool are killed.
+
+        The test-run terminates with the error "testbed cancelled". Returns at once.
+        """
+        with self._cancel_lock:
+            if self._cancelled or self.get_terminated():
+                return
+            self._cancelled = True
+            process_future = self._process_future
+            leases = list(self._leases)
+        if self._status == 'Queued' and get_scheduler().cancel(self._job):
+            # the scheduler terminates the test-run on its own thread, see <Job.on_cancel>
+            return
+        if process_future:
+            process_future.cancel()
+        if leases:
+            # stopping <docker exec> does not stop the job inside the pooled container
+            Thread(target=lambda: [lease.kill() for lease in leases], name='testbed-lease-killer', daemon=True).start()
+
+    def get_cancelled(self) -> bool:
+        return self._cancelled
 
     def __run(self):
         try:
             start = datetime.now()
             try:
+                if self._cancelled:
+                    raise CancelledError()
+                self._executed = True
                 self._execute_tool()
             except subprocess.TimeoutExpired:
                 try:
@@ -66,11 +194,60 @@ class ToolTestRun(ABC):
                     print(e.with_traceback())
                 tool_timeout = sess.query(Error).filter(Error.title == 'testbed timeout').one()
                 self._exceptions |= {tool_timeout}
+            except CancelledError:
+                self._exceptions |= {get_or_create_error('testbed cancelled', 'The test-run has been cancelled.')}
+            finally:
+                # an adapter may have failed between leasing a container and running the command
+                self.__release_leases()
             self._execution_time = datetime.now() - start
-            self._status = 'Terminated'
-            print(f'terminated {self._tool}')
+            if self._cache_key:
+                self.__store_in_cache(self._cache_key)
+            self.__terminate()
         except Exception as e:
-            print(f'{self._tool}: {e}\n\n{traceback.print_exc()}')
+            self.__fail(e)
+
+    def __terminate(self):
+        self._status = 'Terminated'
+        print(f'terminated {self._tool}')
+        self._future.set_result(self)
+
+    def __fail(self, e: Exception):
+        print(f'{self._tool}: {e}\n\n{traceback.print_exc()}')
+        self._status = 'Failed'
+        self._future.set_exception(e)
+
+    def __restore_from_cache(self, cache_key: Dict[str, str]) -> bool:
+        evaluation = result_cache.lookup(cache_key)
+        if not evaluation or not self._restore_output_files(evaluation):
+            return False
+        self._execution_time = timedelta(seconds=evaluation.execution_time)
+        self.__security_issues = sorted(evaluation.security_issues, key=lambda s: s.title)
+        self.__errors = sorted(evaluation.errors, key=lambda e: e.title)
+        self.__identified = True
+        print(f'restored {self._tool} from the result cache')
+        return True
+
+    def __store_in_cache(self, cache_key: Dict[str, str]):
+        self.__identify()
+        # test-runs which timed out or lack output files must be repeated
+        if self._exceptions:
+            return
+        result_cache.store(cache_key, self._get_output_files(), self.__security_issues, self.__errors,
+                           self._execution_time, contract_path=self._contract.path)
+
+    def _get_output_files(self) -> Dict[str, Optional[str]]:
+        """Returns the paths to the raw output files of the tool, each with a name unique within the tool.
+
+        The files are stored in the result cache. The default implementation returns the attribute <cmd_file>.
+        """
+        return {'cmd': getattr(self, 'cmd_file', None)}
+
+    def _restore_output_files(self, evaluation: Evaluation) -> bool:
+        """Copies the output files of a cached test-run to the paths returned by <_get_output_files>."""
+        for name, path in self._get_output_files().items():
+            if path and not result_cache.restore(evaluation, name, path):
+                return False
+        return True
 
     # abstract method
     def _execute_tool(self):
@@ -78,29 +255,81 @@ class ToolTestRun(ABC):
 
     def get_errors(self) -> List[Error]:
         self._check_terminated()
-        if not self.__errors:
-            self.__errors = self.identify_errors()
+        self.__identify()
         return self.__errors
 
     def get_security_issues(self) -> List[SecurityIssue]:
         self._check_terminated()
-        if not self.__security_issues:
-            self.__security_issues = self.identify_security_issues()
-        return self.identify_security_issues()
+        self.__identify()
+        return self.__security_issues
+
+    def __identify(self):
+        if not self.__identified:
+            testbed_errors = {exception for exception in self._exceptions if isinstance(exception, Error)}
+            if not self._executed and self._cancelled:
+                self.__security_issues, self.__errors = [], sorted(testbed_errors, key=lambda e: e.title)
+            else:
+                self.__security_issues, errors = self.identify_security_issues_and_errors()
+                self.__errors = sorted(set(errors) | testbed_errors, key=lambda e: e.title)
+            self.__identified = True
 
     def get_report(self):
+        """Returns the path to the report of the test-run in a temporary file. The report is written once."""
         self._check_terminated()
         if not self.__report_file:
-            report = self.create_report()
-            _, report_file = tempfile.mkstemp('.txt')
-            with open(report_file, 'w', encoding='utf-8') as f:
-                f.write(report.replace('\n', '\r\n'))
+            fd, report_file = tempfile.mkstemp('.txt')
+            os.close(fd)
+            self.save_report(report_file)
             self.__report_file = report_file
         return self.__report_file
 
+    def save_report(self, path: str, compress=False):
+        """Writes the report of the test-run to <path>, gzip-compressed if <compress>.
+
+        The report is written as a stream, without holding the output of the tool in memory.
+        """
+        self._check_terminated()
+        with (gzip.open if compress else open)(path, 'wt', encoding='utf-8', newline='\r\n') as f:
+            self.write_report(f)
+
+    def get_partial_security_issues(self) -> List[SecurityIssue]:
+        """Returns the security issues found in the output of the tool so far.
+
+        Once the tool has terminated, these are its security issues. Tools whose output does not contain security
+        issues find none before they terminate.
+        """
+        if self.get_terminated():
+            return self.get_security_issues()
+        if not self.output_contains_security_issues:
+            return []
+        titles = set()
+        for stream_matcher in list(self._stream_matchers.values()):
+            titles |= stream_matcher.get_matches()[0]
+        return self.__to_security_issues(titles)
+
     def get_terminated(self):
         return self._status == 'Terminated'
 
+    def get_status(self) -> str:
+        """Returns one of "Before Run", "Queued", "Running", "Terminated" or "Failed".
+
+        A test-run has failed if it has raised an unexpected exception, see <get_future>.
+        """
+        return self._status
+
+    def get_future(self) -> Future:
+        """Returns a future which is resolved with this test-run as soon as the tool has terminated.
+
+        If the test-run fails unexpectedly, the future holds the raised exception instead.
+        """
+        return self._future
+
+    def get_queue_position(self) -> Optional[int]:
+        """Returns the number of jobs ahead of this test-run in the scheduler's queue or None if it is not queued."""
+        if self._status != 'Queued':
+            return None
+        return get_scheduler().get_position(self._job)
+
     def get_execution_time(self) -> timedelta:
         self._check_terminated()
         return self._execution_time
@@ -110,38 +339,91 @@ class ToolTestRun(ABC):
             raise RuntimeError('Tool has not terminated yet.')
 
     # abstract method
-    def create_report(self) -> str:
+    def write_report(self, out: TextIO):
+        """Writes a detailed report of the test-run to <out>."""
         pass
 
-    # abstract method
+    def identify_security_issues_and_errors(self) -> Tuple[List[SecurityIssue], List[Error]]:
+        """Identifies the security issues and errors in the output of the tool.
+
+        The default implementation uses the classification of the attribute <cmd_file> while the tool ran or scans
+        the file once for both. Subclasses whose findings are spread over several files override this method.
+        """
+        streamed = self._get_streamed_matches([self.cmd_file])
+        if streamed is not None:
+            return streamed
+        with open(self.cmd_file, encoding='utf-8', errors='replace') as f:
+            return self.match_output(f.read())
+
+    def _get_streamed_matches(self, output_files: List[str]) -> Optional[Tuple[List[SecurityIssue], List[Error]]]:
+        """Returns the security issues and errors found in the files while the tool wrote them.
+
+        Returns None if any of the files has not been classified completely, e.g. because it was restored from the
+        result cache.
+        """
+        stream_matchers = [self._stream_matchers.get(output_file) for output_file in output_files]
+        if not all(stream_matcher and stream_matcher.closed for stream_matcher in stream_matchers):
+            return None
+        issue_titles, error_titles = set(), set()
+        for stream_matcher in stream_matchers:
+            issues, errors = stream_matcher.get_matches()
+            issue_titles |= issues
+            error_titles |= errors
+        return self.__to_security_issues(issue_titles), self.__to_errors(error_titles)
+
     def identify_security_issues(self) -> List[SecurityIssue]:
-        pass
+        return self.identify_security_issues_and_errors()[0]
+
+    def identify_security_issues_per_contract(self, contract_names: List[str]) -> Dict[str, List[SecurityIssue]]:
+        """Attributes the security issues found in a whole file to its contracts.
+
+        The default implementation splits the output in <cmd_file> at the lines naming "<file>.sol:<contract>". If the
+        output names none of the contracts, every contract gets all security issues.
+
+        Raises
+        ------
+        ValueError
+            If the tool has tested bytecode, which belongs to a single contract, and there are several contracts.
+        """
+        self._check_terminated()
+        if not self._contract.is_solidity_contract and len(contract_names) > 1:
+            raise ValueError(f'{self._tool.name} has tested the bytecode of a single contract, its findings cannot be '
+                             f'attributed to the contracts {", ".join(contract_names)}.')
+        with open(self.cmd_file, encoding='utf-8', errors='replace') as f:
+            sections = matcher.split_output_by_contract(f.read(), contract_names)
+        if not sections:
+            return {name: self.get_security_issues() for name in contract_names}
+        return {name: self.match_security_issues(sections.get(name, '')) for name in contract_names}
 
-    # abstract method
     def identify_errors(self) -> List[Error]:
-        pass
+        return self.identify_security_issues_and_errors()[1]
 
-    def _create_standard_report(self, cmd_file, findings_file=None) -> str:
-        report = self.create_standard_report_intro() + '\n' \
-                                                       f'The Command-Line Output of the Tool-Execution'
+    def _write_standard_report(self, out: TextIO, cmd_file, findings_file=None):
+        out.write(self.create_standard_report_intro() + '\n' f'The Command-Line Output of the Tool-Execution')
         if not findings_file:
-            report += ' including the Tool\'s Findings'
-        report += ':\n' + ToolTestRun.separator2
-        with open(cmd_file, encoding='utf-8') as f:
-            report += f.read()
-        report += ToolTestRun.separator
+            out.write(' including the Tool\'s Findings')
+        out.write(':\n' + ToolTestRun.separator2)
+        self._copy_output(cmd_file, out)
+        out.write(ToolTestRun.separator)
         if findings_file:
-            report += f'\n{ToolTestRun.separator}' + \
-                      f'The Output File of the Tool:\n' + \
-                      ToolTestRun.separator2
+            out.write(f'\n{ToolTestRun.separator}' +
+                      f'The Output File of the Tool:\n' +
+                      ToolTestRun.separator2)
             if os.path.exists(findings_file):
-                with open(findings_file, encoding='utf-8') as f:
-                    report += f.read()
+                self._copy_output(findings_file, out)
             else:
-                report += f'Could not find the findings file of the tool.'
-            report += f'\n{ToolTestRun.separator}'
-        report += self.create_standard_security_issues_report()
-        return report
+                out.write(f'Could not find the findings file of the tool.')
+            out.write(f'\n{ToolTestRun.separator}')
+        out.write(self.create_standard_security_issues_report())
+
+    @staticmethod
+    def _copy_output(output_file: str, out: TextIO):
+        """Copies an output file of the tool to the report chunk by chunk."""
+        if not os.path.isfile(output_file):
+            out.write('The tool has not written this output.\n')
+            return
+        with open(output_file, encoding='utf-8', errors='replace') as f:
+            shutil.copyfileobj(f, out, 1024 ** 2)
 
     def create_standard_report_intro(self) -> str:
         used_solc = None
@@ -202,64 +484,196 @@ class ToolTestRun(ABC):
         if type(self._contract) == Contract:
             raise ValueError(f'{self._contract} must be a SolidityContract to call this method.')
 
-        min_version, max_version = get_range_for_installed_solcs(self._contract.solc_from, self._contract.solc_to)
+        candidates = get_installed_solcs(self._contract.solc_from, self._contract.solc_to)
         if self._tool.solc_version:
-            if min_version < self._tool.solc_version < max_version:
-                version = self._tool.solc_version
-            elif semver.VersionInfo.parse(self._tool.solc_version) < min_version:
-                version = min_version
-            else:
-                version = max_version
+            # the installed compiler closest to the preferred version of the tool, preferring older ones
+            preferred_version = semver.VersionInfo.parse(self._tool.solc_version)
+            version = candidates[max(0, bisect_right(candidates, preferred_version) - 1)]
         else:
-            version = max_version
+            version = candidates[-1]
         return f'{solc_versions_dir}/{version}'
 
+    def match_output(self, text) -> Tuple[List[SecurityIssue], List[Error]]:
+        """Returns the security issues and errors whose identifiers match the text. Scans the text once for both."""
+        issue_titles, error_titles = self._matcher.match(text)
+        return self.__to_security_issues(issue_titles), self.__to_errors(error_titles)
+
     def match_security_issues(self, text) -> List[SecurityIssue]:
-        matches = set()
-        for tool_security_issue in self._tool.tool_security_issues:
-            if re.search(tool_security_issue.identifier, text):
-                matches |= {tool_security_issue.security_issue}
-        return sorted(matches, key=lambda s: s.title)
+        return self.__to_security_issues(self._matcher.match(text, errors=False)[0])
 
     def get_exceptions(self):
         self._check_terminated()
         return self._exceptions
 
     def match_errors(self, text) -> List[Error]:
-        matches = set()
-        for tool_error in self._tool.tool_errors:
-            if tool_error.identifier and re.search(tool_error.identifier, text):
-                matches |= {tool_error.error}
-                if not tool_error.error:
-                    print(f'ToolError: {tool_error}, Error: {tool_error.error}')
+        return self.__to_errors(self._matcher.match(text, security_issues=False)[1])
+
+    def __to_security_issues(self, titles) -> List[SecurityIssue]:
+        matches = {tool_security_issue.security_issue for tool_security_issue in self._tool.tool_security_issues
+                   if tool_security_issue.security_issue_title in titles}
+        return sorted(matches, key=lambda s: s.title)
+
+    def __to_errors(self, titles) -> List[Error]:
+        matches = {tool_error.error for tool_error in self._tool.tool_errors if tool_error.error_title in titles}
         return sorted(matches, key=lambda e: e.title)
 
     def create_docker_cmd(self, docker_image, tool_cmd: str, docker_opts=None, output_dir=None, solc_dir=None,
-                          working_dir_to_output_dir=False):
+                          working_dir_to_output_dir=False, add_solc_to_path=True) -> List[str]:
+        """Creates the arguments of a <docker run> command testing the contract.
+
+        If a container pool is configured for the tool and one of its containers is idle, a <docker exec> command
+        for that container is created instead. The command must then be run with <run_cmd> or <run_cmds>, which
+        return the container to the pool.
+
+        Parameters
+        ----------
+        docker_image : str
+        tool_cmd : str
+            The command executed inside the container. "{docker_contract_path}" is replaced by the quoted path to the
+            contract inside the container and "{docker_solc_dir}" by the directory of the compiler inside the
+            container. The command is split like a shell would split it.
+        docker_opts : List[str], optional
+            Further options of <docker run>.
+        output_dir : str, optional
+            A directory on the host mounted to "/testbed/output".
+        solc_dir : str, optional
+            The directory of a solidity compiler mounted to "/root/solc-version".
+        working_dir_to_output_dir : bool, default=False
+            Whether the mounted output directory becomes the working directory of the container.
+        add_solc_to_path : bool, default=True
+            Whether <tool_cmd> is wrapped in "bash -c" which prepends the mounted compiler to the PATH.
+            Must be False for images which pass the command to their entrypoint.
+        """
         if docker_opts is None:
             docker_opts = []
+        if working_dir_to_output_dir and not output_dir:
+            raise ValueError('output_dir must be provided when using working_dir_to_output_dir=True')
+        mount_solc = self._contract.is_solidity_contract and solc_dir
+
+        pool = container_pool.get_pool(self._tool.name, docker_image)
+        exec_opts, run_opts = container_pool.split_docker_opts(docker_opts)
+        lease = pool.try_acquire(run_opts, self.run_id) if pool else None
+        if lease:
+            self._leases.append(lease)
+            docker_contract_path = lease.add_contract(self._contract.path)
+            docker_solc_dir = lease.add_solc_dir(solc_dir) if mount_solc else None
+            docker_output_dir = lease.add_output_dir(output_dir) if output_dir else None
+            args = docker_cmd_prefix + ['exec'] + exec_opts
+            if working_dir_to_output_dir:
+                args += ['-w', docker_output_dir]
+            args += [lease.container] + lease.pool.entrypoint
+        else:
+            docker_contract_dir = '/testbed/contract'
+            docker_contract_path = f'{docker_contract_dir}/{self._contract.filename}'
+            docker_solc_dir = '/root/solc-version'
+            docker_output_dir = '/testbed/output'
+            container = containers.create_name()
+            self._containers.append(container)
+            args = docker_cmd_prefix + ['run', '--rm', '--name', container] + containers.get_label_opts(self.run_id) \
+                + docker_opts
+            if working_dir_to_output_dir:
+                args += ['-w', docker_output_dir]
+            if mount_solc:
+                args += ['-v', f'{solc_dir}:{docker_solc_dir}']
+            args += ['-v', f'{self._contract.dir_path}:{docker_contract_dir}']
+            if output_dir:
+                args += ['-v', f'{output_dir}:{docker_output_dir}']
+            args += [docker_image]
+
+        tool_cmd = tool_cmd.format(docker_contract_path=shlex.quote(docker_contract_path),
+                                   docker_solc_dir=docker_solc_dir, output_dir=output_dir)
+        if mount_solc and add_solc_to_path:
+            args += ['bash', '-c', f'PATH={docker_solc_dir}:$PATH;{tool_cmd}']
+        else:
+            args += shlex.split(tool_cmd)
+        return args
+
+    def run_cmd(self, args: List[str], output_file: str):
+        """Runs the command with the engine and writes its stdout and stderr to <output_file>.
+
+        The output is classified while it is written, see <get_partial_security_issues>.
 
-        docker_contract_dir = '/testbed/contract'
-        mount_contract = f'-v "{self._contract.dir_path}":{docker_contract_dir}'
-
-        docker_solc_dir = '/root/solc-version'
-        mount_solc = ''
-        if self._contract.is_solidity_contract and solc_dir:
-            mount_solc = f'-v "{solc_dir}":"{docker_solc_dir}"'
-
-        docker_output_dir = '/testbed/output'
-        mount_output = ''
-        if output_dir:
-            mount_output = f'-v "{output_dir}":"{docker_output_dir}"'
-
-        working_dir = ''
-        if working_dir_to_output_dir:
-            if not mount_output:
-                raise ValueError('output_dir must be provided when using working_dir_to_output_dir=True')
-            working_dir = f'-w {docker_output_dir}'
-        tool_cmd = tool_cmd.format(docker_contract_path=f'{docker_contract_dir}/{self._contract.filename}',
-                                   output_dir=output_dir)
-        if mount_solc:
-            tool_cmd = f'bash -c "PATH={docker_solc_dir}:\$PATH;{tool_cmd}"'
-        return f'sudo docker run --rm {" ".join(docker_opts)} {working_dir} {mount_solc} {mount_contract} {mount_output}' \
-               f' {docker_image} {tool_cmd}'
+        Raises
+        ------
+        subprocess.TimeoutExpired
+            If the command did not terminate within <self.timeout> secs.
+        """
+        stream_matcher = self.__create_stream_matcher(output_file)
+        try:
+            with output_capture.CappedOutput(output_file, self.__get_max_output_size()) as f:
+                self.__run_with_leases(lambda: self.__run_cancellable(run_process(
+                    args, stdout=f, timeout=self.timeout,
+                    on_output=lambda chunk: self.__on_output(stream_matcher, chunk))))
+        finally:
+            stream_matcher.close()
+
+    def run_cmds(self, commands: List[Tuple[List[str], str]]):
+        """Runs the commands at the same time and writes the output of every command to its file.
+
+        The commands share one deadline of <self.timeout> secs.
+
+        Raises
+        ------
+        subprocess.TimeoutExpired
+            If the commands did not terminate in time. Every command still running has been killed.
+        """
+        stream_matchers = [self.__create_stream_matcher(output_file) for _, output_file in commands]
+        files = [output_capture.CappedOutput(output_file, self.__get_max_output_size()) for _, output_file in commands]
+        try:
+            self.__run_with_leases(lambda: self.__run_cancellable(run_processes(
+                [(args, f) for (args, _), f in zip(commands, files)], timeout=self.timeout,
+                on_output=lambda index, chunk: self.__on_output(stream_matchers[index], chunk))))
+        finally:
+            for f, stream_matcher in zip(files, stream_matchers):
+                f.close()
+                stream_matcher.close()
+
+    def __get_max_output_size(self) -> int:
+        if self._tool.max_output_size is not None:
+            return self._tool.max_output_size
+        return output_capture.default_max_size
+
+    def __create_stream_matcher(self, output_file: str) -> matcher.StreamMatcher:
+        stream_matcher = matcher.StreamMatcher(self._matcher)
+        self._stream_matchers[output_file] = stream_matcher
+        return stream_matcher
+
+    def __on_output(self, stream_matcher: matcher.StreamMatcher, chunk: bytes):
+        new_issues, _ = stream_matcher.feed(chunk)
+        if not new_issues or not self.output_contains_security_issues:
+            return
+        for callback in self._progress_callbacks:
+            try:
+                callback()
+            except Exception as e:
+                print(f'Callback {callback} failed for {self._tool}: {e}')
+
+    def __run_cancellable(self, coroutine):
+        """Runs the coroutine of the engine. Raises <CancelledError> if the test-run has been cancelled."""
+        with self._cancel_lock:
+            if self._cancelled:
+                coroutine.close()
+                raise CancelledError()
+            self._process_future = get_engine().submit(coroutine)
+        try:
+            return self._process_future.result()
+        finally:
+            with self._cancel_lock:
+                self._process_future = None
+
+    def __release_leases(self, failed=False):
+        leases, self._leases = self._leases, []
+        for lease in leases:
+            lease.release(failed)
+
+    def __run_with_leases(self, run):
+        failed = True
+        try:
+            run()
+            failed = False
+        finally:
+            self.__release_leases(failed)
+            started_containers, self._containers = self._containers, []
+            if failed:
+                # killing the docker client has left the containers running
+                containers.kill(started_containers)
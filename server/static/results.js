@@ -0,0 +1,99 @@
+let cells = null;
+
+function subscribeToStatus(eventsUrl, statusUrl, version, done, imagesUrl) {
+    cells = {};
+    const elements = document.querySelectorAll('td[data-table]');
+    for (let i = 0; i < elements.length; i++) {
+        const dataset = elements[i].dataset;
+        cells[cellKey(dataset.table, dataset.row, dataset.tool)] = elements[i];
+    }
+    if (done) {
+        return;
+    }
+    if (window.EventSource) {
+        const source = new EventSource(eventsUrl + '?since=' + version);
+        source.onmessage = function (event) {
+            const update = JSON.parse(event.data);
+            applyChanges(update.changes, imagesUrl);
+            document.getElementById('status').textContent = update.status;
+        };
+        source.addEventListener('done', function (event) {
+            document.getElementById('status').textContent = JSON.parse(event.data).status;
+            finish();
+            source.close();
+        });
+    } else {
+        pollStatus(statusUrl, version, imagesUrl);
+    }
+}
+
+function pollStatus(statusUrl, version, imagesUrl) {
+    const request = new XMLHttpRequest();
+    request.open('GET', statusUrl + '?since=' + version + '&wait=25');
+    request.onload = function () {
+        if (request.status !== 200) {
+            return;
+        }
+        const update = JSON.parse(request.responseText);
+        applyChanges(update.changes, imagesUrl);
+        document.getElementById('status').textContent = update.status;
+        if (!update.done) {
+            pollStatus(statusUrl, update.version, imagesUrl);
+        } else {
+            finish();
+        }
+    };
+    request.onerror = function () {
+        setTimeout(function () { pollStatus(statusUrl, version, imagesUrl); }, 5000);
+    };
+    request.send();
+}
+
+function finish() {
+    document.getElementById('archive').hidden = false;
+    document.getElementById('cancel').hidden = true;
+}
+
+function cancelTestRun(cancelUrl) {
+    const request = new XMLHttpRequest();
+    request.open('POST', cancelUrl);
+    request.onload = function () {
+        if (request.status === 200) {
+            document.getElementById('cancel').disabled = true;
+            document.getElementById('status').textContent = JSON.parse(request.responseText).status;
+        }
+    };
+    request.send();
+}
+
+function applyChanges(changes, imagesUrl) {
+    for (const change of changes) {
+        if (change.table === 'tools') {
+            applyToolChange(change);
+            continue;
+        }
+        const cell = cells[cellKey(change.table, change.row, change.tool)];
+        if (!cell) {
+            continue;
+        }
+        cell.querySelector('.tooltiptext').textContent = change.value;
+        const image = cell.querySelector('img');
+        image.src = imagesUrl + change.value + '.svg';
+        image.alt = change.value;
+    }
+}
+
+function applyToolChange(change) {
+    const cell = cells[cellKey('tools', 'execution_time', change.tool)];
+    if (change.row === 'execution_time') {
+        cell.textContent = Math.round(change.value / 60) + 'm ' + Math.round(change.value % 60) + 's';
+    } else if (change.value === 'Terminated') {
+        cells[cellKey('tools', 'report', change.tool)].querySelector('a').hidden = false;
+    } else {
+        cell.textContent = change.value.toLowerCase();
+    }
+}
+
+function cellKey(table, row, tool) {
+    return table + '\n' + row + '\n' + tool;
+}
@@ -1,16 +1,18 @@
 # from fpdf import FPDF
+import atexit
+import gzip
 import json
 import shutil
-import threading
-import time
 from datetime import datetime, timedelta
 from typing import Dict
 
-from flask import Flask, render_template, request, session, abort, send_file
-from sqlalchemy.orm import subqueryload
+from flask import Flask, render_template, request, session, abort, send_file, jsonify, Response
 
 import logic.orm as db
+from logic import catalog, container_pool, containers, result_cache
 from logic.orm import *
+from logic.run_store import RunStore, OverloadError
+from logic.scheduler import configure as configure_scheduler
 from logic.test_runner import TestRun
 
 """
@@ -24,48 +26,33 @@ app.config['SECRET_KEY'] = ',s@e@.5X5#T2[#kKbv%a[E2kj6e4,fUm'
 app.config['SESSION_COOKIE_HTTPONLY'] = False
 
 
-class OverloadError(Exception):
-    pass
-
-
 with open(f'{test_bed_path}/server/config.json', encoding='utf-8') as f:
     server_config = json.loads(f.read())
 
 
-class TestRunsManager:
-    """
-        Manages all running TestRun instances.
-        @raises
-            OverloadError: Raised if there are more than <allowed_active_test_runs> TestRun instances running.
-    """
-    def __init__(self, allowed_active_test_runs=10):
-        self.lock = threading.Lock()
-        self.test_runs: Dict[float, TestRun] = {}
-        self.allowed_active_test_runs = allowed_active_test_runs
-
-    def put(self, test_run: TestRun):
-        with self.lock:
-            active_test_runs = 0
-            for id in self.test_runs:
-                if self.test_runs[id].get_status() != 'Terminated':
-                    active_test_runs += 1
-                id_datetime = datetime.fromtimestamp(id)
-                if datetime.now() - id_datetime > timedelta(days=1):
-                    test_run = self.test_runs.pop(id, None)
-                    contract_path = test_run._contract.dir_path
-                    shutil.rmtree(contract_path, ignore_errors=True)
-            if active_test_runs > self.allowed_active_test_runs:
-                raise OverloadError
-            timestamp = time.time()
-            self.test_runs[timestamp] = test_run
-        return timestamp
-
-    def get(self, timestamp) -> TestRun:
-        return self.test_runs[timestamp]
-
-
-test_runs_manager = TestRunsManager(server_config['allowed_active_test_runs'])
+configure_scheduler(server_config.get('execution_slots') or os.cpu_count() or 1,
+                    server_config.get('execution_memory_mb'))
+result_cache.configure(enable=server_config.get('result_cache', True))
+container_pool.configure(server_config.get('container_pools', {}))
+atexit.register(container_pool.shutdown)
+app.config['USE_X_SENDFILE'] = server_config.get('x_sendfile', False)
+abandon_after = server_config.get('abandon_after')
+run_store = RunStore(server_config['allowed_active_test_runs'],
+                     compress_reports=server_config.get('compress_reports', True),
+                     abandon_after=timedelta(seconds=abandon_after) if abandon_after else None)
+run_store.recover()
+run_store.sweep()
+run_store.start_sweeper()
+# the containers of test-runs interrupted by a stop of the server are still running
+containers.start_reaper()
 timeout = server_config['timeout']
+# the maximal number of secs. a request for status changes waits for them
+max_wait = 25
+
+
+@app.teardown_appcontext
+def remove_session(exception=None):
+    db.remove_db_session()
 
 
 @app.route('/')
@@ -78,8 +65,7 @@ def upload():
         See description above.
 
     """
-    get_db_session()
-    tools = db.get_tools()
+    tools = catalog.get().get_tools()
     bytecode_incompatible_tool_names = [tool.name for tool in filter(lambda t: not t.bytecode_compatible, tools)]
     return render_template('upload.html', tools=tools,
                            bytecode_incompatible_tool_names=bytecode_incompatible_tool_names,
@@ -98,53 +84,184 @@ def results():
 
     """
     if 'id' in session:
-        timestamp = session['id']
         try:
-            test_run = test_runs_manager.get(timestamp)
+            test_run = run_store.get(session['id'])
         except KeyError:
             raise abort(404, 'ID not found. Maybe your session is expired.')
     else:
-        sess = get_db_session()
-        tools = sess.query(Tool).options(subqueryload(Tool.tool_errors).subqueryload(ToolError.error)). \
-            options(subqueryload(Tool.tool_security_issues).subqueryload(ToolSecurityIssue.security_issue)).filter(
-            Tool.name.in_(request.form.keys())).order_by(Tool.name).all()
+        tools = catalog.get().get_tools(request.form.keys())
 
         contract_name = None
         if 'contract_name' in request.form and request.form['contract_name']:
             contract_name = request.form['contract_name']
         file = request.files['file']
         contract_extension = file.filename[file.filename.rfind('.'):]
-        tmd_dir = tempfile.mkdtemp()
-        contract_path = f'{tmd_dir}/{file.filename}'
+        run_id, workspace = run_store.create_workspace()
+        contract_path = f'{workspace}/{os.path.basename(file.filename)}'
         file.save(contract_path)
         if contract_extension in SolidityContract.file_extensions:
             contract = SolidityContract(contract_path, name=contract_name)
         else:
             contract = Contract(contract_path)
 
-        test_run = TestRun(contract, tools, timeout)
+        test_run = TestRun(contract, tools, timeout, server_config.get('compile_once', False), run_id=run_id)
         try:
-            id = test_runs_manager.put(test_run)
-            session['id'] = id
+            run_store.put(run_id, workspace, test_run)
+            session['id'] = run_id
         except OverloadError:
+            shutil.rmtree(workspace, ignore_errors=True)
             abort(503)
         test_run.run()
     return render_template('results.html', test_run=test_run)
 
 
-@app.route('/results/<tool_name>')
-def get_result_file(tool_name):
+def get_session_test_run() -> TestRun:
     if 'id' not in session:
         raise abort(404, 'ID not in session')
     try:
-        test_run = test_runs_manager.get(session['id'])
+        return run_store.get(session['id'])
     except KeyError:
         abort(404, 'Invalid session ID')
+
+
+@app.route('/status')
+def get_status():
+    """Returns the statuses of the test-run of the session as JSON.
+
+    Without the parameter <since>, all statuses are returned together with their version. Otherwise, only the changes
+    after the version <since> are returned. If there are none yet, the request waits up to <wait> secs. for them.
+    """
+    test_run = get_session_test_run()
+    since = request.args.get('since', type=int)
+    if since is None:
+        return jsonify(create_status_json(test_run))
+    changes = test_run.get_changes(since, timeout=min(request.args.get('wait', 0, type=float), max_wait))
+    run_store.touch(session['id'])
+    return jsonify(version=changes[-1]['version'] if changes else since, status=test_run.get_status(),
+                   done=test_run.done(), changes=changes)
+
+
+@app.route('/status/events')
+def get_status_events():
+    """Streams the changes of the statuses of the test-run of the session as server-sent events.
+
+    Every event carries the changes recorded since the previous one. Reconnecting clients resume after the version
+    given by the header <Last-Event-ID> or the parameter <since>. The stream ends with a "done" event.
+    """
+    test_run = get_session_test_run()
+    since = request.headers.get('Last-Event-ID', type=int)
+    if since is None:
+        since = request.args.get('since', 0, type=int)
+
+    run_id = session['id']
+
+    def stream(since):
+        yield 'retry: 5000\n\n'
+        while True:
+            changes = test_run.get_changes(since, timeout=max_wait)
+            # a connected client keeps the test-run from being abandoned
+            run_store.touch(run_id)
+            if changes:
+                since = changes[-1]['version']
+                yield f'id: {since}\ndata: {json.dumps(dict(status=test_run.get_status(), changes=changes))}\n\n'
+            elif test_run.done():
+                yield f'event: done\ndata: {json.dumps(dict(status=test_run.get_status()))}\n\n'
+                return
+            else:
+                yield ': keep-alive\n\n'
+
+    return Response(stream(since), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@app.route('/cancel', methods=('POST',))
+def cancel():
+    """Cancels the test-run of the session. Its tools which have not finished yet terminate with an error."""
+    get_session_test_run()
+    run_store.cancel(session['id'])
+    return jsonify(status='Cancelling')
+
+
+def create_status_json(test_run: TestRun) -> Dict:
+    # read the version first: changes recorded meanwhile are contained in the statuses and sent again, which is harmless
+    version = test_run.get_version()
+    tools = {}
+    for tool in test_run._tools:
+        tool_test_run = test_run.get_tool_test_run(tool)
+        tools[tool.name] = {'status': tool_test_run.get_status()}
+        if tool_test_run.get_terminated():
+            tools[tool.name]['execution_time'] = tool_test_run.get_execution_time().total_seconds()
+        elif tool_test_run.get_status() == 'Queued':
+            tools[tool.name]['queue_position'] = tool_test_run.get_queue_position() or 0
+    return {
+        'version': version,
+        'status': test_run.get_status(),
+        'done': test_run.done(),
+        'tools': tools,
+        'security_issues': [{'title': issue.title, 'statuses': {tool.name: status for tool, status in statuses.items()}}
+                            for issue, statuses in test_run.get_security_issues_statuses().items()],
+        'errors': [{'title': error.title, 'statuses': {tool.name: status for tool, status in statuses.items()}}
+                   for error, statuses in test_run.get_errors_statuses().items()],
+    }
+
+
+@app.route('/results/<tool_name>')
+def get_result_file(tool_name):
+    """Sends the report of the tool stored in the workspace of the test-run. Supports conditional and range requests."""
+    test_run = get_session_test_run()
     tool = get_tools([tool_name])[0]
-    tool_test_run = test_run.get_tool_test_run(tool)
-    return send_file(tool_test_run.get_report(), as_attachment=True,
-                     attachment_filename=f'{test_run._contract.name}_{tool.name}_{datetime.now().strftime("%d.%m.%Y %H-%M-%S")}.txt',
-                     )
+    report = run_store.get_report_file(session['id'], tool.name)
+    if report is None:
+        # the report is stored right after the tool has terminated
+        tool_test_run = test_run.get_tool_test_run(tool)
+        if not tool_test_run.get_terminated():
+            abort(404, 'The tool has not terminated yet.')
+        report = tool_test_run.get_report()
+    return send_report(report, f'{get_download_name(test_run)}_{tool.name}_'
+                               f'{datetime.now().strftime("%d.%m.%Y %H-%M-%S")}.txt')
+
+
+@app.route('/archive')
+def get_result_archive():
+    """Sends a zip archive of the reports of all tools of the finished test-run."""
+    test_run = get_session_test_run()
+    try:
+        archive = run_store.get_archive(session['id'])
+    except KeyError:
+        abort(404, 'Invalid session ID')
+    except RuntimeError:
+        abort(409, 'The test-run is still running.')
+    return send_file(archive, mimetype='application/zip', as_attachment=True, conditional=True,
+                     attachment_filename=f'{get_download_name(test_run)}_reports.zip')
+
+
+def get_download_name(test_run: TestRun) -> str:
+    """Returns the name of the contract or, for bytecode contracts, the name of its file without the extension."""
+    return getattr(test_run._contract, 'name', None) or os.path.splitext(test_run._contract.filename)[0]
+
+
+def send_report(path: str, attachment_filename: str) -> Response:
+    """Sends the report as text.
+
+    Compressed reports are sent as they are stored with "Content-Encoding: gzip" to clients accepting it and
+    decompressed on the fly for the others. Uncompressed and compressed reports sent as they are stored support
+    conditional and range requests.
+    """
+    if path.endswith('.gz') and 'gzip' not in request.accept_encodings:
+        def stream():
+            with gzip.open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(64 * 1024), b''):
+                    yield chunk
+
+        return Response(stream(), mimetype='text/plain',
+                        headers={'Content-Disposition': f'attachment; filename="{attachment_filename}"',
+                                 'Vary': 'Accept-Encoding'})
+    response = send_file(path, mimetype='text/plain', as_attachment=True, attachment_filename=attachment_filename,
+                         conditional=True)
+    if path.endswith('.gz'):
+        response.headers['Content-Encoding'] = 'gzip'
+        response.vary.add('Accept-Encoding')
+    return response
 
 
 if __name__ == '__main__':
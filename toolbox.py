@@ -1,6 +1,8 @@
 import os
+from bisect import bisect_left, bisect_right
 from datetime import timedelta
-from typing import Union, Tuple
+from threading import Lock
+from typing import Union, Tuple, List
 
 import semver
 
@@ -16,10 +18,52 @@ test_contracts_rel_path = 'resources/tests/contracts'
 server = False
 test_mode = False
 
-def get_range_for_installed_solcs(min_version: Union[semver.VersionInfo, str],
-                                  max_version: Union[semver.VersionInfo, str]) -> Tuple[
-    semver.VersionInfo, semver.VersionInfo]:
-    """finds the minimal and maximal installed solidity compiler version between min_version and max_version
+class SolcIndex:
+    """a sorted index of the installed solidity compilers
+
+    The index is read once and read again only when the modification time of the directory changes, i.e. when a
+    compiler is installed or removed.
+
+    Parameters
+    ----------
+    solc_versions_dir : str
+        The directory containing one directory per compiler, named by its version.
+    """
+
+    def __init__(self, solc_versions_dir: str):
+        self.solc_versions_dir = solc_versions_dir
+        self._versions: List[semver.VersionInfo] = []
+        self._mtime = None
+        self._lock = Lock()
+
+    def get_versions(self) -> List[semver.VersionInfo]:
+        """returns the versions of the installed compilers in ascending order"""
+        mtime = os.stat(self.solc_versions_dir).st_mtime_ns
+        with self._lock:
+            if mtime != self._mtime:
+                versions = []
+                for entry in os.listdir(self.solc_versions_dir):
+                    try:
+                        versions.append(semver.VersionInfo.parse(entry))
+                    except ValueError:
+                        pass
+                self._versions = sorted(versions)
+                self._mtime = mtime
+            return self._versions
+
+    def get_candidates(self, min_version: semver.VersionInfo,
+                       max_version: semver.VersionInfo) -> List[semver.VersionInfo]:
+        """returns the versions of the installed compilers between min_version and max_version in ascending order"""
+        versions = self.get_versions()
+        return versions[bisect_left(versions, min_version):bisect_right(versions, max_version)]
+
+
+solc_index = SolcIndex(f'{test_bed_path}/resources/solc-versions')
+
+
+def get_installed_solcs(min_version: Union[semver.VersionInfo, str],
+                        max_version: Union[semver.VersionInfo, str]) -> List[semver.VersionInfo]:
+    """finds all installed solidity compiler versions between min_version and max_version
 
     Parameters
     ----------
@@ -28,7 +72,8 @@ def get_range_for_installed_solcs(min_version: Union[semver.VersionInfo, str],
 
     Returns
     -------
-    Tuple[semver.VersionInfo, semver.VersionInfo]
+    List[semver.VersionInfo]
+        The candidates in ascending order.
 
     Raises
     -------
@@ -41,17 +86,37 @@ def get_range_for_installed_solcs(min_version: Union[semver.VersionInfo, str],
     if type(max_version) == str:
         max_version = semver.VersionInfo.parse(max_version)
 
-    versions = [semver.VersionInfo.parse(v) for v in os.listdir('{}/resources/solc-versions'.format(test_bed_path))]
-    min_installed_version = min(versions)
-    max_installed_version = max(versions)
-    try:
-        new_min_version = min(filter(lambda v: min_version <= v, versions))
-        new_max_version = max(filter(lambda v: v <= max_version, versions))
-    except ValueError:
+    candidates = solc_index.get_candidates(min_version, max_version)
+    if not candidates:
+        versions = solc_index.get_versions()
         raise NotImplementedError(
             'There is no installed version >={} and <={}. The minimal (maximal) installed version is {} ({})'.format(
-                min_version, max_version, min_installed_version, max_installed_version))
-    return new_min_version, new_max_version
+                min_version, max_version, versions[0] if versions else None, versions[-1] if versions else None))
+    return candidates
+
+
+def get_range_for_installed_solcs(min_version: Union[semver.VersionInfo, str],
+                                  max_version: Union[semver.VersionInfo, str]) -> Tuple[
+    semver.VersionInfo, semver.VersionInfo]:
+    """finds the minimal and maximal installed solidity compiler version between min_version and max_version
+
+    Parameters
+    ----------
+    min_version : semver.VersionInfo or str
+    max_version : semver.VersionInfo or str
+
+    Returns
+    -------
+    Tuple[semver.VersionInfo, semver.VersionInfo]
+
+    Raises
+    -------
+    NotImplementedError
+        If there are no installed solidity compilers between min_version and max_version
+
+    """
+    candidates = get_installed_solcs(min_version, max_version)
+    return candidates[0], candidates[-1]
 
 
 def timedelta_to_string(td: timedelta):